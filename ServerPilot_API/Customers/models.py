@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, transaction
 from ServerPilot_API.Users.models import CustomUser  # Assuming CustomUser remains in API.Users.models
 
 
@@ -27,3 +27,20 @@ class Customer(models.Model):
 
     def __str__(self):
         return f'{self.first_name} {self.last_name} (Owner: {self.owner.username})'
+
+    def save(self, *args, **kwargs):
+        from ServerPilot_API.Servers.models import bump_compliance_matrix_version
+
+        # Compliance matrices are cached per owner: moving a customer moves its servers.
+        owner_changed = bool(self.pk) and Customer.objects.filter(pk=self.pk).exclude(owner_id=self.owner_id).exists()
+        super().save(*args, **kwargs)
+        if owner_changed:
+            transaction.on_commit(bump_compliance_matrix_version)
+
+    def delete(self, *args, **kwargs):
+        from ServerPilot_API.Servers.models import bump_compliance_matrix_version
+
+        # Cascades to the customer's servers without calling Server.delete.
+        result = super().delete(*args, **kwargs)
+        transaction.on_commit(bump_compliance_matrix_version)
+        return result
@@ -0,0 +1,107 @@
+"""
+Fleet-wide compliance matrix: the latest status of every risk on every server.
+
+The matrix is built from each server's latest completed scan with one query for
+the scans (DISTINCT ON where the database supports it, a correlated subquery
+otherwise) and one for the findings that may be open at those scans; the latter
+are matched against each server's latest scan in Python. The result is cached
+under a version that is bumped whenever a scan completes, a finding or risk
+changes, or a server or customer is changed (see bump_compliance_matrix_version).
+
+Encoding: `servers` and `risks` are the row and column headers; `rows[i]` is a
+string with one character per risk, where each character is an index into `codes`.
+"""
+from typing import Dict, List
+
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import OuterRef, Q, Subquery
+
+from ServerPilot_API.Servers.findings import decode_bitmap
+from ServerPilot_API.Servers.models import (
+    COMPLIANCE_MATRIX_VERSION_KEY,
+    SecurityRecommendation,
+    SecurityScan,
+)
+from ServerPilot_API.security.models import SecurityRisk
+
+COMPLIANCE_MATRIX_CACHE_TIMEOUT = 300  # seconds
+
+# Position in this list is the status code used in the encoded rows.
+STATUS_CODES = ['unknown', 'passed', 'pending', 'acknowledged', 'in_progress', 'fixed', 'resolved', 'ignored']
+_CODE_BY_STATUS = {name: str(i) for i, name in enumerate(STATUS_CODES)}
+UNKNOWN_CODE = _CODE_BY_STATUS['unknown']
+
+
+def latest_completed_scans(servers) -> List[tuple]:
+    """Return (scan_id, server_id, passed_checks) of each server's latest completed scan."""
+    scans = SecurityScan.objects.filter(server__in=servers, status='completed')
+    if connection.features.can_distinct_on_fields:
+        return list(
+            scans.order_by('server_id', '-id').distinct('server_id')
+            .values_list('id', 'server_id', 'passed_checks')
+        )
+    latest = (
+        SecurityScan.objects.filter(server_id=OuterRef('server_id'), status='completed')
+        .order_by('-id').values('id')[:1]
+    )
+    return list(scans.filter(id=Subquery(latest)).values_list('id', 'server_id', 'passed_checks'))
+
+
+def build_compliance_matrix(servers) -> Dict:
+    """Build the encoded server x risk matrix for a queryset of servers."""
+    servers = list(servers.order_by('id').values('id', 'server_name'))
+    risks = list(SecurityRisk.objects.filter(is_enabled=True).order_by('id').values('id', 'title', 'risk_level'))
+    server_index = {server['id']: i for i, server in enumerate(servers)}
+    risk_index = {risk['id']: j for j, risk in enumerate(risks)}
+    grid = [[UNKNOWN_CODE] * len(risks) for _ in servers]
+    scan_ids = [None] * len(servers)
+
+    scans = latest_completed_scans([server['id'] for server in servers])
+    for scan_id, server_id, passed_checks in scans:
+        row = server_index[server_id]
+        scan_ids[row] = scan_id
+        for risk_id in decode_bitmap(passed_checks):
+            if risk_id in risk_index:
+                grid[row][risk_index[risk_id]] = _CODE_BY_STATUS['passed']
+
+    if scans:
+        # Findings open at each server's latest completed scan (see findings.scan_findings).
+        # The query is bounded by the oldest and newest of those scans; the exact
+        # per-server bounds are checked below.
+        latest = {server_id: scan_id for scan_id, server_id, _ in scans}
+        findings = (
+            SecurityRecommendation.objects.filter(
+                scan__server_id__in=latest, risk_id__in=risk_index, scan_id__lte=max(latest.values())
+            )
+            .filter(Q(resolved_in__isnull=True) | Q(resolved_in_id__gt=min(latest.values())))
+            .values_list('scan__server_id', 'scan_id', 'resolved_in_id', 'risk_id', 'risk_found', 'status')
+        )
+        for server_id, scan_id, resolved_in_id, risk_id, risk_found, finding_status in findings:
+            latest_scan = latest[server_id]
+            if scan_id > latest_scan or (resolved_in_id is not None and resolved_in_id <= latest_scan):
+                continue
+            code = _CODE_BY_STATUS.get(finding_status if risk_found else 'passed', _CODE_BY_STATUS['pending'])
+            grid[server_index[server_id]][risk_index[risk_id]] = code
+
+    return {
+        'codes': STATUS_CODES,
+        'servers': [[server['id'], server['server_name']] for server in servers],
+        'risks': [[risk['id'], risk['title'], risk['risk_level']] for risk in risks],
+        'scans': scan_ids,
+        'rows': [''.join(row) for row in grid],
+    }
+
+
+def compliance_matrix(servers, scope: str) -> Dict:
+    """
+    Return the cached matrix for `servers`. `scope` identifies the set of servers
+    (e.g. 'all' for staff or 'user:<id>') and is part of the cache key.
+    """
+    version = cache.get(COMPLIANCE_MATRIX_VERSION_KEY, 0)
+    key = f"servers:compliance-matrix:{version}:{scope}"
+    matrix = cache.get(key)
+    if matrix is None:
+        matrix = build_compliance_matrix(servers)
+        cache.set(key, matrix, COMPLIANCE_MATRIX_CACHE_TIMEOUT)
+    return matrix
@@ -0,0 +1,214 @@
+"""
+Collection of host facts for offline evaluation of security rules.
+
+One SSH command gathers a standard bundle of host state, split into sections:
+
+    sshd_config       effective sshd settings (`sshd -T`, falling back to the config file)
+    sysctl            kernel parameters (`sysctl -a`)
+    sockets           listening TCP/UDP sockets (`ss -tuln`, falling back to netstat)
+    packages          installed packages and versions (dpkg or rpm)
+    ufw               UFW status, default policies and rules
+    file_permissions  mode/owner/group of security relevant files
+
+The parsed bundle is cached in ServerFacts so rules declared on SecurityRisk
+(`fact_rule`) can be re-evaluated on the control plane without reconnecting.
+"""
+import hashlib
+import json
+import logging
+import re
+from typing import Any, Dict, List
+
+from django.utils import timezone
+
+from ServerPilot_API.Servers.models import Server, ServerFacts
+from ServerPilot_API.security.rules import evaluate_risk
+
+logger = logging.getLogger(__name__)
+
+SECTION_MARKER = '@@facts:'
+
+# Files whose permissions are part of the facts bundle.
+PERMISSION_PATHS = [
+    '/etc/passwd',
+    '/etc/shadow',
+    '/etc/group',
+    '/etc/gshadow',
+    '/etc/sudoers',
+    '/etc/ssh/sshd_config',
+    '/etc/crontab',
+    '/etc/issue.net',
+]
+
+FACT_SECTIONS = {
+    'sshd_config': "sshd -T 2>/dev/null || cat /etc/ssh/sshd_config 2>/dev/null",
+    'sysctl': "sysctl -a 2>/dev/null",
+    'sockets': "ss -Htuln 2>/dev/null || netstat -tuln 2>/dev/null",
+    'packages': (
+        "dpkg-query -W -f='${Package} ${Version}\\n' 2>/dev/null"
+        " || rpm -qa --qf '%{NAME} %{VERSION}\\n' 2>/dev/null"
+    ),
+    'ufw': "ufw status verbose 2>/dev/null",
+    'file_permissions': f"stat -c '%n %a %U %G' {' '.join(PERMISSION_PATHS)} 2>/dev/null",
+}
+
+
+def build_collect_command() -> str:
+    """Build the single shell command that prints every facts section."""
+    return '; '.join(
+        f"echo '{SECTION_MARKER}{name}'; {{ {command}; }}" for name, command in FACT_SECTIONS.items()
+    ) + '; true'
+
+
+def split_sections(output: str) -> Dict[str, str]:
+    """Split the collector output into {section_name: raw_text}."""
+    sections, current, lines = {}, None, []
+    for line in output.splitlines():
+        if line.startswith(SECTION_MARKER):
+            if current is not None:
+                sections[current] = '\n'.join(lines)
+            current, lines = line[len(SECTION_MARKER):].strip(), []
+        elif current is not None:
+            lines.append(line)
+    if current is not None:
+        sections[current] = '\n'.join(lines)
+    return sections
+
+
+def parse_sshd_config(text: str) -> Dict[str, str]:
+    """Parse sshd settings; keys are lowercased and, like sshd, the first value wins."""
+    config = {}
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        parts = line.split(None, 1)
+        key = parts[0].lower()
+        if key == 'match':
+            # Settings after a Match block only apply to matching connections.
+            break
+        value = parts[1].strip() if len(parts) > 1 else ''
+        config.setdefault(key, value)
+    return config
+
+
+def parse_sysctl(text: str) -> Dict[str, str]:
+    values = {}
+    for line in text.splitlines():
+        if '=' not in line:
+            continue
+        key, value = line.split('=', 1)
+        values[key.strip()] = value.strip()
+    return values
+
+
+def parse_sockets(text: str) -> List[Dict[str, Any]]:
+    """Parse `ss -Htuln` or `netstat -tuln` output into listening sockets."""
+    sockets = []
+    for line in text.splitlines():
+        parts = line.split()
+        if len(parts) < 5 or not parts[0].startswith(('tcp', 'udp')):
+            continue
+        # netstat: proto recv-q send-q local ...; ss: netid state recv-q send-q local ...
+        local = parts[3] if parts[1].isdigit() else parts[4]
+        address, _, port = local.rpartition(':')
+        if not port.isdigit():
+            continue
+        sockets.append({
+            'proto': parts[0].rstrip('6'),
+            'address': address.strip('[]') or '*',
+            'port': int(port),
+        })
+    return sockets
+
+
+def parse_packages(text: str) -> Dict[str, str]:
+    packages = {}
+    for line in text.splitlines():
+        parts = line.split()
+        if len(parts) >= 2:
+            packages[parts[0]] = parts[1]
+    return packages
+
+
+def parse_ufw_verbose(text: str) -> Dict[str, Any]:
+    """Parse `ufw status verbose`. An empty output means UFW is not installed/usable."""
+    ufw = {'installed': bool(text.strip()), 'status': 'unknown', 'rules': []}
+    in_rules = False
+    for line in text.splitlines():
+        stripped = line.strip()
+        if stripped.lower().startswith('status:'):
+            ufw['status'] = stripped.split(':', 1)[1].strip().lower()
+        elif stripped.lower().startswith('default:'):
+            for policy in stripped.split(':', 1)[1].split(','):
+                match = re.match(r'\s*(\w+)\s+\((\w+)\)', policy)
+                if match:
+                    ufw[f'default_{match.group(2).lower()}'] = match.group(1).lower()
+        elif stripped.startswith('--'):
+            in_rules = True
+        elif in_rules and stripped:
+            ufw['rules'].append(re.sub(r'\s{2,}', '  ', stripped))
+    return ufw
+
+
+def parse_file_permissions(text: str) -> Dict[str, Dict[str, str]]:
+    permissions = {}
+    for line in text.splitlines():
+        parts = line.split()
+        if len(parts) == 4:
+            path, mode, owner, group = parts
+            permissions[path] = {'mode': mode, 'owner': owner, 'group': group}
+    return permissions
+
+
+def parse_facts(output: str) -> Dict[str, Any]:
+    """Parse the collector output into the facts bundle."""
+    sections = split_sections(output)
+    sockets = parse_sockets(sections.get('sockets', ''))
+    return {
+        'sshd_config': parse_sshd_config(sections.get('sshd_config', '')),
+        'sysctl': parse_sysctl(sections.get('sysctl', '')),
+        'sockets': sockets,
+        'listening_ports': sorted({socket['port'] for socket in sockets}),
+        'packages': parse_packages(sections.get('packages', '')),
+        'ufw': parse_ufw_verbose(sections.get('ufw', '')),
+        'file_permissions': parse_file_permissions(sections.get('file_permissions', '')),
+    }
+
+
+def hash_facts(facts: Dict[str, Any]) -> str:
+    return hashlib.sha256(json.dumps(facts, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def collect_facts(server: Server, timeout: int = 60) -> ServerFacts:
+    """
+    Collect the facts bundle from a server in one SSH command and cache it.
+
+    Raises:
+        RuntimeError: If the SSH connection fails.
+    """
+    success, output, exit_status = server.connect_ssh(command=build_collect_command(), timeout=timeout, trusted=True)
+    if not success:
+        raise RuntimeError(f"Failed to collect facts from server {server.id}: {output}")
+
+    facts = parse_facts(output)
+    server_facts, _ = ServerFacts.objects.update_or_create(
+        server=server,
+        defaults={'facts': facts, 'facts_hash': hash_facts(facts), 'collected_at': timezone.now()},
+    )
+    logger.info(f"Collected facts for server {server.id} (hash {server_facts.facts_hash[:12]}).")
+    return server_facts
+
+
+def evaluate_fact_risks(risks, facts: Dict[str, Any]) -> List[tuple]:
+    """
+    Evaluate the fact rules of `risks` against a facts bundle.
+
+    Returns:
+        list of (risk, risk_found, evidence) tuples, as expected by record_scan_findings().
+    """
+    results = []
+    for risk in risks:
+        risk_found, evidence = evaluate_risk(risk, facts)
+        results.append((risk, risk_found, evidence))
+    return results
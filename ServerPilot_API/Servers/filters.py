@@ -0,0 +1,21 @@
+import django_filters
+from .models import SecurityRecommendation
+
+
+class SecurityRecommendationFilter(django_filters.FilterSet):
+    risk_level = django_filters.CharFilter(field_name='risk_level', label='Filter by risk level')
+    status = django_filters.CharFilter(field_name='status', label='Filter by status')
+    risk_found = django_filters.BooleanFilter(field_name='risk_found', label='Only found (true) or passed (false) checks')
+    risk = django_filters.NumberFilter(field_name='risk_id', label='Filter by security risk')
+
+    class Meta:
+        model = SecurityRecommendation
+        fields = ['risk_level', 'status', 'risk_found', 'risk']
+
+    def matches(self, finding):
+        """Apply the validated filters to a serialized finding (e.g. one from the passed-checks bitmap)."""
+        for name, field in (('risk_level', 'risk_level'), ('status', 'status'), ('risk_found', 'risk_found'), ('risk', 'risk')):
+            value = self.form.cleaned_data.get(name)
+            if value not in (None, '') and finding.get(field) != value:
+                return False
+        return True
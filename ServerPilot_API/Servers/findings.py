@@ -0,0 +1,334 @@
+"""
+Compact storage of security scan findings.
+
+A scan finding stores only a reference to the SecurityRisk that produced it, the
+result flag, its status and a hash of the check output. The human readable text
+(title, description, solution) is resolved at read time from the cached risk
+catalog (see SecurityRisk.catalog()). Passed checks can additionally be stored as
+a bitmap on the SecurityScan instead of one row per risk.
+
+Scans are stored as deltas: a finding row is created by the scan that first
+observes it and closed by the scan that no longer does, so the findings of any
+scan (and the difference between two scans) are reconstructed from those
+intervals instead of copying every finding into every scan. A finding's status is
+its current triage state and is not kept per scan (see SecurityRecommendation.status).
+"""
+import hashlib
+from typing import Dict, Iterable, List, Optional
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Q
+
+from ServerPilot_API.Servers.models import SecurityRecommendation, SecurityScan, Server
+
+PASSED_TITLE_PREFIX = 'Check Passed: '
+PASSED_DESCRIPTION = 'This security check passed successfully. No action required.'
+
+
+def passed_checks_as_bitmap() -> bool:
+    """Whether passed checks are stored in SecurityScan.passed_checks instead of rows."""
+    return getattr(settings, 'SECURITY_SCAN_PASSED_BITMAP', True)
+
+
+def hash_output(output: Optional[str]) -> str:
+    """Return the SHA-256 hex digest used to detect changes in a check's output."""
+    return hashlib.sha256((output or '').encode('utf-8', errors='replace')).hexdigest()
+
+
+def encode_bitmap(ids: Iterable[int]) -> bytes:
+    """Encode a set of positive integer ids as a little-endian bitmap."""
+    ids = [i for i in ids if i is not None and i >= 0]
+    if not ids:
+        return b''
+    bitmap = bytearray(max(ids) // 8 + 1)
+    for i in ids:
+        bitmap[i // 8] |= 1 << (i % 8)
+    return bytes(bitmap)
+
+
+def decode_bitmap(data) -> List[int]:
+    """Decode a bitmap produced by encode_bitmap() into a sorted list of ids."""
+    if not data:
+        return []
+    ids = []
+    for byte_index, byte in enumerate(bytes(data)):
+        if not byte:
+            continue
+        for bit in range(8):
+            if byte & (1 << bit):
+                ids.append(byte_index * 8 + bit)
+    return ids
+
+
+def build_finding(scan: SecurityScan, risk, risk_found: bool, output: str) -> SecurityRecommendation:
+    """Build (without saving) a normalised finding row for a risk check result."""
+    return SecurityRecommendation(
+        scan=scan,
+        risk=risk,
+        risk_found=risk_found,
+        output_hash=hash_output(output),
+        # Passed checks are considered low risk/informational
+        risk_level=risk.risk_level if risk_found else 'low',
+        status='pending' if risk_found else 'passed',
+    )
+
+
+def scan_findings(scan: SecurityScan):
+    """
+    Reconstruct the findings of a scan: every finding of the same server first
+    observed at or before this scan and not resolved by it (or by an earlier scan).
+    """
+    return SecurityRecommendation.objects.filter(
+        scan__server_id=scan.server_id, scan_id__lte=scan.id
+    ).filter(Q(resolved_in__isnull=True) | Q(resolved_in_id__gt=scan.id))
+
+
+def record_scan_findings(scan: SecurityScan, results, checked_risk_ids=None) -> Dict[str, list]:
+    """
+    Persist the results of a scan as a delta against the server's open findings.
+
+    - A result matching an open finding (same risk, same outcome) carries it forward;
+      a fixed/resolved finding that is still present is reopened and a changed
+      output hash is recorded in `scan.changes`.
+    - A result that differs from the open finding resolves it and opens a new one.
+    - Open findings whose risk was not checked any more (disabled or removed) are
+      resolved; findings of risks whose check could not run are carried forward.
+
+    Args:
+        scan: The scan the results belong to.
+        results: Iterable of (risk, risk_found, output) tuples.
+        checked_risk_ids: Ids of the risks the scan attempted. Defaults to the risks in `results`.
+
+    Concurrent scans of the same server are serialized on the server row, so each
+    one builds its delta on the findings left by the other.
+
+    Returns:
+        dict with the 'new', 'resolved' and 'changed' findings of this scan.
+    """
+    results = list(results)
+    use_bitmap = passed_checks_as_bitmap()
+    observed = {risk.id: (risk, risk_found, output) for risk, risk_found, output in results}
+    checked = set(checked_risk_ids) if checked_risk_ids is not None else set(observed)
+
+    with transaction.atomic():
+        Server.objects.select_for_update().only('pk').get(pk=scan.server_id)
+        return _record_scan_delta(scan, observed, checked, use_bitmap)
+
+
+def _record_scan_delta(scan: SecurityScan, observed: Dict, checked: set, use_bitmap: bool) -> Dict[str, list]:
+    previous = (
+        SecurityScan.objects.filter(server_id=scan.server_id, status='completed', id__lt=scan.id)
+        .order_by('-id').only('id', 'passed_checks').first()
+    )
+    open_findings = SecurityRecommendation.objects.filter(
+        scan__server_id=scan.server_id, resolved_in__isnull=True
+    ).exclude(scan=scan)
+
+    new_rows, resolved, changed, changes = [], [], [], []
+    seen = set()
+    for finding in open_findings:
+        result = observed.get(finding.risk_id) if finding.risk_id is not None else None
+        if result is None:
+            # Legacy rows and dropped risks are closed; unreachable checks carry over.
+            if finding.risk_id is None or finding.risk_id not in checked:
+                finding.resolved_in = scan
+                resolved.append(finding)
+            continue
+        risk, risk_found, output = result
+        if finding.risk_found != risk_found or finding.risk_id in seen:
+            finding.resolved_in = scan
+            resolved.append(finding)
+            continue
+        seen.add(finding.risk_id)
+        change = {'id': finding.id, 'risk': finding.risk_id}
+        output_hash = hash_output(output)
+        if finding.output_hash != output_hash:
+            change['output_hash'] = [finding.output_hash, output_hash]
+            finding.output_hash = output_hash
+        if risk_found and finding.status in ('fixed', 'resolved'):
+            change['status'] = [finding.status, 'pending']
+            finding.status = 'pending'
+        if len(change) > 2:
+            changed.append(finding)
+            changes.append(change)
+
+    passed_ids = []
+    if previous is not None:
+        # Passed checks that could not be re-run keep their previous result.
+        passed_ids = [i for i in decode_bitmap(previous.passed_checks) if i in checked and i not in observed]
+    for risk_id, (risk, risk_found, output) in observed.items():
+        if risk_id in seen:
+            continue
+        if not risk_found and use_bitmap:
+            passed_ids.append(risk_id)
+            continue
+        new_rows.append(build_finding(scan, risk, risk_found, output))
+
+    created = SecurityRecommendation.objects.bulk_create(new_rows)
+    if resolved:
+        SecurityRecommendation.objects.bulk_update(resolved, ['resolved_in'])
+    if changed:
+        SecurityRecommendation.objects.bulk_update(changed, ['output_hash', 'status'])
+    scan.previous_scan = previous
+    scan.passed_checks = encode_bitmap(passed_ids)
+    scan.changes = changes
+    scan.save(update_fields=['previous_scan', 'passed_checks', 'changes'])
+    return {'new': created, 'resolved': resolved, 'changed': changes}
+
+
+def diff_scans(from_scan: SecurityScan, to_scan: SecurityScan) -> Dict[str, list]:
+    """
+    Compare two scans of the same server using only the stored deltas.
+
+    Returns:
+        dict with:
+          - 'new': findings (risk found) open at `to_scan` but not at `from_scan`
+          - 'resolved': findings open at `from_scan` but not at `to_scan`
+          - 'changed': per finding, the first and last value of each field that
+            changed on scans in between, e.g. {'id': 5, 'risk': 3, 'status': ['fixed', 'pending']}
+    """
+    if from_scan.server_id != to_scan.server_id:
+        raise ValueError("Scans belong to different servers.")
+    older, newer = sorted((from_scan, to_scan), key=lambda s: s.id)
+    base = SecurityRecommendation.objects.filter(scan__server_id=older.server_id, risk_found=True)
+    opened = base.filter(scan_id__gt=older.id, scan_id__lte=newer.id).filter(
+        Q(resolved_in__isnull=True) | Q(resolved_in_id__gt=newer.id)
+    )
+    closed = base.filter(scan_id__lte=older.id, resolved_in_id__gt=older.id, resolved_in_id__lte=newer.id)
+    if from_scan.id > to_scan.id:
+        opened, closed = closed, opened
+
+    merged = {}
+    for changes in (
+        SecurityScan.objects.filter(server_id=older.server_id, id__gt=older.id, id__lte=newer.id)
+        .order_by('id').values_list('changes', flat=True)
+    ):
+        for change in changes or []:
+            entry = merged.setdefault(change['id'], {'id': change['id'], 'risk': change.get('risk')})
+            for field, value in change.items():
+                if field in ('id', 'risk'):
+                    continue
+                before, after = value
+                entry[field] = [entry[field][0], after] if field in entry else [before, after]
+    if from_scan.id > to_scan.id:
+        for entry in merged.values():
+            for field, value in entry.items():
+                if field not in ('id', 'risk'):
+                    entry[field] = [value[1], value[0]]
+    return {'new': list(opened), 'resolved': list(closed), 'changed': list(merged.values())}
+
+
+def summarize_scans(scans: List[SecurityScan]) -> Dict[int, Dict]:
+    """
+    Count the findings of each scan by risk level and status without loading them.
+
+    All scans must belong to the same server. One grouped query over the finding
+    intervals overlapping the scans is folded per scan in Python; passed checks
+    stored in a scan's bitmap are counted as passed, low risk findings.
+
+    Returns:
+        {scan_id: {'total': n, 'by_risk_level': {...}, 'by_status': {...}}}
+    """
+    summaries = {scan.id: {'total': 0, 'by_risk_level': {}, 'by_status': {}} for scan in scans}
+    if not scans:
+        return summaries
+    first, last = min(summaries), max(summaries)
+    groups = (
+        SecurityRecommendation.objects.filter(scan__server_id=scans[0].server_id, scan_id__lte=last)
+        .filter(Q(resolved_in__isnull=True) | Q(resolved_in_id__gt=first))
+        .values_list('scan_id', 'resolved_in_id', 'risk_level', 'status')
+        .annotate(count=Count('id'))
+        .order_by()
+    )
+
+    def add(summary, risk_level, status, count):
+        summary['total'] += count
+        summary['by_risk_level'][risk_level] = summary['by_risk_level'].get(risk_level, 0) + count
+        summary['by_status'][status] = summary['by_status'].get(status, 0) + count
+
+    for scan_id, resolved_in_id, risk_level, status, count in groups:
+        for summary_scan_id, summary in summaries.items():
+            if scan_id <= summary_scan_id and (resolved_in_id is None or resolved_in_id > summary_scan_id):
+                add(summary, risk_level, status, count)
+    for scan in scans:
+        passed = len(decode_bitmap(scan.passed_checks))
+        if passed:
+            add(summaries[scan.id], 'low', 'passed', passed)
+    return summaries
+
+
+def resolve_finding_text(data: Dict, catalog: Dict[int, Dict]) -> Dict:
+    """
+    Fill title/description/solution of a serialized finding from the risk catalog.
+    Rows that carry their own text (legacy rows, deleted risks) are left untouched.
+    """
+    risk_id = data.get('risk')
+    entry = catalog.get(risk_id) if risk_id is not None else None
+    if entry is None or data.get('title'):
+        return data
+    if data.get('risk_found', True):
+        data['title'] = entry['title']
+        data['description'] = entry['description']
+        data['solution'] = entry['solution']
+    else:
+        data['title'] = f"{PASSED_TITLE_PREFIX}{entry['title']}"
+        data['description'] = PASSED_DESCRIPTION
+        data['solution'] = ''
+    return data
+
+
+def passed_findings(scan: SecurityScan, catalog: Dict[int, Dict]) -> List[Dict]:
+    """
+    Expand a scan's passed-checks bitmap into serialized findings so API consumers
+    see the same shape as for stored "Check Passed" rows. Checks of risks deleted
+    since the scan are kept with a placeholder title and no risk, like stored rows
+    whose risk was deleted.
+    """
+    findings = []
+    for risk_id in decode_bitmap(scan.passed_checks):
+        entry = catalog.get(risk_id)
+        title = entry['title'] if entry is not None else f"deleted check #{risk_id}"
+        findings.append({
+            'id': None,
+            'scan': scan.id,
+            'resolved_in': None,
+            'risk': risk_id if entry is not None else None,
+            'risk_found': False,
+            'output_hash': '',
+            'risk_level': 'low',
+            'title': f"{PASSED_TITLE_PREFIX}{title}",
+            'description': PASSED_DESCRIPTION,
+            'solution': '',
+            'command_solution': None,
+            'status': 'passed',
+        })
+    return findings
+
+
+class StoredThenPassedFindings:
+    """
+    Stored findings (a queryset) followed by passed findings expanded from a scan's
+    bitmap, sized and sliced like a queryset so a paginator only loads the stored
+    rows of the requested page and merges passed findings only into the pages they
+    fall on.
+    """
+
+    def __init__(self, stored, passed: List[Dict]):
+        self.stored = stored
+        self.passed = passed
+        self._stored_count = None
+
+    def count(self) -> int:
+        if self._stored_count is None:
+            self._stored_count = self.stored.count()
+        return self._stored_count + len(self.passed)
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index: slice) -> list:
+        start, stop = index.start or 0, index.stop if index.stop is not None else self.count()
+        stored_count = self.count() - len(self.passed)
+        items = list(self.stored[start:min(stop, stored_count)]) if start < stored_count else []
+        return items + self.passed[max(start - stored_count, 0):max(stop - stored_count, 0)]
@@ -0,0 +1,473 @@
+"""
+Declarative management of UFW rules.
+
+The live rule set is read from `ufw status numbered`, compared with a desired rule
+set and reconciled with the smallest list of `ufw` commands, all executed over one
+SSH session. New rules are added before obsolete ones are deleted (so access is
+never removed before its replacement exists), and deletions are made by rule
+specification rather than by number so earlier steps cannot shift them. If a step
+fails, the steps already applied are undone in reverse order.
+
+A rule is a dict with the keys 'action', 'port', 'protocol' and 'source'.
+
+FirewallRule rows mirror the host state: a sync records each rule's current ufw
+number and whether it drifted (missing on the host, or added on the host outside
+ServerPilot), so rule listings are served from the database.
+"""
+import ipaddress
+import logging
+import re
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import timedelta
+from typing import Dict, List
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from ServerPilot_API.Servers.models import (
+    FirewallPolicyRollout,
+    FirewallPolicyRolloutTarget,
+    FirewallRule,
+    Server,
+    ServerCredential,
+)
+
+logger = logging.getLogger(__name__)
+
+UFW_ACTIONS = ('allow', 'deny', 'reject', 'limit')
+UFW_PROTOCOLS = ('tcp', 'udp')
+ANY_SOURCE = ('', 'any', 'anywhere', '0.0.0.0/0', '::/0')
+
+_RULE_LINE = re.compile(r'\s*\[\s*(\d+)\]\s+(.*?)\s+(ALLOW|DENY|REJECT|LIMIT)\s+IN\s+(.*)')
+_NUMERIC_PORT = r'^(\d{1,5}([:-]\d{1,5})?)(,\d{1,5}([:-]\d{1,5})?)*$'
+_PORT = re.compile(_NUMERIC_PORT + r'|^[A-Za-z][\w-]*$')
+
+
+class FirewallRuleError(ValueError):
+    """Raised when a desired firewall rule is invalid."""
+
+
+def parse_ufw_numbered(output: str) -> List[Dict]:
+    """
+    Parse `ufw status numbered` into rules with their current number.
+    IPv6 duplicates created by ufw for the same rule are flagged with 'v6'.
+    """
+    rules = []
+    lines = output.strip().split('\n')
+    try:
+        # Find the line that separates header from rules (e.g., '----')
+        rules_start_index = next(i for i, line in enumerate(lines) if '----' in line) + 1
+    except StopIteration:
+        return rules
+
+    for line in lines[rules_start_index:]:
+        match = _RULE_LINE.match(line)
+        if not match:
+            continue
+        number, port_protocol_str, action, source = match.groups()
+        v6 = '(v6)' in port_protocol_str or '(v6)' in source
+        port_protocol_str = port_protocol_str.replace('(v6)', '').strip()
+        source = source.replace('(v6)', '').strip()
+
+        # Split port and protocol, handling cases where protocol might be missing
+        parts = port_protocol_str.split('/')
+        rules.append({
+            'number': int(number),
+            'port': parts[0],
+            'protocol': parts[1] if len(parts) > 1 else None,
+            'action': action,
+            'source': source,
+            'v6': v6,
+        })
+    return rules
+
+
+def is_managed_rule(rule: Dict) -> bool:
+    """
+    Whether a rule parsed from the host can be reconciled by ServerPilot.
+    Portless rules (listed with 'Anywhere' as port, e.g. `ufw allow from 10.0.0.5`)
+    and app profiles (e.g. 'OpenSSH') have no numeric port and are left untouched.
+    """
+    return bool(re.match(_NUMERIC_PORT, str(rule.get('port') or '')))
+
+
+def normalize_rule(rule: Dict) -> Dict:
+    """
+    Validate a rule and return it in canonical form: lowercase action and protocol,
+    ':' port ranges, and None for "any" protocol or source.
+
+    Raises:
+        FirewallRuleError: If a field is invalid.
+    """
+    action = str(rule.get('action') or 'allow').strip().lower()
+    if action == 'block':
+        # FirewallRule uses 'block' for UFW's 'deny'.
+        action = 'deny'
+    if action not in UFW_ACTIONS:
+        raise FirewallRuleError(f"Invalid action {rule.get('action')!r}.")
+
+    port = str(rule.get('port') or '').strip().replace('-', ':')
+    if not port or not _PORT.match(port):
+        raise FirewallRuleError(f"Invalid port {rule.get('port')!r}.")
+
+    protocol = (rule.get('protocol') or '').strip().lower() or None
+    if protocol in ('any', 'all') or (protocol and protocol.startswith('custom')):
+        protocol = None
+    if protocol is not None and protocol not in UFW_PROTOCOLS:
+        raise FirewallRuleError(f"Invalid protocol {rule.get('protocol')!r}.")
+    if protocol is None and (':' in port or ',' in port):
+        raise FirewallRuleError("Port ranges and lists require a protocol.")
+
+    source = (rule.get('source') or rule.get('source_ip') or '').strip()
+    if source.lower() in ANY_SOURCE:
+        source = None
+    else:
+        try:
+            source = str(ipaddress.ip_network(source, strict=False))
+        except ValueError:
+            raise FirewallRuleError(f"Invalid source {source!r}.")
+    return {'action': action, 'port': port, 'protocol': protocol, 'source': source}
+
+
+def rule_key(rule: Dict) -> tuple:
+    rule = normalize_rule(rule)
+    return rule['action'], rule['port'], rule['protocol'], rule['source']
+
+
+def rule_spec(rule: Dict) -> str:
+    """The ufw rule specification, e.g. 'allow from 10.0.0.0/8 to any port 22 proto tcp'."""
+    rule = normalize_rule(rule)
+    if rule['source']:
+        spec = f"{rule['action']} from {rule['source']} to any port {rule['port']}"
+        if rule['protocol']:
+            spec += f" proto {rule['protocol']}"
+    else:
+        spec = f"{rule['action']} {rule['port']}"
+        if rule['protocol']:
+            spec += f"/{rule['protocol']}"
+    return spec
+
+
+def build_rule_command(action, port, protocol=None, source=None) -> str:
+    """The command adding a rule, e.g. 'sudo ufw allow 22/tcp'."""
+    return f"sudo ufw {rule_spec({'action': action, 'port': port, 'protocol': protocol, 'source': source})}"
+
+
+def build_delete_command(rule: Dict) -> str:
+    """The command deleting a rule by its specification (and its IPv6 twin)."""
+    return f"sudo ufw --force delete {rule_spec(rule)}"
+
+
+def allows_port(rule: Dict, port: int) -> bool:
+    """Whether a normalised rule lets TCP traffic to `port` in (from any or some source)."""
+    if rule['action'] not in ('allow', 'limit') or rule['protocol'] not in (None, 'tcp'):
+        return False
+    for part in (rule['port'] or '').split(','):
+        low, _, high = part.partition(':')
+        if low.isdigit() and int(low) <= port <= int(high or low):
+            return True
+    return False
+
+
+def plan_firewall_changes(current: List[Dict], desired: List[Dict]) -> Dict[str, List[Dict]]:
+    """
+    Compute the minimal change set turning `current` into `desired`.
+
+    Returns:
+        {'add': [...], 'delete': [...]} of normalised rules; rules present in both
+        (ignoring rule numbers and IPv6 duplicates) and unmanaged rules (see
+        is_managed_rule) are left alone.
+    """
+    current_by_key = {}
+    for rule in current:
+        if not is_managed_rule(rule):
+            logger.debug(f"Ignoring unmanaged ufw rule: {rule}")
+            continue
+        try:
+            current_by_key.setdefault(rule_key(rule), normalize_rule(rule))
+        except FirewallRuleError:
+            # Rules ufw reports but we cannot express are left untouched as well.
+            logger.debug(f"Ignoring unmanaged ufw rule: {rule}")
+    desired_by_key = {}
+    for rule in desired:
+        desired_by_key.setdefault(rule_key(rule), normalize_rule(rule))
+    return {
+        'add': [rule for key, rule in desired_by_key.items() if key not in current_by_key],
+        'delete': [rule for key, rule in current_by_key.items() if key not in desired_by_key],
+    }
+
+
+def read_ufw_rules(session) -> List[Dict]:
+    """
+    Read the live rules over an open SSH session.
+
+    Raises:
+        RuntimeError: If `ufw status numbered` fails.
+    """
+    success, output, exit_status = session.run('sudo ufw status numbered')
+    if not success or exit_status != 0:
+        raise RuntimeError(f"Failed to read UFW rules: {output}")
+    return parse_ufw_numbered(output)
+
+
+def row_rule(row: FirewallRule) -> Dict:
+    """The rule stored in a FirewallRule row, in the format used by this module."""
+    return {'action': row.action, 'port': row.port, 'protocol': row.protocol, 'source': row.source_ip}
+
+
+def record_ufw_rules(server: Server, live_rules: List[Dict], authoritative: bool = False) -> Dict[str, int]:
+    """
+    Reconcile the server's FirewallRule rows with rules parsed from the host.
+
+    Rows matching a live rule get its number and are marked in sync; rows without
+    one are marked 'missing_on_host'. Live rules without a row are imported, as
+    'new_on_host' unless this is the server's first sync.
+
+    With `authoritative`, used right after ServerPilot itself changed the rules,
+    the host state is the intended one: rows without a live rule are deleted and
+    imported rules are in sync.
+
+    Returns:
+        counts of rows per drift state.
+    """
+    now = timezone.now()
+    live = {}
+    # IPv4 rules first, so a rule and its IPv6 twin share the IPv4 number while
+    # IPv6-only rules are still recorded.
+    for rule in sorted(live_rules, key=lambda rule: bool(rule.get('v6'))):
+        if not is_managed_rule(rule):
+            logger.debug(f"Not recording unmanaged ufw rule on server {server.id}: {rule}")
+            continue
+        try:
+            live.setdefault(rule_key(rule), (rule['number'], normalize_rule(rule)))
+        except FirewallRuleError:
+            logger.debug(f"Not recording unmanaged ufw rule on server {server.id}: {rule}")
+
+    rows = list(FirewallRule.objects.filter(server=server))
+    first_sync = authoritative or not any(row.last_synced_at for row in rows)
+    matched, stale = set(), []
+    for row in rows:
+        try:
+            key = rule_key(row_rule(row))
+        except FirewallRuleError:
+            key = None
+        if key in live:
+            matched.add(key)
+            row.ufw_number, row.drift = live[key][0], 'in_sync'
+        elif authoritative:
+            stale.append(row)
+            continue
+        else:
+            row.ufw_number, row.drift = None, 'missing_on_host'
+        row.last_synced_at = now
+    rows = [row for row in rows if row not in stale]
+
+    new_rows = [
+        FirewallRule(
+            server=server,
+            port=rule['port'].replace(':', '-'),
+            protocol=rule['protocol'] or 'any',
+            source_ip=rule['source'] or '0.0.0.0/0',
+            action='block' if rule['action'] == 'deny' else rule['action'],
+            ufw_number=number,
+            drift='in_sync' if first_sync else 'new_on_host',
+            last_synced_at=now,
+        )
+        for key, (number, rule) in live.items() if key not in matched
+    ]
+    with transaction.atomic():
+        if stale:
+            FirewallRule.objects.filter(id__in=[row.id for row in stale]).delete()
+        if rows:
+            FirewallRule.objects.bulk_update(rows, ['ufw_number', 'drift', 'last_synced_at'])
+        FirewallRule.objects.bulk_create(new_rows)
+
+    counts = {choice: 0 for choice, _ in FirewallRule.DRIFT_CHOICES}
+    for row in rows + new_rows:
+        counts[row.drift] += 1
+    return counts
+
+
+def sync_firewall_rules(server: Server, authoritative: bool = False, timeout: int = 30) -> Dict[str, int]:
+    """Pull the host's UFW rules into FirewallRule rows (one SSH command)."""
+    with server.ssh_session(timeout=timeout) as session:
+        live_rules = read_ufw_rules(session)
+    return record_ufw_rules(server, live_rules, authoritative=authoritative)
+
+
+def push_firewall_rules(server: Server, dry_run: bool = False, timeout: int = 30) -> Dict:
+    """Make the host match the server's FirewallRule rows, then record the result."""
+    desired = [row_rule(row) for row in FirewallRule.objects.filter(server=server)]
+    result = apply_firewall_rules(server, desired, dry_run=dry_run, timeout=timeout)
+    if not dry_run:
+        # After a rollback the host did not take the stored rules; report them as drift.
+        result['drift'] = record_ufw_rules(server, result['rules'], authoritative=result['status'] != 'rolled_back')
+    return result
+
+
+def apply_firewall_rules(
+    server: Server, desired: List[Dict], dry_run: bool = False, prune: bool = True, timeout: int = 30,
+    credential=None, protect_ssh: bool = False, remove: List[Dict] = (),
+) -> Dict:
+    """
+    Reconcile the server's UFW rules with `desired` over one SSH session.
+    With `prune=False` rules missing from `desired` are kept (only additions are made),
+    except those listed in `remove`: this replaces rules in place, adding the new
+    ones before the old ones are deleted.
+    With `protect_ssh`, rules allowing the server's ssh_port are never deleted, so
+    ServerPilot cannot lock itself out; they are listed in the plan as 'kept'.
+    `credential` is an already decrypted credential, see Server.ssh_session().
+
+    Returns:
+        dict with 'status' ('unchanged', 'planned', 'applied' or 'rolled_back'),
+        the 'plan', the executed 'steps', the resulting live 'rules' and, on
+        failure, the 'error'.
+
+    Raises:
+        FirewallRuleError: If a desired or removed rule is invalid.
+        ConnectionError: If the SSH session cannot be opened.
+        RuntimeError: If the current rules cannot be read.
+    """
+    desired = [normalize_rule(rule) for rule in desired]
+    removed = {rule_key(rule) for rule in remove}
+    with server.ssh_session(timeout=timeout, credential=credential) as session:
+        current = read_ufw_rules(session)
+        plan = plan_firewall_changes(current, desired)
+        if not prune:
+            plan['delete'] = [rule for rule in plan['delete'] if rule_key(rule) in removed]
+        if protect_ssh:
+            plan['kept'] = [rule for rule in plan['delete'] if allows_port(rule, server.ssh_port)]
+            plan['delete'] = [rule for rule in plan['delete'] if not allows_port(rule, server.ssh_port)]
+            if plan['kept']:
+                logger.warning(f"Keeping SSH rule(s) on server {server.id} that the desired rules would delete: {plan['kept']}")
+        if not plan['add'] and not plan['delete']:
+            return {'status': 'unchanged', 'plan': plan, 'steps': [], 'rules': current}
+        if dry_run:
+            return {'status': 'planned', 'plan': plan, 'steps': [], 'rules': current}
+
+        # Adds first so replacement access exists before anything is removed.
+        steps = [('add', rule) for rule in plan['add']] + [('delete', rule) for rule in plan['delete']]
+        applied, executed = [], []
+        for operation, rule in steps:
+            command = build_rule_command(**rule) if operation == 'add' else build_delete_command(rule)
+            success, output, exit_status = session.run(command)
+            executed.append({'operation': operation, 'rule': rule, 'command': command, 'exit_status': exit_status})
+            if success and exit_status == 0:
+                applied.append((operation, rule))
+                continue
+
+            error = f"'{command}' failed with exit status {exit_status}: {output}"
+            logger.error(f"Firewall apply on server {server.id} failed, rolling back {len(applied)} step(s): {error}")
+            for done_operation, done_rule in reversed(applied):
+                undo = build_delete_command(done_rule) if done_operation == 'add' else build_rule_command(**done_rule)
+                undo_success, undo_output, undo_status = session.run(undo)
+                executed.append({
+                    'operation': 'rollback', 'rule': done_rule, 'command': undo, 'exit_status': undo_status,
+                })
+                if not undo_success or undo_status != 0:
+                    logger.critical(f"Rollback step '{undo}' failed on server {server.id}: {undo_output}")
+            return {
+                'status': 'rolled_back', 'plan': plan, 'steps': executed, 'error': error,
+                'rules': read_ufw_rules(session),
+            }
+
+        # Rule numbers changed; read them back so callers can record the new state.
+        return {'status': 'applied', 'plan': plan, 'steps': executed, 'rules': read_ufw_rules(session)}
+
+
+def _apply_in_thread(server: Server, rules: List[Dict], prune: bool, stored_credential) -> Dict:
+    try:
+        credential = None
+        if stored_credential is not None:
+            # Decrypted by the worker right before connecting; rotate_kek rewraps old DEKs.
+            try:
+                credential = (stored_credential.username, stored_credential.decrypt(rewrap=False))
+            except Exception as e:
+                credential = (stored_credential.username, e)
+        return apply_firewall_rules(server, rules, prune=prune, credential=credential, protect_ssh=True)
+    finally:
+        # Worker threads get their own database connection; do not leak it.
+        connection.close()
+
+
+def run_policy_rollout(rollout: FirewallPolicyRollout, max_workers: int = None) -> Dict[str, int]:
+    """
+    Push a rollout's rules to all of its pending targets, at most `max_workers`
+    servers at a time (FIREWALL_ROLLOUT_CONCURRENCY by default). Each server is
+    reconciled over a single SSH session; targets are updated as servers finish so
+    progress can be polled while the rollout runs. Rules allowing a server's SSH port
+    are kept even in 'replace' mode, so a bad policy cannot lock ServerPilot out.
+
+    Returns:
+        number of targets per final status.
+    """
+    max_workers = max_workers or getattr(settings, 'FIREWALL_ROLLOUT_CONCURRENCY', 20)
+    prune = rollout.mode == 'replace'
+    targets = list(rollout.targets.select_related('server').filter(status='pending'))
+    rollout.status = 'running'
+    rollout.save(update_fields=['status'])
+    # update() skips auto_now; updated_at tells fail_stale_rollout_targets when the target started.
+    FirewallPolicyRolloutTarget.objects.filter(id__in=[t.id for t in targets]).update(
+        status='running', updated_at=timezone.now()
+    )
+    # One query for all credentials instead of one per server; each is decrypted by its worker
+    credentials = ServerCredential.latest_for([t.server_id for t in targets])
+
+    counts = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(_apply_in_thread, t.server, rollout.rules, prune, credentials.get(t.server_id)): t
+            for t in targets
+        }
+        for future in as_completed(futures):
+            target = futures[future]
+            try:
+                result = future.result()
+                target.status = result['status']
+                target.added = len(result['plan']['add'])
+                target.deleted = len(result['plan']['delete'])
+                target.message = result.get('error', '')
+                record_ufw_rules(target.server, result['rules'], authoritative=result['status'] != 'rolled_back')
+            except Exception as e:
+                logger.error(f"Firewall policy rollout {rollout.id} failed on server {target.server_id}: {e}")
+                target.status, target.message = 'failed', str(e)
+            target.save(update_fields=['status', 'added', 'deleted', 'message', 'updated_at'])
+            counts[target.status] = counts.get(target.status, 0) + 1
+
+    _finish_rollout(rollout)
+    return counts
+
+
+def _finish_rollout(rollout: FirewallPolicyRollout):
+    failed = rollout.targets.filter(status__in=('failed', 'rolled_back')).exists()
+    rollout.status = 'completed_with_errors' if failed else 'completed'
+    rollout.finished_at = timezone.now()
+    rollout.save(update_fields=['status', 'finished_at'])
+
+
+def fail_stale_rollout_targets(timeout: int = None) -> int:
+    """
+    Mark rollout targets that have been 'running' for more than `timeout` seconds
+    (FIREWALL_ROLLOUT_TARGET_TIMEOUT by default) as failed, e.g. after the worker
+    running the rollout crashed, and finish rollouts with no target left to run.
+
+    Returns:
+        the number of targets marked as failed.
+    """
+    timeout = timeout or getattr(settings, 'FIREWALL_ROLLOUT_TARGET_TIMEOUT', 900)
+    stale = FirewallPolicyRolloutTarget.objects.filter(
+        status='running', updated_at__lt=timezone.now() - timedelta(seconds=timeout)
+    )
+    rollout_ids = set(stale.values_list('rollout_id', flat=True))
+    count = stale.update(
+        status='failed', updated_at=timezone.now(),
+        message='Timed out: the rollout stopped before this server finished; its firewall state is unknown.',
+    )
+    for rollout in FirewallPolicyRollout.objects.filter(id__in=rollout_ids, status='running').exclude(
+        targets__status__in=('pending', 'running')
+    ):
+        logger.warning(f"Firewall policy rollout {rollout.id} timed out")
+        _finish_rollout(rollout)
+    return count
+
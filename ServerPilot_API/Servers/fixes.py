@@ -0,0 +1,155 @@
+"""
+Batch application of security recommendation fixes.
+
+Fixes are ordered so that a risk's dependencies (SecurityRisk.depends_on) run
+before it; independent fixes run by stage (package installs, then configuration
+changes, then service restarts/enables) and finally in the order requested. All
+fixes run over a single SSH session and the recommendation rows are written back
+in one bulk update.
+"""
+import heapq
+import logging
+import re
+from typing import Dict, List
+
+from ServerPilot_API.Servers.models import SecurityRecommendation, Server, bump_compliance_matrix_version
+
+logger = logging.getLogger(__name__)
+
+STAGE_INSTALL, STAGE_CONFIG, STAGE_SERVICE = 0, 1, 2
+
+_INSTALL_PATTERN = re.compile(r'\b(apt(-get)?|yum|dnf|zypper|apk|snap|pip3?)\b.*\b(install|add)\b')
+_SERVICE_PATTERN = re.compile(r'\b(systemctl|service|ufw\s+(--force\s+)?(enable|reload)|restart|reload)\b')
+_UFW_ENABLE_PATTERN = re.compile(r'\bufw\s+enable\b')
+
+
+def fix_stage(command: str) -> int:
+    """Classify a fix command as a package install, a configuration change or a service action."""
+    if _INSTALL_PATTERN.search(command or ''):
+        return STAGE_INSTALL
+    if _SERVICE_PATTERN.search(command or ''):
+        return STAGE_SERVICE
+    return STAGE_CONFIG
+
+
+def _dependency_ids(rec: SecurityRecommendation) -> List[int]:
+    # Iterate the relation (rather than values_list) so prefetch_related('risk__depends_on') is used.
+    return [risk.id for risk in rec.risk.depends_on.all()] if rec.risk is not None else []
+
+
+def order_fixes(recommendations: List[SecurityRecommendation]) -> List[SecurityRecommendation]:
+    """
+    Order recommendations topologically by their risks' dependencies, breaking ties
+    by fix stage and then by the requested order. Dependencies on risks that are not
+    part of the batch are ignored; a dependency cycle is broken at the lowest stage.
+    """
+    position = {rec.id: i for i, rec in enumerate(recommendations)}
+    by_risk: Dict[int, List[SecurityRecommendation]] = {}
+    for rec in recommendations:
+        if rec.risk_id is not None:
+            by_risk.setdefault(rec.risk_id, []).append(rec)
+
+    # Edges point from a dependency to its dependents.
+    dependents = {rec.id: [] for rec in recommendations}
+    pending = {rec.id: 0 for rec in recommendations}
+    for rec in recommendations:
+        for dependency_id in _dependency_ids(rec):
+            for dependency in by_risk.get(dependency_id, []):
+                if dependency.id != rec.id:
+                    dependents[dependency.id].append(rec)
+                    pending[rec.id] += 1
+
+    def key(rec):
+        return (fix_stage(rec.fix_command), position[rec.id], rec.id)
+
+    ready = [key(rec) + (rec,) for rec in recommendations if not pending[rec.id]]
+    heapq.heapify(ready)
+    ordered, done = [], set()
+    while len(ordered) < len(recommendations):
+        if not ready:
+            # Cycle: release the best remaining recommendation.
+            rec = min((r for r in recommendations if r.id not in done), key=key)
+            logger.warning(f"Dependency cycle detected around recommendation {rec.id}; applying it anyway.")
+            pending[rec.id] = 0
+            ready.append(key(rec) + (rec,))
+        rec = heapq.heappop(ready)[-1]
+        if rec.id in done:
+            continue
+        done.add(rec.id)
+        ordered.append(rec)
+        for dependent in dependents[rec.id]:
+            pending[dependent.id] -= 1
+            if pending[dependent.id] == 0 and dependent.id not in done:
+                heapq.heappush(ready, key(dependent) + (dependent,))
+    return ordered
+
+
+def prepare_fix_command(command: str) -> str:
+    """
+    Modifies a given command to run non-interactively if necessary.
+    Currently handles 'ufw enable' by adding --force, which skips its confirmation
+    prompt without a pipe (fix commands run untrusted, see Server._run_on_client).
+    """
+    if _UFW_ENABLE_PATTERN.search(command):
+        logger.debug(f"Modifying command for non-interactive UFW enable: '{command}'")
+        return _UFW_ENABLE_PATTERN.sub('ufw --force enable', command)
+    return command
+
+
+def apply_fixes(server: Server, recommendations: List[SecurityRecommendation], timeout: int = 60) -> List[Dict]:
+    """
+    Apply the fixes of `recommendations` in dependency order over one SSH session.
+
+    A fix succeeds when its command exits with status 0. Fixes whose dependency
+    failed in this batch are skipped. If the connection is lost part way through,
+    the remaining fixes fail (their commands return exit status -1). Successful
+    recommendations are marked 'fixed' with a single bulk update, also when an
+    error interrupts the batch.
+
+    Returns:
+        list of per-recommendation results: {'id', 'risk', 'status', 'exit_status', 'output'}
+        where status is one of 'fixed', 'failed' or 'skipped'.
+
+    Raises:
+        ConnectionError: If the SSH session cannot be opened.
+    """
+    ordered = order_fixes(recommendations)
+    failed_risks = set()
+    results, fixed = [], []
+    try:
+        with server.ssh_session(timeout=timeout) as session:
+            for rec in ordered:
+                blocking = [dependency_id for dependency_id in _dependency_ids(rec) if dependency_id in failed_risks]
+                if blocking:
+                    if rec.risk_id is not None:
+                        failed_risks.add(rec.risk_id)
+                    results.append({
+                        'id': rec.id, 'risk': rec.risk_id, 'status': 'skipped', 'exit_status': None,
+                        'output': f"Skipped because a dependency failed: {blocking}",
+                    })
+                    continue
+
+                # Untrusted, like the single fix endpoint: fix commands come from editable SecurityRisk rows.
+                success, output, exit_status = session.run(prepare_fix_command(rec.fix_command))
+                if success and exit_status == 0:
+                    rec.status = 'fixed'
+                    fixed.append(rec)
+                    item_status = 'fixed'
+                else:
+                    if rec.risk_id is not None:
+                        failed_risks.add(rec.risk_id)
+                    item_status = 'failed'
+                    logger.error(
+                        f"Failed to apply fix for recommendation {rec.id} on server {server.id}. "
+                        f"Output: {output}, Exit Status: {exit_status}"
+                    )
+                results.append({
+                    'id': rec.id, 'risk': rec.risk_id, 'status': item_status,
+                    'exit_status': exit_status, 'output': output,
+                })
+    finally:
+        # Record the fixes already applied even if the session fails part way through.
+        if fixed:
+            SecurityRecommendation.objects.bulk_update(fixed, ['status'])
+            bump_compliance_matrix_version()
+    return results
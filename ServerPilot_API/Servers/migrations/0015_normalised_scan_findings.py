@@ -0,0 +1,56 @@
+# Generated by Django 5.2.18 on 2026-10-19 08:58
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def mark_legacy_passed_findings(apps, schema_editor):
+    SecurityRecommendation = apps.get_model('Servers', 'SecurityRecommendation')
+    SecurityRecommendation.objects.filter(status='passed').update(risk_found=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Servers', '0014_tofu_and_notifications'),
+        ('security', '0011_securitysettings_self_registration_enabled'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='securityrecommendation',
+            name='output_hash',
+            field=models.CharField(blank=True, default='', help_text='SHA-256 of the check command output.', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='securityrecommendation',
+            name='risk',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='findings', to='security.securityrisk'),
+        ),
+        migrations.AddField(
+            model_name='securityrecommendation',
+            name='risk_found',
+            field=models.BooleanField(default=True),
+        ),
+        migrations.AddField(
+            model_name='securityscan',
+            name='passed_checks',
+            field=models.BinaryField(blank=True, default=b''),
+        ),
+        migrations.AlterField(
+            model_name='securityrecommendation',
+            name='description',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AlterField(
+            model_name='securityrecommendation',
+            name='solution',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AlterField(
+            model_name='securityrecommendation',
+            name='title',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.RunPython(mark_legacy_passed_findings, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def close_legacy_findings(apps, schema_editor):
+    """
+    Before delta storage every scan held a full copy of its findings. Close each
+    legacy row at the server's next scan so it only belongs to the scan that
+    created it, and link every scan to the previous completed one.
+    """
+    SecurityScan = apps.get_model('Servers', 'SecurityScan')
+    SecurityRecommendation = apps.get_model('Servers', 'SecurityRecommendation')
+    server_ids = SecurityScan.objects.values_list('server_id', flat=True).distinct()
+    for server_id in server_ids:
+        scans = list(SecurityScan.objects.filter(server_id=server_id).order_by('id').values_list('id', 'status'))
+        previous_completed = None
+        for index, (scan_id, status) in enumerate(scans):
+            if previous_completed is not None:
+                SecurityScan.objects.filter(pk=scan_id).update(previous_scan_id=previous_completed)
+            if index + 1 < len(scans):
+                SecurityRecommendation.objects.filter(scan_id=scan_id).update(resolved_in_id=scans[index + 1][0])
+            if status == 'completed':
+                previous_completed = scan_id
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Servers', '0015_normalised_scan_findings'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='securityrecommendation',
+            name='resolved_in',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.RESTRICT, related_name='resolved_recommendations', to='Servers.securityscan'),
+        ),
+        migrations.AddField(
+            model_name='securityscan',
+            name='changes',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.AddField(
+            model_name='securityscan',
+            name='previous_scan',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='Servers.securityscan'),
+        ),
+        migrations.RunPython(close_legacy_findings, migrations.RunPython.noop),
+    ]
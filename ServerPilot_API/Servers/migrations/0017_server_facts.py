@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:03
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Servers', '0016_scan_delta_storage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ServerFacts',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('facts', models.JSONField(default=dict)),
+                ('facts_hash', models.CharField(blank=True, default='', max_length=64)),
+                ('collected_at', models.DateTimeField()),
+                ('server', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='facts', to='Servers.server')),
+            ],
+            options={
+                'verbose_name': 'Server Facts',
+                'verbose_name_plural': 'Server Facts',
+            },
+        ),
+    ]
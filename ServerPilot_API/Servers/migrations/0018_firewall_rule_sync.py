@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Servers', '0017_server_facts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='firewallrule',
+            name='drift',
+            field=models.CharField(choices=[('in_sync', 'In sync'), ('missing_on_host', 'Missing on host'), ('new_on_host', 'New on host')], default='in_sync', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='firewallrule',
+            name='last_synced_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='firewallrule',
+            name='ufw_number',
+            field=models.PositiveIntegerField(blank=True, help_text="Rule number in 'ufw status numbered'.", null=True),
+        ),
+        migrations.AlterField(
+            model_name='firewallrule',
+            name='action',
+            field=models.CharField(choices=[('allow', 'Allow'), ('block', 'Block'), ('reject', 'Reject'), ('limit', 'Limit')], default='allow', max_length=10),
+        ),
+    ]
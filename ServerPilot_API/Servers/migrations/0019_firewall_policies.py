@@ -0,0 +1,68 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:12
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Customers', '0006_alter_customer_first_name_alter_customer_last_name'),
+        ('Servers', '0018_firewall_rule_sync'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FirewallPolicy',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('description', models.TextField(blank=True, default='')),
+                ('rules', models.JSONField(default=list, help_text="List of rules with 'port', 'protocol', 'action' and 'source'.")),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('customers', models.ManyToManyField(blank=True, related_name='firewall_policies', to='Customers.customer')),
+                ('servers', models.ManyToManyField(blank=True, related_name='firewall_policies', to='Servers.server')),
+            ],
+            options={
+                'verbose_name': 'Firewall Policy',
+                'verbose_name_plural': 'Firewall Policies',
+                'ordering': ['name'],
+            },
+        ),
+        migrations.CreateModel(
+            name='FirewallPolicyRollout',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mode', models.CharField(choices=[('merge', 'Add missing policy rules'), ('replace', 'Replace all rules with the policy')], default='merge', max_length=10)),
+                ('rules', models.JSONField(default=list, help_text='Snapshot of the policy rules being rolled out.')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('completed', 'Completed'), ('completed_with_errors', 'Completed with errors')], default='pending', max_length=32)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('policy', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rollouts', to='Servers.firewallpolicy')),
+                ('started_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='FirewallPolicyRolloutTarget',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('applied', 'Applied'), ('unchanged', 'Unchanged'), ('rolled_back', 'Rolled back'), ('failed', 'Failed')], default='pending', max_length=20)),
+                ('added', models.PositiveIntegerField(default=0)),
+                ('deleted', models.PositiveIntegerField(default=0)),
+                ('message', models.TextField(blank=True, default='')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('rollout', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='targets', to='Servers.firewallpolicyrollout')),
+                ('server', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='firewall_rollouts', to='Servers.server')),
+            ],
+            options={
+                'ordering': ['id'],
+                'unique_together': {('rollout', 'server')},
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Servers', '0019_firewall_policies'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='servercredential',
+            name='kek_id',
+            field=models.CharField(default='1', max_length=64),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:20
+
+import ServerPilot_API.Servers.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Servers', '0020_servercredential_kek_id'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='securityrecommendation',
+            name='scan',
+            field=models.ForeignKey(on_delete=ServerPilot_API.Servers.models.keep_reported_findings, related_name='recommendations', to='Servers.securityscan'),
+        ),
+        migrations.AlterField(
+            model_name='securityrecommendation',
+            name='resolved_in',
+            field=models.ForeignKey(blank=True, null=True, on_delete=ServerPilot_API.Servers.models.reopen_until_next_scan, related_name='resolved_recommendations', to='Servers.securityscan'),
+        ),
+    ]
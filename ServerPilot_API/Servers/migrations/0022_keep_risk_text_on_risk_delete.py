@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:05
+
+import ServerPilot_API.Servers.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Servers', '0021_keep_findings_on_scan_delete'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='securityrecommendation',
+            name='risk',
+            field=models.ForeignKey(blank=True, null=True, on_delete=ServerPilot_API.Servers.models.keep_risk_text, related_name='findings', to='security.securityrisk'),
+        ),
+    ]
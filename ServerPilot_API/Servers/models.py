@@ -1,7 +1,11 @@
-from django.db import models
+import bisect
+
+from django.db import models, transaction
+from django.db.models import OuterRef, Subquery
 from django.conf import settings
+from django.core.cache import cache
 from ServerPilot_API.Customers.models import Customer
-from ServerPilot_API.security.crypto import decrypt_secret
+from ServerPilot_API.security.crypto import DEFAULT_KEK_ID, decrypt_secret, needs_rewrap, rewrap_dek
 from asgiref.sync import sync_to_async
 import paramiko
 import io
@@ -9,11 +13,59 @@ import asyncssh
 import socket
 import hashlib
 import base64
+import time
+import logging
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Cached fleet-wide views of scan results (see Servers/compliance.py) include this
+# version in their cache key; bumping it invalidates them all at once.
+COMPLIANCE_MATRIX_VERSION_KEY = "servers:compliance-matrix:version"
+
+
+def bump_compliance_matrix_version():
+    try:
+        cache.incr(COMPLIANCE_MATRIX_VERSION_KEY)
+    except ValueError:
+        # Key missing (first use or evicted): start from a fresh value so old keys are not reused.
+        cache.set(COMPLIANCE_MATRIX_VERSION_KEY, time.time_ns(), None)
+
+
+class SSHSession:
+    """An open SSH connection to a server; see Server.ssh_session()."""
+
+    def __init__(self, client, sudo_password=None, timeout=10):
+        self.client = client
+        self.sudo_password = sudo_password
+        self.timeout = timeout
+
+    def run(self, command, timeout=None, trusted=False):
+        """Run a command on the open connection. Returns (success, output, exit_status)."""
+        return Server._run_on_client(
+            self.client, command, timeout=timeout or self.timeout, trusted=trusted, sudo_password=self.sudo_password
+        )
+
 
 class SecurityScan(models.Model):
     server = models.ForeignKey('Server', related_name='security_scans', on_delete=models.CASCADE)
     scanned_at = models.DateTimeField(auto_now_add=True)
     status = models.CharField(max_length=20, choices=[('completed', 'Completed'), ('failed', 'Failed')], default='completed')
+    # Bitmap of SecurityRisk ids whose check passed (bit n set => risk n passed).
+    # Used instead of one "Check Passed" recommendation row per risk when
+    # SECURITY_SCAN_PASSED_BITMAP is enabled.
+    passed_checks = models.BinaryField(blank=True, default=b'')
+    # Scans only persist their delta against the previous completed scan of the
+    # server: findings are created by the scan that first observes them and closed
+    # (SecurityRecommendation.resolved_in) by the scan that no longer does.
+    # `changes` records findings that stayed open but changed status or output.
+    previous_scan = models.ForeignKey('self', related_name='+', on_delete=models.SET_NULL, null=True, blank=True)
+    changes = models.JSONField(blank=True, default=list)
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        if self.status == 'completed':
+            bump_compliance_matrix_version()
 
     def __str__(self):
         return f"Scan for {self.server.server_name} at {self.scanned_at.strftime('%Y-%m-%d %H:%M')}"
@@ -21,17 +73,125 @@ class SecurityScan(models.Model):
     class Meta:
         ordering = ['-scanned_at']
 
+def _next_remaining_scans(collector, scans, using):
+    """
+    Return a function mapping (server_id, scan_id) to the id of the next scan of that
+    server that `collector` does not delete, or None. `scans` are scans being deleted.
+    """
+    deleted = {scan.pk for scan in collector.data.get(SecurityScan, ())} | {scan.pk for scan in scans}
+    remaining = {}
+    for scan_id, server_id in (
+        SecurityScan.objects.using(using).filter(server_id__in={scan.server_id for scan in scans})
+        .exclude(pk__in=deleted).order_by('id').values_list('id', 'server_id')
+    ):
+        remaining.setdefault(server_id, []).append(scan_id)
+
+    def next_scan(server_id, scan_id):
+        ids = remaining.get(server_id, [])
+        i = bisect.bisect_right(ids, scan_id)
+        return ids[i] if i < len(ids) else None
+
+    return next_scan
+
+
+def _deleted_scans(collector, field, sub_objs, using):
+    """The findings in `sub_objs` with their (scan_id, resolved_in_id), and the scans being deleted by id."""
+    findings = {finding.pk: finding for finding in sub_objs}
+    intervals = {
+        pk: (scan_id, resolved_in_id) for pk, scan_id, resolved_in_id in
+        SecurityRecommendation.objects.using(using).filter(pk__in=list(findings))
+        .values_list('pk', 'scan_id', 'resolved_in_id')
+    }
+    scan_ids = {interval[0] if field.name == 'scan' else interval[1] for interval in intervals.values()}
+    scans = [scan for scan in collector.data.get(SecurityScan, ()) if scan.pk in scan_ids]
+    return findings, intervals, {scan.pk: scan for scan in scans}
+
+
+def keep_reported_findings(collector, field, sub_objs, using):
+    """
+    on_delete of SecurityRecommendation.scan. A finding belongs to every later scan
+    until it is resolved, so deleting the scan that first observed it moves it to the
+    next remaining scan that still reports it. Only findings that no remaining scan
+    reports are deleted with the scan.
+    """
+    findings, intervals, scans = _deleted_scans(collector, field, sub_objs, using)
+    next_scan = _next_remaining_scans(collector, scans.values(), using)
+    moved, dropped = {}, []
+    for pk, (scan_id, resolved_in_id) in intervals.items():
+        next_id = next_scan(scans[scan_id].server_id, scan_id)
+        if next_id is not None and (resolved_in_id is None or next_id < resolved_in_id):
+            moved.setdefault(next_id, []).append(findings[pk])
+        else:
+            dropped.append(findings[pk])
+    for next_id, moved_findings in moved.items():
+        collector.add_field_update(field, next_id, moved_findings)
+    if dropped:
+        models.CASCADE(collector, field, dropped, using)
+
+
+def reopen_until_next_scan(collector, field, sub_objs, using):
+    """
+    on_delete of SecurityRecommendation.resolved_in: a finding resolved by a deleted
+    scan is resolved by the next remaining scan instead, or open again if there is none.
+    """
+    findings, intervals, scans = _deleted_scans(collector, field, sub_objs, using)
+    next_scan = _next_remaining_scans(collector, scans.values(), using)
+    updates = {}
+    for pk, (scan_id, resolved_in_id) in intervals.items():
+        updates.setdefault(next_scan(scans[resolved_in_id].server_id, resolved_in_id), []).append(findings[pk])
+    for next_id, updated_findings in updates.items():
+        collector.add_field_update(field, next_id, updated_findings)
+
+
+def keep_risk_text(collector, field, sub_objs, using):
+    """
+    on_delete of SecurityRecommendation.risk: copy the deleted risk's text onto its
+    findings before the reference is nulled, so historical scans stay readable.
+    Runs for instance and queryset deletes alike.
+    """
+    findings = {finding.pk: finding for finding in sub_objs}
+    rows = list(
+        SecurityRecommendation.objects.using(using).filter(pk__in=list(findings)).values_list('pk', 'risk_id', 'risk_found')
+    )
+    risks = field.remote_field.model.objects.using(using).in_bulk({risk_id for _pk, risk_id, _found in rows})
+    opts = SecurityRecommendation._meta
+    for pk, risk_id, risk_found in rows:
+        risk = risks[risk_id]
+        if risk_found:
+            values = {'title': risk.title, 'description': risk.description, 'solution': risk.fix_command}
+        else:
+            values = {'title': f"Check Passed: {risk.title}"}
+        for name, value in values.items():
+            collector.add_field_update(opts.get_field(name), value, [findings[pk]])
+    models.SET_NULL(collector, field, sub_objs, using)
+
+
 class SecurityRecommendation(models.Model):
-    scan = models.ForeignKey(SecurityScan, related_name='recommendations', on_delete=models.CASCADE)
+    # Scan that first observed the finding; the finding stays part of every later
+    # scan of the server until `resolved_in` is set. Deleting either scan keeps the
+    # findings of the remaining scans intact (see keep_reported_findings).
+    scan = models.ForeignKey(SecurityScan, related_name='recommendations', on_delete=keep_reported_findings)
+    resolved_in = models.ForeignKey(
+        SecurityScan, related_name='resolved_recommendations', on_delete=reopen_until_next_scan,
+        null=True, blank=True,
+    )
     RISK_LEVELS = (
         ('high', 'High'),
         ('medium', 'Medium'),
         ('low', 'Low'),
     )
+    # Findings reference the risk they were produced by; title, description and
+    # solution are resolved from the risk at read time and are only stored for
+    # legacy rows or when the risk has been deleted (see keep_risk_text).
+    risk = models.ForeignKey(
+        'security.SecurityRisk', related_name='findings', on_delete=keep_risk_text, null=True, blank=True
+    )
+    risk_found = models.BooleanField(default=True)
+    output_hash = models.CharField(max_length=64, blank=True, default='', help_text="SHA-256 of the check command output.")
     risk_level = models.CharField(max_length=10, choices=RISK_LEVELS)
-    title = models.CharField(max_length=255)
-    description = models.TextField()
-    solution = models.TextField(default='')
+    title = models.CharField(max_length=255, blank=True, default='')
+    description = models.TextField(blank=True, default='')
+    solution = models.TextField(blank=True, default='')
     command_solution = models.TextField(blank=True, null=True)
     STATUS_CHOICES = [
         ('pending', 'Pending'),
@@ -40,20 +200,49 @@ class SecurityRecommendation(models.Model):
         ('in_progress', 'In Progress'),
         ('acknowledged', 'Acknowledged'),
     ]
+    # Current triage state of the finding, shared by every scan it belongs to: it is
+    # not kept per scan, so older scans show today's status. Status changes detected
+    # by a scan (a fixed finding found again) are recorded in SecurityScan.changes.
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        bump_compliance_matrix_version()
+
     def __str__(self):
-        return self.title
+        if self.title or not self.risk_id:
+            return self.title
+        return self.risk.title
+
+    @property
+    def fix_command(self):
+        """The command that fixes this finding, resolved from the risk for normalised rows."""
+        if self.solution or not self.risk_id:
+            return self.solution
+        return self.risk.fix_command
 
 
 class FirewallRule(models.Model):
+    DRIFT_CHOICES = [
+        ('in_sync', 'In sync'),
+        ('missing_on_host', 'Missing on host'),
+        ('new_on_host', 'New on host'),
+    ]
     server = models.ForeignKey('Server', related_name='firewall_rules', on_delete=models.CASCADE)
     port = models.CharField(max_length=255, help_text="Port or port range (e.g., '22', '80,443', '1000-2000')")
     protocol = models.CharField(max_length=10, choices=[('tcp', 'TCP'), ('udp', 'UDP'), ('any', 'Any')], default='tcp')
     source_ip = models.CharField(max_length=255, default='0.0.0.0/0', help_text="Source IP or CIDR (e.g., '192.168.1.1', '10.0.0.0/8')")
-    action = models.CharField(max_length=10, choices=[('allow', 'Allow'), ('block', 'Block')], default='allow')
+    action = models.CharField(
+        max_length=10,
+        choices=[('allow', 'Allow'), ('block', 'Block'), ('reject', 'Reject'), ('limit', 'Limit')],
+        default='allow',
+    )
     description = models.CharField(max_length=255, blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    # State of the rule on the host as of the last sync with `ufw status numbered`.
+    ufw_number = models.PositiveIntegerField(null=True, blank=True, help_text="Rule number in 'ufw status numbered'.")
+    drift = models.CharField(max_length=20, choices=DRIFT_CHOICES, default='in_sync')
+    last_synced_at = models.DateTimeField(null=True, blank=True)
 
     def __str__(self):
         return f"{self.get_action_display()} {self.protocol.upper()} on port {self.port} from {self.source_ip} for {self.server.server_name}"
@@ -64,6 +253,86 @@ class FirewallRule(models.Model):
         verbose_name_plural = 'Firewall Rules'
 
 
+class FirewallPolicy(models.Model):
+    """
+    Reusable set of UFW rules (see Servers/firewall.py for the rule format) that can
+    be assigned to customers and/or individual servers and rolled out to all of them.
+    """
+    name = models.CharField(max_length=255, unique=True)
+    description = models.TextField(blank=True, default='')
+    rules = models.JSONField(default=list, help_text="List of rules with 'port', 'protocol', 'action' and 'source'.")
+    customers = models.ManyToManyField(Customer, related_name='firewall_policies', blank=True)
+    servers = models.ManyToManyField('Server', related_name='firewall_policies', blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['name']
+        verbose_name = 'Firewall Policy'
+        verbose_name_plural = 'Firewall Policies'
+
+    def __str__(self):
+        return self.name
+
+    def target_servers(self):
+        """Active servers the policy is assigned to, directly or through their customer."""
+        return Server.objects.filter(
+            models.Q(firewall_policies=self) | models.Q(customer__firewall_policies=self), is_active=True
+        ).distinct()
+
+
+class FirewallPolicyRollout(models.Model):
+    """One push of a FirewallPolicy to its servers; per-server progress is in `targets`."""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+        ('completed_with_errors', 'Completed with errors'),
+    ]
+    MODE_CHOICES = [
+        ('merge', 'Add missing policy rules'),
+        ('replace', 'Replace all rules with the policy'),
+    ]
+    policy = models.ForeignKey(FirewallPolicy, related_name='rollouts', on_delete=models.CASCADE)
+    mode = models.CharField(max_length=10, choices=MODE_CHOICES, default='merge')
+    rules = models.JSONField(default=list, help_text="Snapshot of the policy rules being rolled out.")
+    status = models.CharField(max_length=32, choices=STATUS_CHOICES, default='pending')
+    started_by = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.SET_NULL)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"Rollout of {self.policy.name} at {self.created_at.strftime('%Y-%m-%d %H:%M')}"
+
+
+class FirewallPolicyRolloutTarget(models.Model):
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('applied', 'Applied'),
+        ('unchanged', 'Unchanged'),
+        ('rolled_back', 'Rolled back'),
+        ('failed', 'Failed'),
+    ]
+    rollout = models.ForeignKey(FirewallPolicyRollout, related_name='targets', on_delete=models.CASCADE)
+    server = models.ForeignKey('Server', related_name='firewall_rollouts', on_delete=models.CASCADE)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    added = models.PositiveIntegerField(default=0)
+    deleted = models.PositiveIntegerField(default=0)
+    message = models.TextField(blank=True, default='')
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['id']
+        unique_together = ('rollout', 'server')
+
+    def __str__(self):
+        return f"{self.rollout} on {self.server.server_name}: {self.status}"
+
+
 class Server(models.Model):
     customer = models.ForeignKey(Customer, related_name='servers', on_delete=models.CASCADE)
     server_name = models.CharField(max_length=255)
@@ -88,6 +357,23 @@ class Server(models.Model):
     def __str__(self):
         return f"{self.server_name} ({self.server_ip}) for {self.customer.first_name or self.customer.company_name}"
 
+    def save(self, *args, **kwargs):
+        from ServerPilot_API.Servers.ssh_targets import notify_ssh_target_changed
+
+        super().save(*args, **kwargs)
+        notify_ssh_target_changed(self.id)
+        # Renames and moves to another customer change the compliance matrix.
+        transaction.on_commit(bump_compliance_matrix_version)
+
+    def delete(self, *args, **kwargs):
+        from ServerPilot_API.Servers.ssh_targets import notify_ssh_target_changed
+
+        server_id = self.id
+        result = super().delete(*args, **kwargs)
+        notify_ssh_target_changed(server_id)
+        transaction.on_commit(bump_compliance_matrix_version)
+        return result
+
     def _fetch_server_host_key(self, timeout=10):
         """
         Perform an SSH handshake without user auth to obtain the server's host key.
@@ -142,49 +428,55 @@ class Server(models.Model):
                 return False, fps, key
         return True, fps, key
 
-    def connect_ssh(self, command='ls -la', timeout=10, trusted=False):
+    def _open_ssh_client(self, timeout=10, credential=None):
         """
-        Attempts to connect to the server via SSH and execute a command.
-        Returns a tuple: (success: bool, output: str, exit_status: int)
-        `success` is False only if the connection itself fails.
-        `exit_status` is the command's exit code, or -1 on connection failure.
+        Open an authenticated paramiko client to the server after verifying its host key.
+        `credential` is an already decrypted (username, secret) pair, where `secret` may be
+        the exception raised decrypting it; the stored credential is read when omitted.
+        Returns a tuple: (client, sudo_password, error). `client` is None and `error`
+        describes the problem when the connection could not be established.
         """
         # Enforce trust policy: do not allow SSH if server is not trusted
         if not self.trusted:
-            return False, (
+            return None, None, (
                 "Server is not trusted. SSH operations are blocked until the host key is verified "
                 "and the server is confirmed via the TOFU flow."
-            ), -1
+            )
         client = paramiko.SSHClient()
         # Enforce strict host key checking; we'll add the expected key in-memory after verification
         client.set_missing_host_key_policy(paramiko.RejectPolicy())
 
+        connected = False
         username_to_use = None
         password_to_use = None
         private_key_str = None
 
         # 1) Prefer encrypted credential stored via Credentials Vault
-        cred = self.credentials.first()  # Meta ordering = ['-created_at']
-        if cred:
+        if credential is None:
+            cred = self.credentials.first()  # Meta ordering = ['-created_at']
+            if cred:
+                try:
+                    credential = (cred.username, cred.decrypt())
+                except Exception as e:
+                    credential = (cred.username, e)
+        if credential:
             try:
-                secret_bytes = decrypt_secret({
-                    'ciphertext': bytes(cred.ciphertext),
-                    'nonce': bytes(cred.nonce),
-                    'encrypted_dek': bytes(cred.encrypted_dek),
-                })
+                username, secret_bytes = credential
+                if isinstance(secret_bytes, Exception):
+                    raise secret_bytes
                 try:
                     private_key_str = secret_bytes.decode('utf-8')
                 except Exception:
                     private_key_str = None
-                username_to_use = cred.username
+                username_to_use = username
                 if not private_key_str:
                     # treat as password
                     password_to_use = secret_bytes.decode('utf-8', errors='ignore')
             except Exception as e:
-                return False, f"Failed to decrypt stored credential: {str(e)}", -1
+                return None, None, f"Failed to decrypt stored credential: {str(e)}"
         else:
             logger.error("No stored credentials found for this server %s. Please add one from the Credentials tab.", self.server_name)
-            return False, "No stored credentials found for this server. Please add one from the Credentials tab.", -1
+            return None, None, "No stored credentials found for this server. Please add one from the Credentials tab."
 
         try:
             # Verify fingerprint prior to connecting
@@ -193,11 +485,11 @@ class Server(models.Model):
                 logger.error("Host key fingerprint mismatch detected. Connection refused."
                     f"\nStored: {self.stored_fingerprint}"
                     f"\nCurrent: {fps}")
-                return False, (
+                return None, None, (
                     "Host key fingerprint mismatch detected. Connection refused."
                     f"\nStored: {self.stored_fingerprint}"
                     f"\nCurrent: {fps}"
-                ), -1
+                )
 
             # Inject the verified host key to the client's in-memory known hosts
             host_keys = paramiko.HostKeys()
@@ -249,25 +541,46 @@ class Server(models.Model):
                     if password_to_use or private_key_str:
                         connection_args['password'] = password_to_use or private_key_str
                     else:
-                        return False, f"Error processing SSH key: {str(e)}", -1
+                        return None, None, f"Error processing SSH key: {str(e)}"
             
             elif password_to_use:
                 connection_args['password'] = password_to_use
             else:
-                return False, "No SSH key or password provided for the selected login type.", -1
+                return None, None, "No SSH key or password provided for the selected login type."
 
             connection_args['timeout'] = timeout
             client.connect(**connection_args)
+            connected = True
+            return client, password_to_use, None
+
+        except paramiko.AuthenticationException as e:
+            return None, None, f"Authentication failed: {str(e)}"
+        except paramiko.SSHException as e: 
+            return None, None, f"SSH connection error: {str(e)}"
+        except TimeoutError: 
+            return None, None, f"Connection timed out after {timeout} seconds."
+        except Exception as e: 
+            return None, None, f"An unexpected error occurred during SSH operation: {str(e)}"
+        finally:
+            if not connected:
+                client.close()
 
-            # --- Command safety validation --- #
-            # To mitigate shell injection risks flagged by Bandit B601, we restrict commands
-            # unless they are explicitly marked as trusted (internal, framework-generated).
-            # Disallow common shell metacharacters for untrusted invocations.
-            if not trusted:
-                dangerous_tokens = [';', '&&', '||', '|', '$(', '`', '>', '<']
-                if any(tok in command for tok in dangerous_tokens):
-                    return False, "Command rejected due to unsafe characters. Use a trusted internal call if necessary.", -1
+    @staticmethod
+    def _run_on_client(client, command, timeout=10, trusted=False, sudo_password=None):
+        """
+        Execute a command over an open paramiko client.
+        Returns a tuple: (success: bool, output: str, exit_status: int)
+        """
+        # --- Command safety validation --- #
+        # To mitigate shell injection risks flagged by Bandit B601, we restrict commands
+        # unless they are explicitly marked as trusted (internal, framework-generated).
+        # Disallow common shell metacharacters for untrusted invocations.
+        if not trusted:
+            dangerous_tokens = [';', '&&', '||', '|', '$(', '`', '>', '<']
+            if any(tok in command for tok in dangerous_tokens):
+                return False, "Command rejected due to unsafe characters. Use a trusted internal call if necessary.", -1
 
+        try:
             # --- Sudo Handling --- #
             # If the command uses sudo, we need to handle it specially.
             if command.strip().startswith('sudo'):
@@ -275,8 +588,8 @@ class Server(models.Model):
                 stdin, stdout, stderr = client.exec_command(command, timeout=timeout, get_pty=True)  # nosec B601 - validated above
                 # We need to write the password to stdin for sudo.
                 # Note: This assumes the ssh user's password is the sudo password.
-                if password_to_use:
-                    stdin.write(password_to_use + '\n')
+                if sudo_password:
+                    stdin.write(sudo_password + '\n')
                     stdin.flush()
             else:
                 stdin, stdout, stderr = client.exec_command(command, timeout=timeout)  # nosec B601 - validated above
@@ -292,28 +605,56 @@ class Server(models.Model):
 
             return True, full_output, exit_status
 
-        except paramiko.AuthenticationException as e:
-            return False, f"Authentication failed: {str(e)}", -1
         except paramiko.SSHException as e: 
             return False, f"SSH connection error: {str(e)}", -1
         except TimeoutError: 
-             return False, f"Connection timed out after {timeout} seconds.", -1
+            return False, f"Command timed out after {timeout} seconds.", -1
         except Exception as e: 
             return False, f"An unexpected error occurred during SSH operation: {str(e)}", -1
+
+    def connect_ssh(self, command='ls -la', timeout=10, trusted=False):
+        """
+        Attempts to connect to the server via SSH and execute a command.
+        Returns a tuple: (success: bool, output: str, exit_status: int)
+        `success` is False only if the connection itself fails.
+        `exit_status` is the command's exit code, or -1 on connection failure.
+        """
+        client, sudo_password, error = self._open_ssh_client(timeout=timeout)
+        if client is None:
+            return False, error, -1
+        try:
+            return self._run_on_client(client, command, timeout=timeout, trusted=trusted, sudo_password=sudo_password)
         finally:
-            if client:
-                client.close()
+            client.close()
+
+    @contextmanager
+    def ssh_session(self, timeout=10, credential=None):
+        """
+        Open one SSH connection for several commands:
+
+            with server.ssh_session(timeout=60) as session:
+                success, output, exit_status = session.run('ufw enable', trusted=True)
+
+        `credential` is passed on to _open_ssh_client().
+
+        Raises:
+            ConnectionError: If the connection cannot be established.
+        """
+        client, sudo_password, error = self._open_ssh_client(timeout=timeout, credential=credential)
+        if client is None:
+            raise ConnectionError(error)
+        try:
+            yield SSHSession(client, sudo_password, timeout)
+        finally:
+            client.close()
     
     @staticmethod
     async def _build_async_credentials(server):
         """Prepare username and auth for asyncssh based on stored ServerCredential first, then legacy fields."""
         cred = await sync_to_async(lambda: server.credentials.first())()
         if cred:
-            secret_bytes = decrypt_secret({
-                'ciphertext': bytes(cred.ciphertext),
-                'nonce': bytes(cred.nonce),
-                'encrypted_dek': bytes(cred.encrypted_dek),
-            })
+            # No lazy rewrap here: it would write to the database from the event loop
+            secret_bytes = cred.decrypt(rewrap=False)
             username = cred.username
             # Try as private key first
             try:
@@ -411,6 +752,8 @@ class ServerCredential(models.Model):
     ciphertext = models.BinaryField()
     nonce = models.BinaryField()
     encrypted_dek = models.BinaryField()
+    # Id of the KEK that wrapped encrypted_dek (see security.crypto)
+    kek_id = models.CharField(max_length=64, default=DEFAULT_KEK_ID)
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
@@ -422,6 +765,83 @@ class ServerCredential(models.Model):
     def __str__(self):
         return f"Credential for {self.username} on {self.server.server_name}"
 
+    def save(self, *args, **kwargs):
+        from ServerPilot_API.Servers.ssh_targets import notify_ssh_target_changed
+
+        super().save(*args, **kwargs)
+        notify_ssh_target_changed(self.server_id)
+
+    def decrypt(self, rewrap: bool = True) -> bytes:
+        """
+        Return the plaintext secret. With `rewrap`, a DEK still wrapped with an older KEK
+        is rewrapped with the active one, so rows migrate as they are used.
+        """
+        plaintext = decrypt_secret({
+            'ciphertext': bytes(self.ciphertext),
+            'nonce': bytes(self.nonce),
+            'encrypted_dek': bytes(self.encrypted_dek),
+            'kek_id': self.kek_id,
+        })
+        if rewrap and needs_rewrap(self.kek_id):
+            try:
+                self.rewrap()
+            except Exception:
+                # The secret was read fine; rotate_kek will take care of this row
+                logger.warning("Could not rewrap credential id=%s", self.pk, exc_info=True)
+        return plaintext
+
+    @classmethod
+    def latest_for(cls, server_ids):
+        """
+        Return {server_id: credential} with the current (most recent) credential of many
+        servers, fetched in one query and still encrypted. Fleet operations decrypt each
+        one right before its connection, so plaintext is not held for the whole run.
+        """
+        latest = cls.objects.filter(server=OuterRef('server')).order_by('-created_at').values('pk')[:1]
+        creds = (
+            cls.objects.filter(server_id__in=list(server_ids), pk=Subquery(latest))
+            .only('server_id', 'username', 'ciphertext', 'nonce', 'encrypted_dek', 'kek_id')
+        )
+        return {cred.server_id: cred for cred in creds}
+
+    def rewrap(self) -> bool:
+        """Rewrap the DEK with the active KEK; returns False if the row changed meanwhile."""
+        wrapped = rewrap_dek(bytes(self.encrypted_dek), self.kek_id)
+        # Conditional update: no lost update against rotate_kek, and no change notification
+        # since the secret itself is unchanged.
+        updated = ServerCredential.objects.filter(pk=self.pk, kek_id=self.kek_id).update(**wrapped)
+        if updated:
+            self.encrypted_dek = wrapped['encrypted_dek']
+            self.kek_id = wrapped['kek_id']
+        return bool(updated)
+
+    def delete(self, *args, **kwargs):
+        from ServerPilot_API.Servers.ssh_targets import notify_ssh_target_changed
+
+        server_id = self.server_id
+        result = super().delete(*args, **kwargs)
+        notify_ssh_target_changed(server_id)
+        return result
+
+
+class ServerFacts(models.Model):
+    """
+    Cached bundle of host state (sshd config, sysctl, listening sockets, packages,
+    UFW status, file permissions) collected in one SSH session.
+    Fact-based SecurityRisk rules are evaluated against it without reconnecting.
+    """
+    server = models.OneToOneField('Server', related_name='facts', on_delete=models.CASCADE)
+    facts = models.JSONField(default=dict)
+    facts_hash = models.CharField(max_length=64, blank=True, default='')
+    collected_at = models.DateTimeField()
+
+    class Meta:
+        verbose_name = 'Server Facts'
+        verbose_name_plural = 'Server Facts'
+
+    def __str__(self):
+        return f"Facts for {self.server.server_name} collected at {self.collected_at.strftime('%Y-%m-%d %H:%M')}"
+
 
 class ServerNotification(models.Model):
     """
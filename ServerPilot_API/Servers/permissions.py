@@ -1,4 +1,7 @@
+import hmac
+
 from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.contrib import auth
 from rest_framework import permissions
 from rest_framework.authentication import SessionAuthentication
@@ -56,6 +59,19 @@ class IsOwnerOfCustomerForServer(permissions.BasePermission):
         return obj.customer.owner == request.user
 
 
+class HasInternalServiceToken(permissions.BasePermission):
+    """
+    Allows requests from internal services (the WebSocket SSH proxy) that present
+    settings.WS_PROXY_INTERNAL_TOKEN in the X-Internal-Token header.
+    Denies everything while no token is configured.
+    """
+
+    def has_permission(self, request, view):
+        expected = getattr(settings, 'WS_PROXY_INTERNAL_TOKEN', '')
+        provided = request.headers.get('X-Internal-Token', '')
+        return bool(expected) and hmac.compare_digest(provided.encode(), expected.encode())
+
+
 class AsyncSessionAuthentication(SessionAuthentication):
     """
     Async-safe version of SessionAuthentication.
@@ -1,5 +1,11 @@
 from rest_framework import serializers
-from .models import Server, SecurityScan, SecurityRecommendation, FirewallRule, ServerCredential, ServerNotification
+from .models import (
+    Server, SecurityScan, SecurityRecommendation, FirewallRule, ServerCredential, ServerNotification,
+    FirewallPolicy, FirewallPolicyRollout, FirewallPolicyRolloutTarget,
+)
+from .firewall import FirewallRuleError, normalize_rule
+from .findings import resolve_finding_text, passed_findings, scan_findings
+from ServerPilot_API.security.models import SecurityRisk
 # Customer model import might not be strictly needed here anymore unless for type hinting
 # from API.Customers.models import Customer 
 
@@ -39,16 +45,65 @@ class ServerSerializer(serializers.ModelSerializer):
         return super().update(instance, validated_data)
 
 class SecurityRecommendationSerializer(serializers.ModelSerializer):
+    """
+    Findings only reference their SecurityRisk; the text is filled in from the cached
+    risk catalog, which can be passed in the context as 'risk_catalog' to avoid
+    looking it up per row.
+    """
     class Meta:
         model = SecurityRecommendation
         fields = '__all__'
 
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        catalog = self.context.get('risk_catalog')
+        if catalog is None:
+            catalog = SecurityRisk.catalog()
+        return resolve_finding_text(data, catalog)
+
 class FirewallRuleSerializer(serializers.ModelSerializer):
     class Meta:
         model = FirewallRule
         fields = ('id', 'server', 'port', 'protocol', 'source_ip', 'action', 'description', 'created_at')
         read_only_fields = ('created_at', 'server')
 
+class FirewallPolicySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = FirewallPolicy
+        fields = ('id', 'name', 'description', 'rules', 'customers', 'servers', 'created_at', 'updated_at')
+        read_only_fields = ('created_at', 'updated_at')
+
+    def validate_rules(self, value):
+        if not isinstance(value, list):
+            raise serializers.ValidationError('Rules must be a list.')
+        try:
+            return [normalize_rule(rule) for rule in value]
+        except (FirewallRuleError, AttributeError) as e:
+            raise serializers.ValidationError(str(e))
+
+class FirewallPolicyRolloutTargetSerializer(serializers.ModelSerializer):
+    server_name = serializers.CharField(source='server.server_name', read_only=True)
+
+    class Meta:
+        model = FirewallPolicyRolloutTarget
+        fields = ('server', 'server_name', 'status', 'added', 'deleted', 'message', 'updated_at')
+        read_only_fields = fields
+
+class FirewallPolicyRolloutSerializer(serializers.ModelSerializer):
+    targets = FirewallPolicyRolloutTargetSerializer(many=True, read_only=True)
+    progress = serializers.SerializerMethodField()
+
+    def get_progress(self, rollout):
+        counts = {}
+        for target in rollout.targets.all():
+            counts[target.status] = counts.get(target.status, 0) + 1
+        return counts
+
+    class Meta:
+        model = FirewallPolicyRollout
+        fields = ('id', 'policy', 'mode', 'rules', 'status', 'started_by', 'created_at', 'finished_at', 'progress', 'targets')
+        read_only_fields = fields
+
 class InstalledApplicationSerializer(serializers.Serializer):
     """
     Serializer for representing a systemd service. This is not a model serializer
@@ -61,7 +116,13 @@ class InstalledApplicationSerializer(serializers.Serializer):
     description = serializers.CharField()
 
 class SecurityScanSerializer(serializers.ModelSerializer):
-    recommendations = SecurityRecommendationSerializer(many=True, read_only=True)
+    recommendations = serializers.SerializerMethodField()
+
+    def get_recommendations(self, scan):
+        catalog = SecurityRisk.catalog()
+        context = {**self.context, 'risk_catalog': catalog}
+        stored = SecurityRecommendationSerializer(scan_findings(scan), many=True, context=context).data
+        return list(stored) + passed_findings(scan, catalog)
 
     class Meta:
         model = SecurityScan
@@ -69,6 +130,22 @@ class SecurityScanSerializer(serializers.ModelSerializer):
         read_only_fields = ('scanned_at', 'server')
 
 
+class SecurityScanSummarySerializer(serializers.ModelSerializer):
+    """
+    Scan without its findings; `summary` holds the finding counts computed for the
+    whole page of scans and passed in the context as 'summaries'.
+    """
+    summary = serializers.SerializerMethodField()
+
+    def get_summary(self, scan):
+        return self.context.get('summaries', {}).get(scan.id)
+
+    class Meta:
+        model = SecurityScan
+        fields = ('id', 'server', 'scanned_at', 'status', 'previous_scan', 'summary')
+        read_only_fields = fields
+
+
 class ServerCredentialListSerializer(serializers.ModelSerializer):
     """
     Serializer for listing stored credentials metadata without revealing secrets.
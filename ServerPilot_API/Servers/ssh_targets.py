@@ -0,0 +1,90 @@
+"""
+SSH connection targets for the WebSocket SSH proxy (ServerPilot_Web_Socket).
+
+The proxy resolves a server id to host, port, username and decrypted secret through
+the internal ssh-target endpoint instead of asking the browser for them. It caches
+the answer briefly and drops a server's entry when the server id is published on
+settings.WS_PROXY_INVALIDATION_CHANNEL, which happens whenever the server or one of
+its credentials changes (see notify_ssh_target_changed).
+"""
+import logging
+from typing import Dict
+
+from django.conf import settings
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+
+class SshTargetError(ValueError):
+    """The server cannot be used as an SSH target (untrusted, no credential, host key mismatch)."""
+
+
+def _looks_like_private_key(secret: str) -> bool:
+    # Same heuristic as Server._open_ssh_client.
+    return 'BEGIN' in secret and 'KEY' in secret
+
+
+def resolve_ssh_target(server, verify_host_key: bool = True) -> Dict:
+    """
+    Return the connection parameters of `server` using its latest stored credential.
+
+    As with Server.async_connect_ssh, the server must be trusted and, when
+    `verify_host_key` is set, its current host key must match the stored fingerprint.
+
+    Raises:
+        SshTargetError: If the server cannot be connected to.
+    """
+    if not server.trusted:
+        raise SshTargetError(
+            "Server is not trusted. SSH operations are blocked until the host key is verified "
+            "and the server is confirmed via the TOFU flow."
+        )
+    cred = server.credentials.first()  # Meta ordering = ['-created_at']
+    if cred is None:
+        raise SshTargetError("No stored credentials found for this server. Please add one from the Credentials tab.")
+    if verify_host_key:
+        ok, fps, _host_key = server._verify_or_alert_fingerprint()
+        if not ok:
+            raise SshTargetError(
+                f"Host key fingerprint mismatch detected. Stored={server.stored_fingerprint}, Current={fps}"
+            )
+
+    try:
+        secret = cred.decrypt().decode('utf-8', errors='ignore')
+    except Exception as e:
+        raise SshTargetError(f"Failed to decrypt stored credential: {e}")
+
+    target = {
+        'server_id': server.id,
+        'host': str(server.server_ip),
+        'port': server.ssh_port,
+        'username': cred.username,
+        'credential_id': cred.id,
+        'fingerprint': (server.stored_fingerprint or {}).get('sha256'),
+    }
+    if _looks_like_private_key(secret):
+        target.update({'auth_method': 'key', 'private_key': secret})
+    else:
+        target.update({'auth_method': 'password', 'password': secret})
+    return target
+
+
+def notify_ssh_target_changed(server_id: int):
+    """Tell WebSocket proxies and the in-process terminal pool to drop their cached target for `server_id` once the transaction commits."""
+    def publish():
+        try:
+            from django_redis import get_redis_connection
+
+            get_redis_connection('default').publish(settings.WS_PROXY_INVALIDATION_CHANNEL, str(server_id))
+        except Exception as e:
+            # No Redis cache configured (e.g. tests): proxies fall back to their cache TTL.
+            logger.debug(f"Could not publish ssh target invalidation for server {server_id}: {e}")
+
+    def invalidate_local():
+        from ServerPilot_API.Servers.ssh_terminal.pool import ssh_pool
+
+        ssh_pool.invalidate(server_id)
+        publish()
+
+    transaction.on_commit(invalidate_local)
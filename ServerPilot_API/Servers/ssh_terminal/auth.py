@@ -0,0 +1,51 @@
+"""
+JWT authentication for WebSocket connections.
+
+The REST API authenticates with SimpleJWT access tokens, which browsers cannot put
+in a WebSocket handshake header. When the session middleware found no user, this
+middleware accepts the access token the way the standalone proxy does: as the
+subprotocol pair ['jwt', '<token>'], or as ?token=<token>.
+"""
+import logging
+from typing import Optional
+from urllib.parse import parse_qs
+
+from channels.db import database_sync_to_async
+from channels.middleware import BaseMiddleware
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+
+logger = logging.getLogger(__name__)
+
+
+def token_from_scope(scope) -> Optional[str]:
+    subprotocols = scope.get('subprotocols') or []
+    if len(subprotocols) >= 2 and subprotocols[0].lower() == 'jwt':
+        return subprotocols[1]
+    query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+    return (query.get('token') or [None])[0]
+
+
+@database_sync_to_async
+def get_jwt_user(raw_token: str):
+    authentication = JWTAuthentication()
+    try:
+        return authentication.get_user(authentication.get_validated_token(raw_token))
+    except (InvalidToken, TokenError, AuthenticationFailed) as e:
+        logger.info(f"Rejected WebSocket JWT: {e}")
+        return None
+
+
+class JwtAuthMiddleware(BaseMiddleware):
+    """Set scope['user'] from a SimpleJWT access token when there is no session user."""
+
+    async def __call__(self, scope, receive, send):
+        user = scope.get('user')
+        if user is None or not user.is_authenticated:
+            raw_token = token_from_scope(scope)
+            if raw_token:
+                jwt_user = await get_jwt_user(raw_token)
+                if jwt_user is not None:
+                    scope = dict(scope, user=jwt_user)
+        return await super().__call__(scope, receive, send)
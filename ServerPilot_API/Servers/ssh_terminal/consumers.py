@@ -0,0 +1,168 @@
+"""
+Interactive SSH terminal served by the Django ASGI app at ws/servers/<id>/ssh/.
+
+Speaks the same protocol as the standalone proxy (ServerPilot_Web_Socket), so the
+frontend can use either:
+- the server first sends {"type": "output_mode", "mode": "json"|"binary"}; clients opt
+  into binary output frames with ?output=binary, otherwise output arrives as
+  {"type": "output", "output": "..."}
+- input is {"type": "cmd", "payload": "..."} or raw text; {"type": "resize", "cols": ..,
+  "rows": ..} resizes the PTY and {"type": "keepalive"} is answered with a status
+
+Users are authenticated by the session or a SimpleJWT access token (see auth.py) and
+may open the servers of their customers (staff: every server). The terminal runs on a
+pooled connection (see pool.py), so it usually opens without a new SSH handshake.
+"""
+import asyncio
+import codecs
+import json
+import logging
+from urllib.parse import parse_qs
+
+import asyncssh
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncWebsocketConsumer
+
+from ServerPilot_API.Servers.models import Server
+from ServerPilot_API.Servers.ssh_targets import SshTargetError
+from ServerPilot_API.Servers.ssh_terminal.pool import ssh_pool
+from ServerPilot_API.audit_log.services import log_action
+
+logger = logging.getLogger(__name__)
+
+MAX_INPUT_LENGTH = 10000
+READ_SIZE = 32768
+
+
+@database_sync_to_async
+def get_server_for_user(user, server_id):
+    """Return the active server `server_id` if `user` may open a terminal on it, else None."""
+    server = Server.objects.select_related('customer').filter(pk=server_id).first()
+    if server is None or not server.is_active:
+        return None
+    if not (user.is_staff or server.customer.owner_id == user.id):
+        return None
+    return server
+
+
+class SshConsumer(AsyncWebsocketConsumer):
+    pooled = None
+    process = None
+    reader_task = None
+
+    def _query(self, name, default=None):
+        values = parse_qs(self.scope.get('query_string', b'').decode('latin-1')).get(name)
+        return values[0] if values else default
+
+    def _terminal_size(self, obj):
+        try:
+            cols, rows = int(obj.get('cols', 80)), int(obj.get('rows', 24))
+        except (TypeError, ValueError):
+            return None
+        if not (0 < cols <= 1000 and 0 < rows <= 1000):
+            return None
+        return cols, rows
+
+    async def connect(self):
+        user = self.scope.get('user')
+        if user is None or not user.is_authenticated:
+            await self.close()
+            return
+        server_id = self.scope['url_route']['kwargs']['server_id']
+        server = await get_server_for_user(user, server_id)
+        if server is None:
+            # Hide existence
+            await self.close()
+            return
+
+        subprotocols = self.scope.get('subprotocols') or []
+        await self.accept(subprotocol='jwt' if subprotocols and subprotocols[0].lower() == 'jwt' else None)
+        self.binary_output = self._query('output') == 'binary'
+        self.decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        await self.send(text_data=json.dumps({'type': 'output_mode', 'mode': 'binary' if self.binary_output else 'json'}))
+
+        size = self._terminal_size({'cols': self._query('cols', 80), 'rows': self._query('rows', 24)}) or (80, 24)
+        try:
+            self.pooled, self.process = await ssh_pool.open_terminal(
+                server, term_type='xterm', term_size=size, encoding=None
+            )
+        except SshTargetError as e:
+            logger.warning(f"Cannot open terminal on server {server.id}: {e}")
+            await self._send_json({'type': 'error', 'message': str(e)})
+            await self.close(code=4409)
+            return
+        except Exception as e:
+            logger.error(f"Failed to open SSH terminal on server {server.id}: {e}", exc_info=True)
+            await self._send_json({'type': 'error', 'message': 'Could not open SSH session.'})
+            await self.close(code=1011)
+            return
+
+        self.reader_task = asyncio.create_task(self._forward_output())
+        await database_sync_to_async(log_action)(
+            user, 'server_ssh_terminal_open', None,
+            f'Opened SSH terminal on server {server.server_name} (ID: {server.id})'
+        )
+
+    async def _send_json(self, obj):
+        await self.send(text_data=json.dumps(obj))
+
+    async def _forward_output(self):
+        try:
+            while True:
+                data = await self.process.stdout.read(READ_SIZE)
+                if not data:
+                    break
+                if self.binary_output:
+                    await self.send(bytes_data=data)
+                else:
+                    text = self.decoder.decode(data)
+                    if text:
+                        await self._send_json({'type': 'output', 'output': text})
+        except asyncio.CancelledError:
+            raise
+        except (asyncssh.Error, OSError) as e:
+            logger.info(f"SSH terminal output ended: {e}")
+        # The shell exited
+        await self.close()
+
+    async def receive(self, text_data=None, bytes_data=None):
+        if self.process is None:
+            return
+        if bytes_data is not None:
+            self.process.stdin.write(bytes_data[:MAX_INPUT_LENGTH])
+            return
+        try:
+            obj = json.loads(text_data)
+        except (TypeError, json.JSONDecodeError):
+            obj = None
+        if not isinstance(obj, dict):
+            # Raw input for the shell
+            self.process.stdin.write(text_data.encode('utf-8'))
+            return
+
+        msg_type = obj.get('type')
+        if msg_type == 'cmd':
+            payload = obj.get('payload', '')
+            if not isinstance(payload, str) or len(payload) > MAX_INPUT_LENGTH:
+                await self._send_json({'type': 'error', 'message': 'command too long'})
+                return
+            self.process.stdin.write(payload.encode('utf-8'))
+        elif msg_type == 'resize':
+            size = self._terminal_size(obj)
+            if size is not None:
+                self.process.change_terminal_size(*size)
+        elif msg_type == 'keepalive':
+            await self._send_json({'type': 'status', 'message': 'alive'})
+
+    async def disconnect(self, code):
+        if self.reader_task is not None and not self.reader_task.done():
+            self.reader_task.cancel()
+        if self.process is not None:
+            try:
+                self.process.close()
+            except Exception:
+                pass
+            self.process = None
+        if self.pooled is not None:
+            ssh_pool.release(self.pooled)
+            self.pooled = None
@@ -0,0 +1,211 @@
+"""
+Warm asyncssh connections for the in-process terminals (see consumers.py).
+
+Terminals are channels on a pooled connection per server: opening another terminal
+to the same server starts a PTY on an existing connection instead of doing a new SSH
+handshake, and a connection is kept for settings.SSH_TERMINAL_IDLE_TIMEOUT seconds
+after its last terminal closed. At most SSH_TERMINAL_MAX_SESSIONS_PER_CONNECTION
+terminals share a connection (sshd's MaxSessions defaults to 10).
+
+Resolved targets, decrypted credential included, are cached per server for
+SSH_TERMINAL_CREDENTIAL_TTL seconds. notify_ssh_target_changed drops a server's
+cached target and retires its connections in this process. A connection is only
+reused while it matches the current target (host, port, user and credential), so
+changes made in other processes reach new terminals once the cache entry expires.
+
+Host keys are checked on the SSH connection itself against the stored fingerprint,
+so no separate host-key handshake is made. A mismatch is re-checked through
+Server._verify_or_alert_fingerprint, which raises the usual notification.
+"""
+import asyncio
+import logging
+import time
+from typing import Dict, List, Optional, Tuple
+
+import asyncssh
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from ServerPilot_API.Servers.ssh_targets import SshTargetError, resolve_ssh_target
+
+logger = logging.getLogger(__name__)
+
+
+def _target_key(target: Dict) -> Tuple:
+    return target['host'], target['port'], target['username'], target.get('credential_id')
+
+
+def _normalize_fingerprint(fingerprint: str) -> str:
+    # The stored SHA256 fingerprint keeps base64 padding; asyncssh's does not.
+    return fingerprint.rstrip('=')
+
+
+class PooledConnection:
+    def __init__(self, server_id: int, conn: asyncssh.SSHClientConnection, target_key: Tuple):
+        self.server_id = server_id
+        self.conn = conn
+        self.target_key = target_key
+        self.sessions = 0
+        self.retired = False
+        self.idle_handle: Optional[asyncio.TimerHandle] = None
+        self._closed = asyncio.ensure_future(conn.wait_closed())
+
+    @property
+    def closed(self) -> bool:
+        return self._closed.done()
+
+    def usable_for(self, target_key: Tuple) -> bool:
+        return not self.retired and not self.closed and self.target_key == target_key
+
+
+class SshConnectionPool:
+    def __init__(self):
+        self._targets: Dict[int, Tuple[float, Dict]] = {}
+        self._connections: Dict[int, List[PooledConnection]] = {}
+        self._locks: Dict[int, asyncio.Lock] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    # ----- credential cache -----
+    async def get_target(self, server) -> Dict:
+        """Return the SSH target of `server`, from the cache when fresh (raises SshTargetError)."""
+        cached = self._targets.get(server.id)
+        if cached is not None and cached[0] > time.monotonic():
+            return cached[1]
+        target = await sync_to_async(resolve_ssh_target)(server, verify_host_key=False)
+        self._targets[server.id] = (time.monotonic() + settings.SSH_TERMINAL_CREDENTIAL_TTL, target)
+        return target
+
+    # ----- connections -----
+    def _bind_loop(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # Connections and locks belong to the loop they were created on.
+            self._connections.clear()
+            self._locks.clear()
+            self._loop = loop
+
+    async def _connect(self, server, target: Dict) -> asyncssh.SSHClientConnection:
+        client_keys = None
+        if target['auth_method'] == 'key':
+            client_keys = [asyncssh.import_private_key(target['private_key'])]
+        conn = await asyncssh.connect(
+            target['host'],
+            port=target['port'],
+            username=target['username'],
+            password=target.get('password'),
+            client_keys=client_keys,
+            known_hosts=None,
+            keepalive_interval=settings.SSH_TERMINAL_KEEPALIVE_INTERVAL,
+        )
+        expected = target.get('fingerprint')
+        if expected:
+            actual = conn.get_server_host_key().get_fingerprint('sha256')
+            if _normalize_fingerprint(actual) != _normalize_fingerprint(expected):
+                conn.close()
+                self._targets.pop(server.id, None)
+                try:
+                    await sync_to_async(server._verify_or_alert_fingerprint)()
+                except Exception as e:
+                    logger.warning(f"Could not re-check host key of server {server.id}: {e}")
+                raise SshTargetError(f"Host key fingerprint mismatch detected. Stored={expected}, Current={actual}")
+        return conn
+
+    async def _acquire(self, server) -> PooledConnection:
+        target = await self.get_target(server)
+        key = _target_key(target)
+        lock = self._locks.setdefault(server.id, asyncio.Lock())
+        # Held while connecting, so concurrent first terminals share one handshake.
+        async with lock:
+            pooled_list = self._connections.setdefault(server.id, [])
+            for pooled in pooled_list:
+                if pooled.usable_for(key) and pooled.sessions < settings.SSH_TERMINAL_MAX_SESSIONS_PER_CONNECTION:
+                    break
+            else:
+                pooled = PooledConnection(server.id, await self._connect(server, target), key)
+                pooled_list.append(pooled)
+            if pooled.idle_handle is not None:
+                pooled.idle_handle.cancel()
+                pooled.idle_handle = None
+            pooled.sessions += 1
+            return pooled
+
+    async def open_terminal(self, server, **process_kwargs) -> Tuple[PooledConnection, asyncssh.SSHClientProcess]:
+        """
+        Open a PTY process on a pooled connection to `server`. Pass the result's
+        PooledConnection to release() when the terminal closes.
+
+        Raises:
+            SshTargetError: If the server cannot be used as an SSH target.
+            asyncssh.Error, OSError: If connecting fails.
+        """
+        self._bind_loop()
+        pooled = await self._acquire(server)
+        try:
+            return pooled, await pooled.conn.create_process(**process_kwargs)
+        except (asyncssh.Error, OSError) as e:
+            # The pooled connection may have died silently; retry once on a fresh one.
+            logger.info(f"Pooled SSH connection to server {server.id} failed ({e}); reconnecting")
+            pooled.retired = True
+            self.release(pooled)
+        except BaseException:
+            self.release(pooled)
+            raise
+        pooled = await self._acquire(server)
+        try:
+            return pooled, await pooled.conn.create_process(**process_kwargs)
+        except BaseException:
+            self.release(pooled)
+            raise
+
+    def release(self, pooled: PooledConnection):
+        pooled.sessions -= 1
+        if pooled.sessions > 0:
+            return
+        if pooled.retired or pooled.closed:
+            self._discard(pooled)
+        elif self._loop is not None:
+            pooled.idle_handle = self._loop.call_later(settings.SSH_TERMINAL_IDLE_TIMEOUT, self._expire_idle, pooled)
+
+    def _expire_idle(self, pooled: PooledConnection):
+        pooled.idle_handle = None
+        if pooled.sessions == 0:
+            self._discard(pooled)
+
+    def _discard(self, pooled: PooledConnection):
+        pooled_list = self._connections.get(pooled.server_id, [])
+        if pooled in pooled_list:
+            pooled_list.remove(pooled)
+        if not pooled_list:
+            self._connections.pop(pooled.server_id, None)
+        if pooled.idle_handle is not None:
+            pooled.idle_handle.cancel()
+            pooled.idle_handle = None
+        pooled.conn.close()
+
+    def _retire(self, server_id: int):
+        for pooled in list(self._connections.get(server_id, [])):
+            pooled.retired = True
+            if pooled.sessions == 0:
+                self._discard(pooled)
+
+    def invalidate(self, server_id: int):
+        """Forget the cached target of `server_id` and stop reusing its connections; safe from any thread."""
+        self._targets.pop(server_id, None)
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            self._retire(server_id)
+        else:
+            loop.call_soon_threadsafe(self._retire, server_id)
+
+    def stats(self) -> Dict[int, List[int]]:
+        """Open terminals per pooled connection, by server id."""
+        return {server_id: [p.sessions for p in pooled] for server_id, pooled in self._connections.items()}
+
+
+ssh_pool = SshConnectionPool()
@@ -1,7 +1,11 @@
+import logging
+
 from celery import shared_task
 from django.utils import timezone
 from .models import Server, ServerNotification
 
+logger = logging.getLogger(__name__)
+
 @shared_task
 def recheck_server_fingerprints():
     """
@@ -27,3 +31,94 @@ def recheck_server_fingerprints():
                 new_fingerprint={},
             )
     return {"checked": count_checked, "mismatch": count_mismatch}
+
+
+@shared_task
+def collect_server_facts(server_ids=None):
+    """
+    Collect the facts bundle (sshd, sysctl, sockets, packages, ufw, permissions)
+    from active trusted servers so fact rules can be evaluated without SSH.
+    """
+    from .facts import collect_facts
+
+    servers = Server.objects.filter(trusted=True, is_active=True)
+    if server_ids is not None:
+        servers = servers.filter(id__in=server_ids)
+    collected, failed = 0, 0
+    for server in servers:
+        try:
+            collect_facts(server)
+            collected += 1
+        except Exception:
+            logger.exception(f"Failed to collect facts from server {server.id}")
+            failed += 1
+    return {"collected": collected, "failed": failed}
+
+
+@shared_task
+def reevaluate_fact_rules(risk_ids=None):
+    """
+    Re-evaluate fact rules against the cached facts of every server and record the
+    outcome as a new scan. No server is contacted; risks without a fact rule keep
+    their previous results.
+    """
+    from ServerPilot_API.security.models import SecurityRisk
+    from .facts import evaluate_fact_risks
+    from .findings import record_scan_findings
+    from .models import SecurityScan, ServerFacts
+
+    enabled = list(SecurityRisk.objects.filter(is_enabled=True).order_by('id'))
+    fact_risks = [risk for risk in enabled if risk.fact_rule and (risk_ids is None or risk.id in risk_ids)]
+    if not fact_risks:
+        return {"servers": 0, "risks": 0}
+
+    checked_risk_ids = [risk.id for risk in enabled]
+    count = 0
+    for server_facts in ServerFacts.objects.select_related('server').filter(server__is_active=True):
+        scan = SecurityScan.objects.create(server=server_facts.server, status='running')
+        record_scan_findings(scan, evaluate_fact_risks(fact_risks, server_facts.facts), checked_risk_ids=checked_risk_ids)
+        scan.status = 'completed'
+        scan.save(update_fields=['status'])
+        count += 1
+    return {"servers": count, "risks": len(fact_risks)}
+
+
+@shared_task
+def sync_server_firewall_rules(server_ids=None):
+    """
+    Periodically pull UFW rules of active trusted servers into FirewallRule rows,
+    flagging rules that drifted from what ServerPilot recorded.
+    """
+    from .firewall import sync_firewall_rules
+
+    servers = Server.objects.filter(trusted=True, is_active=True)
+    if server_ids is not None:
+        servers = servers.filter(id__in=server_ids)
+    synced, failed, drifted = 0, 0, 0
+    for server in servers:
+        try:
+            counts = sync_firewall_rules(server)
+            synced += 1
+            drifted += counts['missing_on_host'] + counts['new_on_host']
+        except Exception:
+            logger.exception(f"Failed to sync firewall rules of server {server.id}")
+            failed += 1
+    return {"synced": synced, "failed": failed, "drifted": drifted}
+
+
+@shared_task
+def run_firewall_policy_rollout(rollout_id):
+    """Push a firewall policy rollout to its servers with bounded concurrency."""
+    from .firewall import run_policy_rollout
+    from .models import FirewallPolicyRollout
+
+    rollout = FirewallPolicyRollout.objects.get(pk=rollout_id)
+    return run_policy_rollout(rollout)
+
+
+@shared_task
+def fail_stale_firewall_rollouts():
+    """Periodically fail rollout targets left 'running' by a crashed rollout worker."""
+    from .firewall import fail_stale_rollout_targets
+
+    return {"failed": fail_stale_rollout_targets()}
@@ -0,0 +1,393 @@
+import os
+
+import pytest
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from ServerPilot_API.Users.models import CustomUser as User
+from ServerPilot_API.Customers.models import Customer
+from ServerPilot_API.Servers.firewall import parse_ufw_numbered, plan_firewall_changes, record_ufw_rules, rule_spec
+from ServerPilot_API.Servers.models import Server, ServerCredential
+from ServerPilot_API.security import crypto
+
+pytestmark = pytest.mark.django_db
+
+
+class FakeUfw:
+    """In-memory UFW host answering the commands issued over an SSH session."""
+
+    def __init__(self, specs=(), fail_on=None):
+        self.specs = list(specs)
+        self.fail_on = fail_on
+        self.commands = []
+        self.sessions = 0
+
+    def install(self, monkeypatch):
+        def ssh_session(server, timeout=10, credential=None):
+            self.sessions += 1
+            return self
+        def connect_ssh(server, command="ls -la", timeout=10, trusted=False):
+            return self.run(command, trusted=trusted)
+        monkeypatch.setattr(Server, "ssh_session", ssh_session)
+        monkeypatch.setattr(Server, "connect_ssh", connect_ssh)
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def status_numbered(self):
+        lines = ["Status: active", "", "     To                         Action      From", "     --                         ------      ----"]
+        for number, spec in enumerate(self.specs, start=1):
+            words = spec.split()
+            if words[1] == "from":
+                port = words[6] + (f"/{words[8]}" if len(words) > 8 else "")
+                lines.append(f"[{number:2}] {port:<26} {words[0].upper()} IN    {words[2]}")
+            else:
+                lines.append(f"[{number:2}] {words[1]:<26} {words[0].upper()} IN    Anywhere")
+        return "\n".join(lines)
+
+    def run(self, command, timeout=None, trusted=False):
+        self.commands.append(command)
+        if command == "sudo ufw status numbered":
+            return True, self.status_numbered(), 0
+        if self.fail_on and self.fail_on in command:
+            return True, "ERROR: Could not update rule", 1
+        if command.startswith("sudo ufw --force delete "):
+            self.specs.remove(command[len("sudo ufw --force delete "):])
+        else:
+            self.specs.append(command[len("sudo ufw "):])
+        return True, "Rule updated", 0
+
+
+@pytest.fixture
+def user():
+    return User.objects.create_user(username="owner", email="owner@example.com", password="pass")
+
+
+@pytest.fixture
+def server(user):
+    customer = Customer.objects.create(owner=user, email="cust@example.com")
+    return Server.objects.create(customer=customer, server_name="S1", server_ip="127.0.0.1", trusted=True)
+
+
+@pytest.fixture
+def api_client(user):
+    client = APIClient()
+    client.force_authenticate(user=user)
+    return client
+
+
+def firewall_url(server, name):
+    return reverse(
+        f"server-firewall-rules-{name}",
+        kwargs={"customer_pk": server.customer_id, "server_pk": server.id},
+    )
+
+
+def test_parse_and_plan():
+    output = "\n".join([
+        "Status: active",
+        "",
+        "     To                         Action      From",
+        "     --                         ------      ----",
+        "[ 1] 22/tcp                     ALLOW IN    Anywhere",
+        "[ 2] 5432/tcp                   ALLOW IN    10.0.0.0/8",
+        "[ 3] 22/tcp (v6)                ALLOW IN    Anywhere (v6)",
+    ])
+    current = parse_ufw_numbered(output)
+    assert current[2] == {"number": 3, "port": "22", "protocol": "tcp", "action": "ALLOW", "source": "Anywhere", "v6": True}
+
+    plan = plan_firewall_changes(current, [
+        {"port": "22", "protocol": "tcp", "action": "allow", "source": "Anywhere"},
+        {"port": "443", "protocol": "tcp", "action": "allow"},
+    ])
+    assert [rule_spec(rule) for rule in plan["add"]] == ["allow 443/tcp"]
+    assert [rule_spec(rule) for rule in plan["delete"]] == ["allow from 10.0.0.0/8 to any port 5432 proto tcp"]
+
+
+def test_portless_and_app_profile_rules_are_unmanaged(server):
+    from ServerPilot_API.Servers.models import FirewallRule
+
+    output = "\n".join([
+        "Status: active",
+        "",
+        "     To                         Action      From",
+        "     --                         ------      ----",
+        "[ 1] Anywhere                   ALLOW IN    10.0.0.5",
+        "[ 2] OpenSSH                    ALLOW IN    Anywhere",
+        "[ 3] 80/tcp                     ALLOW IN    Anywhere",
+        "[ 4] OpenSSH (v6)               ALLOW IN    Anywhere (v6)",
+    ])
+    current = parse_ufw_numbered(output)
+    plan = plan_firewall_changes(current, [{"port": "443", "protocol": "tcp", "action": "allow"}])
+    assert [rule_spec(rule) for rule in plan["add"]] == ["allow 443/tcp"]
+    assert [rule_spec(rule) for rule in plan["delete"]] == ["allow 80/tcp"]
+
+    record_ufw_rules(server, current)
+    assert list(FirewallRule.objects.filter(server=server).values_list("port", flat=True)) == ["80"]
+
+
+def test_apply_desired_rules_in_one_session(api_client, server, monkeypatch):
+    host = FakeUfw(["allow 22/tcp", "allow from 10.0.0.0/8 to any port 5432 proto tcp"])
+    host.install(monkeypatch)
+
+    desired = [
+        {"port": "22", "protocol": "tcp", "action": "allow", "source": "any"},
+        {"port": "80", "protocol": "tcp", "action": "allow"},
+        {"port": "443", "protocol": "tcp", "action": "allow"},
+    ]
+    res = api_client.post(firewall_url(server, "apply-ufw-rules"), {"rules": desired}, format="json")
+    assert res.status_code == 200
+    assert res.data["status"] == "applied"
+    assert host.sessions == 1
+    # Adds run before deletes; unchanged rules are not touched.
+    assert host.commands == [
+        "sudo ufw status numbered",
+        "sudo ufw allow 80/tcp",
+        "sudo ufw allow 443/tcp",
+        "sudo ufw --force delete allow from 10.0.0.0/8 to any port 5432 proto tcp",
+        "sudo ufw status numbered",
+    ]
+    assert host.specs == ["allow 22/tcp", "allow 80/tcp", "allow 443/tcp"]
+
+    res = api_client.post(firewall_url(server, "apply-ufw-rules"), {"rules": desired}, format="json")
+    assert res.data["status"] == "unchanged"
+
+
+def test_apply_rolls_back_on_failure(api_client, server, monkeypatch):
+    host = FakeUfw(["allow 22/tcp"], fail_on="delete allow 22/tcp")
+    host.install(monkeypatch)
+
+    res = api_client.post(
+        firewall_url(server, "apply-ufw-rules"),
+        {"rules": [{"port": "2222", "protocol": "tcp", "action": "allow"}]},
+        format="json",
+    )
+    assert res.status_code == 409
+    assert res.data["status"] == "rolled_back"
+    assert host.specs == ["allow 22/tcp"]
+    assert host.commands[-2:] == ["sudo ufw --force delete allow 2222/tcp", "sudo ufw status numbered"]
+
+
+def test_apply_rejects_invalid_rules(api_client, server, monkeypatch):
+    FakeUfw().install(monkeypatch)
+    res = api_client.post(
+        firewall_url(server, "apply-ufw-rules"),
+        {"rules": [{"port": "22; reboot", "protocol": "tcp", "action": "allow"}]},
+        format="json",
+    )
+    assert res.status_code == 400
+
+
+def test_rules_listed_from_db_with_drift(api_client, server, monkeypatch):
+    from ServerPilot_API.Servers.models import FirewallRule
+
+    host = FakeUfw(["allow 22/tcp", "allow from 10.0.0.0/8 to any port 5432 proto tcp"]).install(monkeypatch)
+
+    # The first listing imports the host's rules.
+    res = api_client.get(firewall_url(server, "get-ufw-rules"))
+    assert res.status_code == 200
+    assert [(r["ufw_number"], r["port"], r["source"], r["drift"]) for r in res.data] == [
+        (1, "22", "0.0.0.0/0", "in_sync"), (2, "5432", "10.0.0.0/8", "in_sync"),
+    ]
+    assert host.sessions == 1
+
+    # Later listings are served from the database.
+    api_client.get(firewall_url(server, "get-ufw-rules"))
+    assert host.sessions == 1
+
+    # Out-of-band changes on the host show up as drift after a pull.
+    host.specs = ["allow 5432/udp", "allow from 10.0.0.0/8 to any port 5432 proto tcp"]
+    res = api_client.post(firewall_url(server, "sync-ufw-rules"), {}, format="json")
+    assert res.data["drift"] == {"in_sync": 1, "missing_on_host": 1, "new_on_host": 1}
+    assert set(FirewallRule.objects.filter(server=server).values_list("port", "protocol", "drift")) == {
+        ("22", "tcp", "missing_on_host"), ("5432", "tcp", "in_sync"), ("5432", "udp", "new_on_host"),
+    }
+
+    # Pushing restores the stored rules on the host.
+    res = api_client.post(firewall_url(server, "sync-ufw-rules"), {"direction": "push"}, format="json")
+    assert res.data["status"] == "applied"
+    assert sorted(host.specs) == sorted(["allow 22/tcp", "allow 5432/udp", "allow from 10.0.0.0/8 to any port 5432 proto tcp"])
+    assert set(FirewallRule.objects.filter(server=server).values_list("drift", flat=True)) == {"in_sync"}
+
+
+def test_delete_and_edit_by_rule_id_not_ufw_number(api_client, server, monkeypatch):
+    host = FakeUfw(["allow 22/tcp", "allow 80/tcp"]).install(monkeypatch)
+    rules = {r["port"]: r["id"] for r in api_client.get(firewall_url(server, "get-ufw-rules")).data}
+
+    # A rule added on the host after the sync shifts the ufw numbers.
+    host.specs.insert(0, "allow 8080/tcp")
+    res = api_client.post(firewall_url(server, "delete-ufw-rule"), {"id": rules["80"]}, format="json")
+    assert res.status_code == 200
+    assert "sudo ufw --force delete allow 80/tcp" in host.commands
+    assert host.specs == ["allow 8080/tcp", "allow 22/tcp"]
+
+    res = api_client.post(
+        firewall_url(server, "edit-ufw-rule"),
+        {"id": rules["22"], "port": "2222", "protocol": "tcp", "action": "allow"},
+        format="json",
+    )
+    assert res.status_code == 200
+    assert host.specs == ["allow 8080/tcp", "allow 2222/tcp"]
+
+    res = api_client.post(firewall_url(server, "delete-ufw-rule"), {"id": rules["22"]}, format="json")
+    assert res.status_code == 404
+
+
+def test_edit_adds_before_deleting_and_rolls_back(api_client, server, monkeypatch):
+    host = FakeUfw(["allow 22/tcp", "allow 80/tcp"]).install(monkeypatch)
+    rules = {r["port"]: r["id"] for r in api_client.get(firewall_url(server, "get-ufw-rules")).data}
+    host.fail_on = "delete allow 22/tcp"
+    host.sessions = 0
+
+    res = api_client.post(
+        firewall_url(server, "edit-ufw-rule"),
+        {"id": rules["22"], "port": "2222", "protocol": "tcp", "action": "allow"},
+        format="json",
+    )
+    assert res.status_code == 409
+    assert host.sessions == 1
+    mutations = [c for c in host.commands if c != "sudo ufw status numbered"][-3:]
+    assert mutations == [
+        "sudo ufw allow 2222/tcp", "sudo ufw --force delete allow 22/tcp", "sudo ufw --force delete allow 2222/tcp",
+    ]
+    # The old rule is never removed before its replacement exists, and the failed edit leaves it in place.
+    assert host.specs == ["allow 22/tcp", "allow 80/tcp"]
+    assert {r["port"] for r in api_client.get(firewall_url(server, "get-ufw-rules")).data} == {"22", "80"}
+
+
+def test_ipv6_only_rules_are_recorded(server):
+    from ServerPilot_API.Servers.models import FirewallRule
+
+    output = "\n".join([
+        "Status: active",
+        "",
+        "     To                         Action      From",
+        "     --                         ------      ----",
+        "[ 1] 22/tcp                     ALLOW IN    Anywhere",
+        "[ 2] 22/tcp (v6)                ALLOW IN    Anywhere (v6)",
+        "[ 3] 443/tcp                    ALLOW IN    2001:db8::/32",
+        "[ 4] 8443/tcp (v6)              ALLOW IN    Anywhere (v6)",
+    ])
+    record_ufw_rules(server, parse_ufw_numbered(output))
+    assert set(FirewallRule.objects.filter(server=server).values_list("port", "source_ip", "ufw_number")) == {
+        ("22", "0.0.0.0/0", 1), ("443", "2001:db8::/32", 3), ("8443", "0.0.0.0/0", 4),
+    }
+
+
+def test_apply_records_rules(api_client, server, monkeypatch):
+    from ServerPilot_API.Servers.models import FirewallRule
+
+    FakeUfw(["allow 22/tcp"]).install(monkeypatch)
+    api_client.get(firewall_url(server, "get-ufw-rules"))
+    res = api_client.post(
+        firewall_url(server, "apply-ufw-rules"),
+        {"rules": [{"port": "443", "protocol": "tcp", "action": "allow"}]},
+        format="json",
+    )
+    assert res.data["drift"] == {"in_sync": 1, "missing_on_host": 0, "new_on_host": 0}
+    assert list(FirewallRule.objects.filter(server=server).values_list("port", "ufw_number")) == [("443", 1)]
+
+
+def test_policy_rollout_to_customer_servers(user, server, monkeypatch):
+    from ServerPilot_API.Servers import tasks
+    from ServerPilot_API.Servers.models import FirewallPolicy, FirewallPolicyRollout, FirewallRule
+
+    user.is_staff = True
+    user.save()
+    admin = APIClient()
+    admin.force_authenticate(user=user)
+    second = Server.objects.create(customer=server.customer, server_name="S2", server_ip="127.0.0.2", trusted=True)
+    broken = Server.objects.create(customer=server.customer, server_name="S3", server_ip="127.0.0.3", trusted=True)
+    hosts = {server.id: FakeUfw(["allow 22/tcp"]), second.id: FakeUfw(["allow 8080/tcp"])}
+    monkeypatch.setattr(crypto, "_KEK", os.urandom(32))
+    ServerCredential.objects.create(server=server, username="deploy", **crypto.encrypt_secret(b"pw"))
+    credentials = {}
+
+    def ssh_session(srv, timeout=10, credential=None):
+        credentials[srv.id] = credential
+        if srv.id not in hosts:
+            raise ConnectionError("Connection refused")
+        return hosts[srv.id]
+
+    monkeypatch.setattr(Server, "ssh_session", ssh_session)
+    monkeypatch.setattr(tasks.run_firewall_policy_rollout, "delay", lambda rollout_id: tasks.run_firewall_policy_rollout(rollout_id))
+
+    res = admin.post(reverse("firewall-policy-list"), {
+        "name": "web",
+        "rules": [
+            {"port": "22", "protocol": "tcp", "action": "allow", "source": "10.0.0.0/8"},
+            {"port": "443", "protocol": "tcp", "action": "allow"},
+        ],
+        "customers": [server.customer_id],
+    }, format="json")
+    assert res.status_code == 201
+    policy_id = res.data["id"]
+
+    res = admin.post(reverse("firewall-policy-rollout", kwargs={"pk": policy_id}), {"mode": "merge"}, format="json")
+    assert res.status_code == 202
+    rollout = FirewallPolicyRollout.objects.get(pk=res.data["id"])
+    assert rollout.status == "completed_with_errors"
+    results = dict(rollout.targets.values_list("server_id", "status"))
+    assert results == {server.id: "applied", second.id: "applied", broken.id: "failed"}
+    # Credentials were read in one query and decrypted by each server's worker.
+    assert credentials == {server.id: ("deploy", b"pw"), second.id: None, broken.id: None}
+    # Merge keeps the servers' own rules.
+    assert hosts[second.id].specs == [
+        "allow 8080/tcp", "allow from 10.0.0.0/8 to any port 22 proto tcp", "allow 443/tcp",
+    ]
+    assert FirewallRule.objects.filter(server=second).count() == 3
+
+    res = admin.get(reverse("firewall-rollout-detail", kwargs={"pk": rollout.id}))
+    assert res.data["progress"] == {"applied": 2, "failed": 1}
+
+    # Replace removes rules that are not part of the policy.
+    res = admin.post(
+        reverse("firewall-policy-rollout", kwargs={"pk": policy_id}),
+        {"mode": "replace", "server_ids": [second.id]},
+        format="json",
+    )
+    assert res.data["targets"][0]["status"] in ("pending", "running", "applied")
+    assert hosts[second.id].specs == ["allow from 10.0.0.0/8 to any port 22 proto tcp", "allow 443/tcp"]
+
+
+def test_replace_rollout_keeps_ssh_rule(user, server, monkeypatch):
+    from ServerPilot_API.Servers.firewall import run_policy_rollout
+    from ServerPilot_API.Servers.models import FirewallPolicy, FirewallPolicyRollout, FirewallPolicyRolloutTarget
+
+    server.ssh_port = 2222
+    server.save()
+    host = FakeUfw(["allow 2222/tcp", "allow 8080/tcp"])
+    monkeypatch.setattr(Server, "ssh_session", lambda srv, timeout=10, credential=None: host)
+    rules = [{"port": "443", "protocol": "tcp", "action": "allow", "source": None}]
+    policy = FirewallPolicy.objects.create(name="web", rules=rules)
+    rollout = FirewallPolicyRollout.objects.create(policy=policy, rules=rules, mode="replace")
+    FirewallPolicyRolloutTarget.objects.create(rollout=rollout, server=server)
+
+    assert run_policy_rollout(rollout) == {"applied": 1}
+    assert host.specs == ["allow 2222/tcp", "allow 443/tcp"]
+
+
+def test_stale_running_rollout_targets_fail(server):
+    from datetime import timedelta
+
+    from django.utils import timezone
+
+    from ServerPilot_API.Servers import tasks
+    from ServerPilot_API.Servers.models import FirewallPolicy, FirewallPolicyRollout, FirewallPolicyRolloutTarget
+
+    second = Server.objects.create(customer=server.customer, server_name="S2", server_ip="127.0.0.2")
+    policy = FirewallPolicy.objects.create(name="web", rules=[])
+    rollout = FirewallPolicyRollout.objects.create(policy=policy, rules=[], status="running")
+    stale = FirewallPolicyRolloutTarget.objects.create(rollout=rollout, server=server, status="running")
+    FirewallPolicyRolloutTarget.objects.create(rollout=rollout, server=second, status="applied")
+    FirewallPolicyRolloutTarget.objects.filter(pk=stale.pk).update(updated_at=timezone.now() - timedelta(hours=1))
+
+    assert tasks.fail_stale_firewall_rollouts() == {"failed": 1}
+    stale.refresh_from_db()
+    rollout.refresh_from_db()
+    assert stale.status == "failed" and stale.message.startswith("Timed out")
+    assert rollout.status == "completed_with_errors" and rollout.finished_at is not None
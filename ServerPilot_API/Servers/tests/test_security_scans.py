@@ -0,0 +1,422 @@
+import pytest
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from ServerPilot_API.Users.models import CustomUser as User
+from ServerPilot_API.Customers.models import Customer
+from ServerPilot_API.Servers.findings import decode_bitmap, encode_bitmap, hash_output
+from ServerPilot_API.Servers.models import Server, SecurityScan, SecurityRecommendation
+from ServerPilot_API.security.models import SecurityRisk
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def user():
+    return User.objects.create_user(username="owner", email="owner@example.com", password="pass")
+
+
+@pytest.fixture
+def customer(user):
+    return Customer.objects.create(owner=user, email="cust@example.com")
+
+
+@pytest.fixture
+def server(customer):
+    return Server.objects.create(customer=customer, server_name="S1", server_ip="127.0.0.1", trusted=True)
+
+
+@pytest.fixture
+def api_client(user):
+    client = APIClient()
+    client.force_authenticate(user=user)
+    return client
+
+
+@pytest.fixture
+def risks():
+    root_login = SecurityRisk.objects.create(
+        title="Root SSH Login Enabled",
+        description="Root can log in over SSH.",
+        check_command="grep -E '^PermitRootLogin' /etc/ssh/sshd_config",
+        match_pattern="PermitRootLogin yes",
+        fix_command="sed -i 's/^PermitRootLogin.*/PermitRootLogin no/' /etc/ssh/sshd_config",
+        risk_level="critical",
+    )
+    firewall = SecurityRisk.objects.create(
+        title="No Firewall Enabled",
+        description="UFW is inactive.",
+        check_command="ufw status",
+        match_pattern="inactive",
+        fix_command="ufw enable",
+        risk_level="medium",
+    )
+    return root_login, firewall
+
+
+def scan_url(server, name):
+    return reverse(
+        f"server-security-advisor-{name}",
+        kwargs={"customer_pk": server.customer_id, "server_pk": server.id},
+    )
+
+
+def fake_host(outputs):
+    """Patchable connect_ssh returning canned output per check command."""
+    def connect_ssh(self, command, timeout=10, trusted=False):
+        return True, outputs.get(command, ""), 0
+    return connect_ssh
+
+
+def test_bitmap_round_trip():
+    assert encode_bitmap([]) == b""
+    assert decode_bitmap(encode_bitmap([1, 7, 8, 64])) == [1, 7, 8, 64]
+
+
+def test_scan_stores_normalised_findings(api_client, server, risks, monkeypatch):
+    root_login, firewall = risks
+    monkeypatch.setattr(Server, "connect_ssh", fake_host({
+        root_login.check_command: "PermitRootLogin yes",
+        firewall.check_command: "Status: active",
+    }))
+
+    res = api_client.post(scan_url(server, "run-security-scan"))
+    assert res.status_code == 200
+
+    scan = SecurityScan.objects.get(pk=res.data["id"])
+    row = SecurityRecommendation.objects.get(scan=scan)
+    assert row.risk_id == root_login.id
+    assert row.risk_found is True
+    assert row.title == "" and row.description == ""
+    assert row.output_hash == hash_output("PermitRootLogin yes")
+    assert decode_bitmap(scan.passed_checks) == [firewall.id]
+
+    by_risk = {item["risk"]: item for item in res.data["recommendations"]}
+    assert by_risk[root_login.id]["title"] == root_login.title
+    assert by_risk[root_login.id]["solution"] == root_login.fix_command
+    assert by_risk[firewall.id]["status"] == "passed"
+    assert by_risk[firewall.id]["title"] == f"Check Passed: {firewall.title}"
+
+
+def test_passed_rows_stored_when_bitmap_disabled(api_client, server, risks, monkeypatch, settings):
+    settings.SECURITY_SCAN_PASSED_BITMAP = False
+    monkeypatch.setattr(Server, "connect_ssh", fake_host({}))
+
+    res = api_client.post(scan_url(server, "run-security-scan"))
+    assert res.status_code == 200
+    scan = SecurityScan.objects.get(pk=res.data["id"])
+    assert bytes(scan.passed_checks) == b""
+    assert SecurityRecommendation.objects.filter(scan=scan, risk_found=False, status="passed").count() == 2
+
+
+def test_deleting_risk_keeps_finding_text(server, risks):
+    root_login, _ = risks
+    scan = SecurityScan.objects.create(server=server)
+    row = SecurityRecommendation.objects.create(scan=scan, risk=root_login, risk_level="critical")
+    assert row.fix_command == root_login.fix_command
+
+    root_login.delete()
+    row.refresh_from_db()
+    assert row.risk_id is None
+    assert row.title == "Root SSH Login Enabled"
+    assert row.fix_command == root_login.fix_command
+
+
+def test_queryset_delete_of_risks_keeps_findings(server, risks):
+    from ServerPilot_API.Servers.findings import passed_findings
+
+    root_login, firewall = risks
+    scan = SecurityScan.objects.create(server=server, passed_checks=encode_bitmap([firewall.id]))
+    found = SecurityRecommendation.objects.create(scan=scan, risk=root_login, risk_level="critical")
+    passed = SecurityRecommendation.objects.create(
+        scan=scan, risk=firewall, risk_found=False, risk_level="low", status="passed"
+    )
+
+    SecurityRisk.objects.filter(pk__in=[root_login.pk, firewall.pk]).delete()
+    found.refresh_from_db()
+    passed.refresh_from_db()
+    assert (found.risk_id, found.title, found.solution) == (None, root_login.title, root_login.fix_command)
+    assert (passed.risk_id, passed.title) == (None, f"Check Passed: {firewall.title}")
+    # Bitmap entries of deleted risks are still reported as passed checks.
+    [item] = passed_findings(scan, SecurityRisk.catalog())
+    assert item["risk"] is None and item["status"] == "passed"
+    assert item["title"] == f"Check Passed: deleted check #{firewall.id}"
+
+
+def test_consecutive_scans_store_only_deltas(api_client, server, risks, monkeypatch):
+    root_login, firewall = risks
+    outputs = {root_login.check_command: "PermitRootLogin yes", firewall.check_command: "Status: active"}
+    monkeypatch.setattr(Server, "connect_ssh", fake_host(outputs))
+    first = api_client.post(scan_url(server, "run-security-scan")).data["id"]
+    second = api_client.post(scan_url(server, "run-security-scan")).data["id"]
+
+    # Unchanged findings are carried forward instead of copied.
+    assert SecurityRecommendation.objects.filter(scan__server=server).count() == 1
+    assert SecurityRecommendation.objects.filter(scan_id=second).count() == 0
+
+    outputs[root_login.check_command] = "PermitRootLogin no"
+    outputs[firewall.check_command] = "Status: inactive"
+    third = api_client.post(scan_url(server, "run-security-scan")).data["id"]
+
+    res = api_client.get(scan_url(server, "scan-diff"), {"from": first, "to": third})
+    assert res.status_code == 200
+    assert [item["risk"] for item in res.data["new"]] == [firewall.id]
+    assert [item["risk"] for item in res.data["resolved"]] == [root_login.id]
+
+    # Reversed direction swaps new and resolved.
+    res = api_client.get(scan_url(server, "scan-diff"), {"from": third, "to": first})
+    assert [item["risk"] for item in res.data["new"]] == [root_login.id]
+
+    # Historic scans are reconstructed from the intervals.
+    scan = api_client.get(scan_url(server, "latest-security-scan")).data
+    assert scan["id"] == third
+    statuses = {item["risk"]: item["status"] for item in scan["recommendations"]}
+    assert statuses == {firewall.id: "pending", root_login.id: "passed"}
+
+
+def test_deleting_scans_keeps_findings_of_remaining_scans(api_client, server, risks, monkeypatch):
+    from ServerPilot_API.Servers.findings import scan_findings
+
+    root_login, firewall = risks
+    outputs = {root_login.check_command: "PermitRootLogin yes", firewall.check_command: "Status: active"}
+    monkeypatch.setattr(Server, "connect_ssh", fake_host(outputs))
+    first = api_client.post(scan_url(server, "run-security-scan")).data["id"]
+    second = api_client.post(scan_url(server, "run-security-scan")).data["id"]
+    outputs[root_login.check_command] = "PermitRootLogin no"
+    third = api_client.post(scan_url(server, "run-security-scan")).data["id"]
+    finding = SecurityRecommendation.objects.get(scan__server=server, risk=root_login, risk_found=True)
+    assert (finding.scan_id, finding.resolved_in_id) == (first, third)
+
+    # The scan that first observed the finding goes; the later scan reporting it keeps it.
+    SecurityScan.objects.filter(pk=first).delete()
+    finding.refresh_from_db()
+    assert finding.scan_id == second
+    assert finding in scan_findings(SecurityScan.objects.get(pk=second))
+
+    # The scan that resolved it goes; the finding is open again at the latest scan.
+    SecurityScan.objects.get(pk=third).delete()
+    finding.refresh_from_db()
+    assert finding.resolved_in_id is None
+
+    # A finding reported by no remaining scan is deleted with its scan.
+    SecurityScan.objects.get(pk=second).delete()
+    assert not SecurityRecommendation.objects.filter(scan__server=server).exists()
+
+
+def test_fixed_finding_reopened_when_still_present(api_client, server, risks, monkeypatch):
+    root_login, firewall = risks
+    outputs = {root_login.check_command: "PermitRootLogin yes"}
+    monkeypatch.setattr(Server, "connect_ssh", fake_host(outputs))
+    api_client.post(scan_url(server, "run-security-scan"))
+    finding = SecurityRecommendation.objects.get(risk=root_login)
+    finding.status = "fixed"
+    finding.save()
+
+    second = api_client.post(scan_url(server, "run-security-scan")).data["id"]
+    finding.refresh_from_db()
+    assert finding.status == "pending"
+    assert SecurityScan.objects.get(pk=second).changes == [
+        {"id": finding.id, "risk": root_login.id, "status": ["fixed", "pending"]}
+    ]
+
+    res = api_client.get(scan_url(server, "scan-diff"), {"to": second})
+    assert res.data["changed"][0]["status"] == ["fixed", "pending"]
+
+
+class FakeSession:
+    def __init__(self, exit_codes, drop_on=None):
+        self.exit_codes = exit_codes
+        self.drop_on = drop_on
+        self.commands = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def run(self, command, timeout=None, trusted=False):
+        assert not trusted
+        self.commands.append(command)
+        if command == self.drop_on:
+            raise ConnectionError("Connection lost")
+        return True, "", self.exit_codes.get(command, 0)
+
+
+def test_batch_fix_orders_by_dependency_in_one_session(api_client, server, risks, monkeypatch):
+    root_login, firewall = risks
+    install = SecurityRisk.objects.create(
+        title="UFW Not Installed", description="", check_command="which ufw", match_pattern="",
+        fix_command="apt-get install -y ufw", risk_level="medium",
+    )
+    firewall.depends_on.add(install)
+    scan = SecurityScan.objects.create(server=server)
+    enable_rec = SecurityRecommendation.objects.create(scan=scan, risk=firewall, risk_level="medium")
+    root_rec = SecurityRecommendation.objects.create(scan=scan, risk=root_login, risk_level="critical")
+    install_rec = SecurityRecommendation.objects.create(scan=scan, risk=install, risk_level="medium")
+
+    sessions = []
+
+    def ssh_session(self, timeout=10):
+        sessions.append(FakeSession({"apt-get install -y ufw": 100}))
+        return sessions[-1]
+
+    monkeypatch.setattr(Server, "ssh_session", ssh_session)
+    res = api_client.post(
+        scan_url(server, "fix-recommendations"),
+        {"recommendation_ids": [enable_rec.id, root_rec.id, install_rec.id, 9999]},
+        format="json",
+    )
+    assert res.status_code == 200
+    assert len(sessions) == 1
+    # Install runs first, the config change next; enabling ufw is skipped because its dependency failed.
+    assert sessions[0].commands == ["apt-get install -y ufw", root_login.fix_command]
+    statuses = {item["id"]: item["status"] for item in res.data["results"]}
+    assert statuses == {9999: "error", install_rec.id: "failed", root_rec.id: "fixed", enable_rec.id: "skipped"}
+    root_rec.refresh_from_db()
+    enable_rec.refresh_from_db()
+    assert root_rec.status == "fixed" and enable_rec.status == "pending"
+
+
+def test_batch_fix_saves_applied_fixes_when_session_drops(api_client, server, risks, monkeypatch):
+    root_login, firewall = risks
+    scan = SecurityScan.objects.create(server=server)
+    root_rec = SecurityRecommendation.objects.create(scan=scan, risk=root_login, risk_level="critical")
+    enable_rec = SecurityRecommendation.objects.create(scan=scan, risk=firewall, risk_level="medium")
+    monkeypatch.setattr(Server, "ssh_session", lambda self, timeout=10: FakeSession({}, drop_on="ufw --force enable"))
+
+    res = api_client.post(
+        scan_url(server, "fix-recommendations"), {"recommendation_ids": [root_rec.id, enable_rec.id]}, format="json",
+    )
+    assert res.status_code == 400
+    root_rec.refresh_from_db()
+    enable_rec.refresh_from_db()
+    assert root_rec.status == "fixed" and enable_rec.status == "pending"
+
+
+
+class FakeChannelFile:
+    class channel:
+        @staticmethod
+        def recv_exit_status():
+            return 0
+
+    def read(self):
+        return b""
+
+
+class FakeSSHClient:
+    """Paramiko client stand-in recording the commands Server._run_on_client executes."""
+
+    def __init__(self):
+        self.commands = []
+
+    def exec_command(self, command, timeout=None, get_pty=False):
+        self.commands.append(command)
+        return None, FakeChannelFile(), FakeChannelFile()
+
+
+def test_batch_fix_enables_ufw_untrusted(api_client, server, risks, monkeypatch):
+    from contextlib import nullcontext
+
+    from ServerPilot_API.Servers.models import SSHSession
+
+    _, firewall = risks
+    scan = SecurityScan.objects.create(server=server)
+    enable_rec = SecurityRecommendation.objects.create(scan=scan, risk=firewall, risk_level="medium")
+    client = FakeSSHClient()
+    monkeypatch.setattr(Server, "ssh_session", lambda self, timeout=10: nullcontext(SSHSession(client)))
+
+    res = api_client.post(scan_url(server, "fix-recommendations"), {"recommendation_ids": [enable_rec.id]}, format="json")
+    assert res.status_code == 200
+    assert [item["status"] for item in res.data["results"]] == ["fixed"]
+    # The confirmation prompt is skipped without a pipe, which untrusted commands may not contain.
+    assert client.commands == ["ufw --force enable"]
+
+
+def test_compliance_matrix(api_client, user, server, risks, monkeypatch, settings, django_capture_on_commit_callbacks):
+    settings.CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+    root_login, firewall = risks
+    other = Server.objects.create(customer=server.customer, server_name="S2", server_ip="127.0.0.2", trusted=True)
+    outputs = {root_login.check_command: "PermitRootLogin yes", firewall.check_command: "Status: active"}
+    monkeypatch.setattr(Server, "connect_ssh", fake_host(outputs))
+    api_client.post(scan_url(server, "run-security-scan"))
+
+    url = reverse("compliance-matrix")
+    res = api_client.get(url)
+    assert res.status_code == 200
+    codes = res.data["codes"]
+    assert res.data["servers"] == [[server.id, "S1"], [other.id, "S2"]]
+    assert [risk[0] for risk in res.data["risks"]] == [root_login.id, firewall.id]
+    assert [[codes[int(c)] for c in row] for row in res.data["rows"]] == [
+        ["pending", "passed"], ["unknown", "unknown"],
+    ]
+
+    # A completed scan invalidates the cached matrix.
+    outputs[firewall.check_command] = "Status: inactive"
+    api_client.post(scan_url(server, "run-security-scan"))
+    row = api_client.get(url).data["rows"][0]
+    assert [codes[int(c)] for c in row] == ["pending", "pending"]
+
+    # Findings resolved by a server's latest scan are closed although other servers' scans are older.
+    api_client.post(scan_url(other, "run-security-scan"))
+    outputs[root_login.check_command] = "PermitRootLogin no"
+    api_client.post(scan_url(server, "run-security-scan"))
+    rows = api_client.get(url).data["rows"]
+    assert [[codes[int(c)] for c in row] for row in rows] == [["passed", "pending"], ["pending", "pending"]]
+
+    # So does renaming a server.
+    with django_capture_on_commit_callbacks(execute=True):
+        other.server_name = "S2 renamed"
+        other.save()
+    assert api_client.get(url).data["servers"][1] == [other.id, "S2 renamed"]
+
+    # Users only see servers of their own customers.
+    stranger = User.objects.create_user(username="stranger", email="s@example.com", password="pass")
+    api_client.force_authenticate(user=stranger)
+    assert api_client.get(url).data["rows"] == []
+
+    # Handing the customer over to another owner invalidates both owners' matrices.
+    with django_capture_on_commit_callbacks(execute=True):
+        server.customer.owner = stranger
+        server.customer.save()
+    assert len(api_client.get(url).data["rows"]) == 2
+
+
+def test_scan_list_summaries_and_paginated_recommendations(api_client, server, risks, monkeypatch):
+    root_login, firewall = risks
+    outputs = {root_login.check_command: "PermitRootLogin yes", firewall.check_command: "Status: active"}
+    monkeypatch.setattr(Server, "connect_ssh", fake_host(outputs))
+    first = api_client.post(scan_url(server, "run-security-scan")).data["id"]
+    outputs[firewall.check_command] = "Status: inactive"
+    second = api_client.post(scan_url(server, "run-security-scan")).data["id"]
+
+    res = api_client.get(scan_url(server, "scans"))
+    assert res.status_code == 200
+    assert res.data["count"] == 2
+    summaries = {scan["id"]: scan["summary"] for scan in res.data["results"]}
+    assert "recommendations" not in res.data["results"][0]
+    assert summaries[first] == {
+        "total": 2,
+        "by_risk_level": {"critical": 1, "low": 1},
+        "by_status": {"pending": 1, "passed": 1},
+    }
+    assert summaries[second] == {
+        "total": 2,
+        "by_risk_level": {"critical": 1, "medium": 1},
+        "by_status": {"pending": 2},
+    }
+
+    res = api_client.get(scan_url(server, "recommendations"), {"scan": first, "page_size": 1})
+    assert res.data["count"] == 2
+    assert [item["risk"] for item in res.data["results"]] == [root_login.id]
+    assert res.data["results"][0]["title"] == root_login.title
+    # The passed check from the scan's bitmap follows the stored findings.
+    res = api_client.get(scan_url(server, "recommendations"), {"scan": first, "page_size": 1, "page": 2})
+    assert [(item["risk"], item["status"]) for item in res.data["results"]] == [(firewall.id, "passed")]
+
+    res = api_client.get(scan_url(server, "recommendations"), {"scan": first, "status": "passed"})
+    assert [item["risk"] for item in res.data["results"]] == [firewall.id]
+
+    res = api_client.get(scan_url(server, "recommendations"), {"risk_level": "medium"})
+    assert [item["risk"] for item in res.data["results"]] == [firewall.id]
@@ -0,0 +1,139 @@
+import pytest
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from ServerPilot_API.Users.models import CustomUser as User
+from ServerPilot_API.Customers.models import Customer
+from ServerPilot_API.Servers.facts import SECTION_MARKER, parse_facts
+from ServerPilot_API.Servers.models import Server, SecurityScan, SecurityRecommendation, ServerFacts
+from ServerPilot_API.Servers.tasks import reevaluate_fact_rules
+from ServerPilot_API.security.models import SecurityRisk
+from ServerPilot_API.security.rules import RuleError, evaluate_rule, validate_rule
+
+pytestmark = pytest.mark.django_db
+
+COLLECTOR_OUTPUT = "\n".join([
+    f"{SECTION_MARKER}sshd_config",
+    "port 22",
+    "permitrootlogin yes",
+    "PasswordAuthentication no",
+    "Match User backup",
+    "permitrootlogin no",
+    f"{SECTION_MARKER}sysctl",
+    "net.ipv4.ip_forward = 1",
+    "kernel.randomize_va_space = 2",
+    f"{SECTION_MARKER}sockets",
+    "tcp   LISTEN 0      128          0.0.0.0:22        0.0.0.0:*",
+    "tcp   LISTEN 0      128             [::]:3306         [::]:*",
+    "udp   UNCONN 0      0          127.0.0.1:323       0.0.0.0:*",
+    f"{SECTION_MARKER}packages",
+    "openssh-server 1:8.9p1-3",
+    "telnetd 0.17-44",
+    f"{SECTION_MARKER}ufw",
+    "Status: active",
+    "Default: deny (incoming), allow (outgoing), disabled (routed)",
+    "To                         Action      From",
+    "--                         ------      ----",
+    "22/tcp                     ALLOW IN    Anywhere",
+    f"{SECTION_MARKER}file_permissions",
+    "/etc/shadow 640 root shadow",
+    "/etc/issue.net 644 root root",
+])
+
+
+@pytest.fixture
+def user():
+    return User.objects.create_user(username="owner", email="owner@example.com", password="pass")
+
+
+@pytest.fixture
+def server(user):
+    customer = Customer.objects.create(owner=user, email="cust@example.com")
+    return Server.objects.create(customer=customer, server_name="S1", server_ip="127.0.0.1", trusted=True)
+
+
+@pytest.fixture
+def api_client(user):
+    client = APIClient()
+    client.force_authenticate(user=user)
+    return client
+
+
+@pytest.fixture
+def root_login_risk():
+    return SecurityRisk.objects.create(
+        title="Root SSH Login Enabled",
+        description="Root can log in over SSH.",
+        check_command="",
+        match_pattern="",
+        fact_rule={"fact": "sshd_config.permitrootlogin", "op": "eq", "value": "yes"},
+        risk_level="critical",
+    )
+
+
+def test_parse_facts():
+    facts = parse_facts(COLLECTOR_OUTPUT)
+    assert facts["sshd_config"] == {"port": "22", "permitrootlogin": "yes", "passwordauthentication": "no"}
+    assert facts["sysctl"]["net.ipv4.ip_forward"] == "1"
+    assert facts["listening_ports"] == [22, 323, 3306]
+    assert {"proto": "tcp", "address": "::", "port": 3306} in facts["sockets"]
+    assert facts["packages"]["telnetd"] == "0.17-44"
+    assert facts["ufw"]["status"] == "active"
+    assert facts["ufw"]["default_incoming"] == "deny"
+    assert facts["ufw"]["rules"] == ["22/tcp  ALLOW IN  Anywhere"]
+    assert facts["file_permissions"]["/etc/shadow"] == {"mode": "640", "owner": "root", "group": "shadow"}
+
+
+def test_evaluate_rules():
+    facts = parse_facts(COLLECTOR_OUTPUT)
+    assert evaluate_rule({"fact": "sysctl.net.ipv4.ip_forward", "op": "eq", "value": 1}, facts)
+    assert evaluate_rule({"fact": "file_permissions./etc/issue.net.mode", "op": "eq", "value": "644"}, facts)
+    assert evaluate_rule({"fact": "packages.telnetd", "op": "exists"}, facts)
+    assert evaluate_rule({"any": [
+        {"fact": "listening_ports", "op": "contains", "value": 23},
+        {"fact": "listening_ports", "op": "contains", "value": 3306},
+    ]}, facts)
+    assert not evaluate_rule({"not": {"fact": "ufw.status", "op": "eq", "value": "active"}}, facts)
+    # Missing facts never match a comparison.
+    assert not evaluate_rule({"fact": "sysctl.missing.key", "op": "ne", "value": "1"}, facts)
+
+    with pytest.raises(RuleError):
+        validate_rule({"fact": "ufw.status", "op": "like", "value": "x"})
+    with pytest.raises(RuleError):
+        validate_rule({"all": []})
+
+
+def test_scan_evaluates_fact_rules_with_one_connection(api_client, server, root_login_risk, monkeypatch):
+    commands = []
+
+    def connect_ssh(self, command, timeout=10, trusted=False):
+        commands.append(command)
+        return True, COLLECTOR_OUTPUT, 0
+
+    monkeypatch.setattr(Server, "connect_ssh", connect_ssh)
+    url = reverse(
+        "server-security-advisor-run-security-scan",
+        kwargs={"customer_pk": server.customer_id, "server_pk": server.id},
+    )
+    res = api_client.post(url)
+    assert res.status_code == 200
+    assert len(commands) == 1
+    assert ServerFacts.objects.get(server=server).facts["sshd_config"]["permitrootlogin"] == "yes"
+    finding = SecurityRecommendation.objects.get(scan_id=res.data["id"])
+    assert finding.risk_id == root_login_risk.id and finding.risk_found
+
+
+def test_reevaluate_changed_rule_without_ssh(server, root_login_risk, monkeypatch):
+    ServerFacts.objects.create(server=server, facts=parse_facts(COLLECTOR_OUTPUT), collected_at="2024-01-01T00:00Z")
+    monkeypatch.setattr(Server, "connect_ssh", lambda *args, **kwargs: pytest.fail("SSH must not be used"))
+
+    assert reevaluate_fact_rules() == {"servers": 1, "risks": 1}
+    assert SecurityRecommendation.objects.filter(risk=root_login_risk, resolved_in__isnull=True).exists()
+
+    root_login_risk.fact_rule = {"fact": "sshd_config.permitrootlogin", "op": "eq", "value": "without-password"}
+    root_login_risk.save()
+    reevaluate_fact_rules([root_login_risk.id])
+
+    latest = SecurityScan.objects.filter(server=server).latest("id")
+    assert not SecurityRecommendation.objects.filter(risk=root_login_risk, resolved_in__isnull=True).exists()
+    assert latest.status == "completed"
@@ -0,0 +1,202 @@
+import json
+import os
+
+import asyncssh
+import pytest
+from channels.db import database_sync_to_async
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from rest_framework_simplejwt.tokens import AccessToken
+
+from ServerPilot_API.Users.models import CustomUser as User
+from ServerPilot_API.Customers.models import Customer
+from ServerPilot_API.Servers.models import Server, ServerCredential
+from ServerPilot_API.Servers.routing import websocket_urlpatterns
+from ServerPilot_API.Servers.ssh_terminal.auth import JwtAuthMiddleware
+from ServerPilot_API.Servers.ssh_terminal.pool import ssh_pool
+from ServerPilot_API.security import crypto
+
+# The consumer queries from worker threads, which only see committed data
+pytestmark = pytest.mark.django_db(transaction=True)
+
+PASSWORD = "s3cret"
+
+
+class EchoServer(asyncssh.SSHServer):
+    connections = 0
+
+    def connection_made(self, conn):
+        EchoServer.connections += 1
+
+    def begin_auth(self, username):
+        return True
+
+    def password_auth_supported(self):
+        return True
+
+    def validate_password(self, username, password):
+        return password == PASSWORD
+
+
+async def echo_shell(process):
+    process.stdout.write("ready\n")
+    try:
+        async for line in process.stdin:
+            process.stdout.write(f"echo:{line}")
+        process.exit(0)
+    except (asyncssh.Error, OSError):
+        # The client closed the channel
+        pass
+
+
+@pytest.fixture(autouse=True)
+def master_key(monkeypatch):
+    monkeypatch.setattr(crypto, "_KEK", os.urandom(32))
+
+
+@pytest.fixture(autouse=True)
+def in_memory_channel_layer(settings):
+    settings.CHANNEL_LAYERS = {"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}}
+
+
+@pytest.fixture
+async def ssh_server():
+    host_key = asyncssh.generate_private_key("ssh-ed25519")
+    EchoServer.connections = 0
+    acceptor = await asyncssh.create_server(
+        EchoServer, "127.0.0.1", 0, server_host_keys=[host_key], process_factory=echo_shell,
+        line_editor=False,
+    )
+    port = acceptor.sockets[0].getsockname()[1]
+    yield port, host_key.get_fingerprint("sha256")
+    for server_id in list(ssh_pool.stats()):
+        ssh_pool.invalidate(server_id)
+    acceptor.close()
+    await acceptor.wait_closed()
+
+
+@database_sync_to_async
+def create_server(port, fingerprint, username="owner"):
+    user = User.objects.create_user(username=username, email=f"{username}@example.com", password="pass")
+    customer = Customer.objects.create(owner=user, email=f"cust-{username}@example.com")
+    server = Server.objects.create(
+        customer=customer, server_name="S1", server_ip="127.0.0.1", ssh_port=port, trusted=True,
+        stored_fingerprint={"sha256": fingerprint, "hex": "aa:bb"},
+    )
+    enc = crypto.encrypt_secret(PASSWORD.encode())
+    ServerCredential.objects.create(server=server, username="deploy", **enc)
+    return user, server
+
+
+@database_sync_to_async
+def create_user(username):
+    return User.objects.create_user(username=username, email=f"{username}@example.com", password="pass")
+
+
+def communicator(server_id, user=None, query=""):
+    path = f"/ws/servers/{server_id}/ssh/{query}"
+    subprotocols = ["jwt", str(AccessToken.for_user(user))] if user is not None else None
+    return WebsocketCommunicator(JwtAuthMiddleware(URLRouter(websocket_urlpatterns)), path, subprotocols=subprotocols)
+
+
+async def read_output_until(comm, text, timeout=5):
+    output = ""
+    while text not in output:
+        message = json.loads(await comm.receive_from(timeout=timeout))
+        if message["type"] == "output":
+            output += message["output"]
+    return output
+
+
+async def test_terminals_share_a_pooled_connection(ssh_server):
+    port, fingerprint = ssh_server
+    user, server = await create_server(port, fingerprint)
+
+    first = communicator(server.id, user)
+    connected, subprotocol = await first.connect()
+    assert connected and subprotocol == "jwt"
+    assert json.loads(await first.receive_from()) == {"type": "output_mode", "mode": "json"}
+    await read_output_until(first, "ready")
+
+    second = communicator(server.id, user, "?output=binary")
+    connected, _ = await second.connect()
+    assert connected
+    assert json.loads(await second.receive_from()) == {"type": "output_mode", "mode": "binary"}
+    assert b"ready" in await second.receive_from(timeout=5)
+
+    assert ssh_pool.stats() == {server.id: [2]}
+    assert EchoServer.connections == 1
+
+    await first.send_to(text_data=json.dumps({"type": "cmd", "payload": "hello\n"}))
+    assert "echo:hello" in await read_output_until(first, "echo:hello")
+
+    await first.disconnect()
+    await second.disconnect()
+    # The connection stays open for the next terminal.
+    assert ssh_pool.stats() == {server.id: [0]}
+
+    third = communicator(server.id, user)
+    connected, _ = await third.connect()
+    assert connected
+    await third.receive_from()
+    await read_output_until(third, "ready")
+    assert EchoServer.connections == 1
+    await third.disconnect()
+
+
+async def test_rejects_anonymous_and_foreign_users(ssh_server):
+    port, fingerprint = ssh_server
+    _owner, server = await create_server(port, fingerprint)
+    other = await create_user("other")
+
+    connected, _ = await communicator(server.id).connect()
+    assert not connected
+    connected, _ = await communicator(server.id, other).connect()
+    assert not connected
+    assert EchoServer.connections == 0
+
+
+async def test_invalidate_retires_pooled_connections(ssh_server):
+    port, fingerprint = ssh_server
+    user, server = await create_server(port, fingerprint)
+
+    comm = communicator(server.id, user)
+    await comm.connect()
+    await comm.receive_from()
+    await read_output_until(comm, "ready")
+
+    ssh_pool.invalidate(server.id)
+    # The open terminal keeps working; new terminals get a new connection.
+    await comm.send_to(text_data=json.dumps({"type": "cmd", "payload": "still\n"}))
+    await read_output_until(comm, "echo:still")
+
+    other = communicator(server.id, user)
+    await other.connect()
+    await other.receive_from()
+    await read_output_until(other, "ready")
+    assert EchoServer.connections == 2
+
+    await comm.disconnect()
+    await other.disconnect()
+    assert ssh_pool.stats() == {server.id: [0]}
+
+
+async def test_refuses_host_key_mismatch(ssh_server, monkeypatch):
+    port, _fingerprint = ssh_server
+    user, server = await create_server(port, "SHA256:not-the-key")
+    rechecked = []
+    monkeypatch.setattr(
+        Server, "_verify_or_alert_fingerprint",
+        lambda self, timeout=10: rechecked.append(self.id) or (False, {}, None),
+    )
+
+    comm = communicator(server.id, user)
+    connected, _ = await comm.connect()
+    assert connected
+    await comm.receive_from()
+    message = json.loads(await comm.receive_from(timeout=5))
+    assert message["type"] == "error"
+    assert "fingerprint mismatch" in message["message"]
+    assert (await comm.receive_output(timeout=5))["type"] == "websocket.close"
+    assert rechecked == [server.id]
+    assert not ssh_pool.stats().get(server.id)
@@ -7,13 +7,15 @@
 
 from django.urls import path, include
 from rest_framework_nested import routers
-from .views import ServerViewSet
+from .views import ComplianceMatrixView, FirewallPolicyRolloutViewSet, FirewallPolicyViewSet, ServerViewSet, SshTargetView
 from ServerPilot_API.Customers.views import CustomerViewSet
 
 # Using drf-nested-routers to create nested URLs like /customers/{customer_pk}/servers/
 # The main router is for customers
 router = routers.DefaultRouter()
 router.register(r'customers', CustomerViewSet, basename='customer')
+router.register(r'firewall-policies', FirewallPolicyViewSet, basename='firewall-policy')
+router.register(r'firewall-rollouts', FirewallPolicyRolloutViewSet, basename='firewall-rollout')
 
 # The nested router is for servers, under customers
 servers_router = routers.NestedDefaultRouter(router, r'customers', lookup='customer')
@@ -24,6 +26,9 @@ servers_router.register(r'servers', ServerViewSet, basename='customer-servers')
 # The basename 'customer-servers' is important for URL reversing.
 
 urlpatterns = [
+    path('compliance-matrix/', ComplianceMatrixView.as_view(), name='compliance-matrix'),
+    # Used by the WebSocket SSH proxy only (requires X-Internal-Token)
+    path('internal/ssh-targets/<int:pk>/', SshTargetView.as_view(), name='internal-ssh-target'),
     path('', include(router.urls)),
     path('', include(servers_router.urls)),
     # Explicit credentials endpoints (also available via router action URLs)
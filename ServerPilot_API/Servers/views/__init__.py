@@ -3,3 +3,6 @@ from .firewall_rules_view import FirewallRuleViewSet
 from .installed_applications_view import InstalledApplicationViewSet
 from .server_info_view import ServerInfoViewSet
 from .security_advisor_view import SecurityAdvisorViewSet
+from .compliance_view import ComplianceMatrixView
+from .firewall_policy_view import FirewallPolicyViewSet, FirewallPolicyRolloutViewSet
+from .ssh_target_view import SshTargetView
@@ -0,0 +1,33 @@
+import logging
+
+from rest_framework import permissions, status
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from ServerPilot_API.Servers.compliance import compliance_matrix
+from ServerPilot_API.Servers.models import Server
+
+logger = logging.getLogger(__name__)
+
+
+class ComplianceMatrixView(APIView):
+    """
+    Latest status of every enabled security risk on every server the user can access,
+    taken from each server's latest completed scan.
+    e.g., GET /api/servers/compliance-matrix/
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, *args, **kwargs) -> Response:
+        user = request.user
+        if user.is_staff:
+            servers, scope = Server.objects.all(), 'all'
+        else:
+            servers, scope = Server.objects.filter(customer__owner=user), f'user:{user.id}'
+
+        try:
+            matrix = compliance_matrix(servers, scope)
+        except Exception as e:
+            logger.error(f"Error building compliance matrix for user {user.id}: {e}", exc_info=True)
+            return Response({'status': 'error', 'message': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        return Response(matrix, status=status.HTTP_200_OK)
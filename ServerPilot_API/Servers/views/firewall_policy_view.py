@@ -0,0 +1,92 @@
+import logging
+
+from rest_framework import permissions, status, viewsets
+from rest_framework.decorators import action
+from rest_framework.response import Response
+
+from ServerPilot_API.Servers.models import (
+    FirewallPolicy,
+    FirewallPolicyRollout,
+    FirewallPolicyRolloutTarget,
+)
+from ServerPilot_API.Servers.serializers import FirewallPolicyRolloutSerializer, FirewallPolicySerializer
+from ServerPilot_API.Servers.tasks import run_firewall_policy_rollout
+from ServerPilot_API.audit_log.services import log_action
+
+logger = logging.getLogger(__name__)
+
+
+class FirewallPolicyViewSet(viewsets.ModelViewSet):
+    """
+    API endpoint for fleet firewall policy templates.
+    A policy holds a rule set and is assigned to customers and/or servers; a rollout
+    pushes it to all assigned servers in parallel.
+    e.g., /api/servers/firewall-policies/
+    """
+    queryset = FirewallPolicy.objects.all().prefetch_related('customers', 'servers')
+    serializer_class = FirewallPolicySerializer
+    permission_classes = [permissions.IsAdminUser]
+
+    @action(detail=True, methods=['post'], url_path='rollout')
+    def rollout(self, request, pk=None):
+        """
+        Starts pushing the policy to its servers.
+        'mode' is 'merge' (default: only add missing rules) or 'replace' (remove other rules);
+        'server_ids' optionally limits the rollout to some of the assigned servers.
+        """
+        policy = self.get_object()
+        mode = request.data.get('mode', 'merge')
+        server_ids = request.data.get('server_ids')
+
+        if mode not in dict(FirewallPolicyRollout.MODE_CHOICES):
+            return Response({'error': "mode must be 'merge' or 'replace'."}, status=status.HTTP_400_BAD_REQUEST)
+        if server_ids is not None and not isinstance(server_ids, list):
+            return Response({'error': 'server_ids must be a list.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        servers = policy.target_servers()
+        if server_ids is not None:
+            servers = servers.filter(id__in=server_ids)
+        server_ids = list(servers.values_list('id', flat=True))
+        if not server_ids:
+            return Response({'error': 'The policy is not assigned to any active server.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        rollout = FirewallPolicyRollout.objects.create(
+            policy=policy, mode=mode, rules=policy.rules, started_by=request.user
+        )
+        FirewallPolicyRolloutTarget.objects.bulk_create(
+            FirewallPolicyRolloutTarget(rollout=rollout, server_id=server_id) for server_id in server_ids
+        )
+        try:
+            run_firewall_policy_rollout.delay(rollout.id)
+        except Exception as e:
+            logger.error(f"Failed to queue firewall policy rollout {rollout.id}: {e}", exc_info=True)
+            rollout.delete()
+            return Response(
+                {'error': f'Failed to start rollout task: {str(e)}'},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+        log_action(
+            request.user,
+            'firewall_policy_rollout',
+            request,
+            f'Rollout of firewall policy "{policy.name}" ({mode}) started on {len(server_ids)} servers'
+        )
+        return Response(FirewallPolicyRolloutSerializer(rollout).data, status=status.HTTP_202_ACCEPTED)
+
+    @action(detail=True, methods=['get'], url_path='rollouts')
+    def rollouts(self, request, pk=None):
+        """Lists the rollouts of the policy, newest first, with per-server progress."""
+        policy = self.get_object()
+        rollouts = policy.rollouts.prefetch_related('targets__server')
+        return Response(FirewallPolicyRolloutSerializer(rollouts, many=True).data, status=status.HTTP_200_OK)
+
+
+class FirewallPolicyRolloutViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Read-only access to firewall policy rollouts and their per-server results.
+    e.g., /api/servers/firewall-rollouts/<id>/
+    """
+    queryset = FirewallPolicyRollout.objects.all().prefetch_related('targets__server')
+    serializer_class = FirewallPolicyRolloutSerializer
+    permission_classes = [permissions.IsAdminUser]
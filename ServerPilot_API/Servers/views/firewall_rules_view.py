@@ -1,10 +1,20 @@
-import re
 import logging
+from django.db.models import F
 from django.http import Http404
 from rest_framework import viewsets, permissions, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from ServerPilot_API.Servers.models import Server
+from ServerPilot_API.Servers.firewall import (
+    FirewallRuleError,
+    apply_firewall_rules,
+    build_delete_command,
+    build_rule_command,
+    push_firewall_rules,
+    record_ufw_rules,
+    row_rule,
+    sync_firewall_rules,
+)
+from ServerPilot_API.Servers.models import FirewallRule, Server
 from ServerPilot_API.Servers.permissions import IsOwnerOrAdmin
 from ServerPilot_API.audit_log.services import log_action
 
@@ -39,6 +49,37 @@ class FirewallRuleViewSet(viewsets.ViewSet):
             logger.warning(f"Server with PK {pk_or_server_pk} not found.")
             raise Http404("Server not found.")
 
+    def _get_rule_object(self, server, rule_id):
+        """
+        Helper method to retrieve one of the server's FirewallRule rows by its primary key.
+
+        Raises:
+            Http404: If the rule does not exist on this server.
+        """
+        try:
+            return FirewallRule.objects.get(pk=int(rule_id), server=server)
+        except (FirewallRule.DoesNotExist, TypeError, ValueError):
+            logger.warning(f"Firewall rule {rule_id!r} not found on server {server.id}.")
+            raise Http404("Firewall rule not found.")
+
+    def _delete_rule_on_host(self, server, rule):
+        """
+        Deletes the host rule matching a FirewallRule row by its specification, not by
+        its ufw number, which shifts whenever the host's rules change after a sync.
+        Rows already missing on the host have nothing to delete.
+
+        Returns:
+            tuple: (output, error_message) as for `_execute_ssh_command`.
+
+        Raises:
+            FirewallRuleError: If the stored rule is not a valid UFW rule.
+        """
+        command = build_delete_command(row_rule(rule))
+        if rule.drift == 'missing_on_host':
+            rule.delete()
+            return '', None
+        return self._execute_ssh_command(server, command)
+
     def _execute_ssh_command(self, server, command):
         """
         Helper method to execute an SSH command on a given server.
@@ -83,17 +124,11 @@ class FirewallRuleViewSet(viewsets.ViewSet):
 
         Returns:
             str: The constructed UFW command.
+
+        Raises:
+            FirewallRuleError: If one of the values is not a valid UFW rule field.
         """
-        command = f'sudo ufw {action} '
-        if source and source.lower() not in ['anywhere', 'any', '0.0.0.0/0', '']:
-            command += f'from {source} to any port {port}'
-            if protocol and not protocol.startswith('custom'):
-                command += f' proto {protocol}'
-        else:
-            command += f'{port}'
-            if protocol and not protocol.startswith('custom'):
-                command += f'/{protocol}'
-        return command
+        return build_rule_command(action, port, protocol, source)
 
     @action(detail=False, methods=['post'], url_path='toggle')
     def toggle_firewall(self, request, pk=None, customer_pk=None, server_pk=None):
@@ -130,52 +165,86 @@ class FirewallRuleViewSet(viewsets.ViewSet):
             status=status.HTTP_200_OK
         )
 
+    def _sync_rules(self, server):
+        """
+        Re-reads the server's UFW rules into FirewallRule rows after a change made here,
+        so the host's state is taken as intended rather than flagged as drift.
+        A failed sync is logged; the rows keep their previous state until the next sync.
+        """
+        try:
+            return sync_firewall_rules(server, authoritative=True)
+        except (ConnectionError, RuntimeError) as e:
+            logger.warning(f"Failed to sync UFW rules for server {server.id}: {e}")
+            return None
+
     @action(detail=False, methods=['get'], url_path='rules')
     def get_ufw_rules(self, request, pk=None, customer_pk=None, server_pk=None):
         """
-        Retrieves the numbered UFW rules for a specific server.
-        Parses the output of 'sudo ufw status numbered' command.
+        Retrieves the UFW rules of a specific server from the last sync, ordered by rule number.
+        The rules are synced from the host first if they never were or if 'refresh' is set.
+        'id' identifies the FirewallRule row; 'ufw_number' is the rule's number as of the last sync.
+        """
+        server_id = server_pk if server_pk is not None else pk
+        server = self._get_server_object(server_id)
+        rows = FirewallRule.objects.filter(server=server)
+
+        refresh = request.query_params.get('refresh', '').lower() in ('1', 'true', 'yes')
+        if refresh or not rows.filter(last_synced_at__isnull=False).exists():
+            try:
+                sync_firewall_rules(server)
+            except (ConnectionError, RuntimeError) as e:
+                logger.error(f"Failed to sync UFW rules for server {server.id}: {e}")
+                return Response({"error": f"Operation failed: {e}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        rules = [
+            {
+                'id': row.id,
+                'ufw_number': row.ufw_number,
+                'port': row.port,
+                'protocol': row.protocol,
+                'action': row.action,
+                'source': row.source_ip,
+                'description': row.description,
+                'drift': row.drift,
+                'last_synced_at': row.last_synced_at,
+            }
+            for row in rows.order_by(F('ufw_number').asc(nulls_last=True), 'id')
+        ]
+        return Response(rules, status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['post'], url_path='rules/sync')
+    def sync_ufw_rules(self, request, pk=None, customer_pk=None, server_pk=None):
+        """
+        Synchronizes FirewallRule rows with the host.
+        'direction' is 'pull' (default: record the host's rules and drift) or 'push'
+        (apply the stored rules to the host, see rules/apply; 'dry_run' is honoured).
         """
         server_id = server_pk if server_pk is not None else pk
         server = self._get_server_object(server_id)
+        direction = request.data.get('direction', 'pull')
 
-        output, error = self._execute_ssh_command(server, 'sudo ufw status numbered')
-        response_error = self._handle_ssh_response(output, error)
-        if response_error:
-            return response_error
+        if direction not in ('pull', 'push'):
+            return Response({"error": "direction must be 'pull' or 'push'."}, status=status.HTTP_400_BAD_REQUEST)
 
         try:
-            rules = []
-            lines = output.strip().split('\n')
-            # Find the line that separates header from rules (e.g., '----')
-            rules_start_index = next(i for i, line in enumerate(lines) if '----' in line) + 1
-
-            for line in lines[rules_start_index:]:
-                # Regex to parse UFW rule lines: [ID] TO ACTION IN FROM
-                match = re.match(r'\s*\[\s*(\d+)\]\s+(.*?)\s+(ALLOW|DENY|REJECT)\s+IN\s+(.*)', line)
-                if match:
-                    rule_id, port_protocol_str, action, source = match.groups()
-                    port_protocol_str = port_protocol_str.strip()
-                    
-                    # Split port and protocol, handling cases where protocol might be missing
-                    parts = port_protocol_str.split('/')
-                    port = parts[0]
-                    protocol = parts[1] if len(parts) > 1 else None
-
-                    rules.append({
-                        'id': rule_id,
-                        'port': port,
-                        'protocol': protocol,
-                        'action': action.strip(),
-                        'source': source.strip(),
-                    })
-            return Response(rules, status=status.HTTP_200_OK)
-        except StopIteration:
-            # No rules found or '----' separator not present, return empty list
-            return Response([], status=status.HTTP_200_OK)
-        except Exception as e:
-            logger.error(f"Error parsing UFW rules for server {server.id}: {e}", exc_info=True)
-            return Response({"error": "Failed to parse UFW rules output."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            if direction == 'pull':
+                return Response({'drift': sync_firewall_rules(server)}, status=status.HTTP_200_OK)
+            result = push_firewall_rules(server, dry_run=bool(request.data.get('dry_run', False)))
+        except FirewallRuleError as e:
+            return Response({"error": f"Stored rule is invalid: {e}"}, status=status.HTTP_400_BAD_REQUEST)
+        except (ConnectionError, RuntimeError) as e:
+            logger.error(f"Failed to sync UFW rules for server {server.id}: {e}")
+            return Response({"error": f"Operation failed: {e}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        if result['status'] in ('applied', 'rolled_back'):
+            log_action(
+                user=request.user,
+                action='Firewall rules pushed',
+                request=request,
+                details=f"Stored firewall rules pushed to server '{server.server_name}' ({result['status']}).",
+            )
+        response_status = status.HTTP_200_OK if result['status'] != 'rolled_back' else status.HTTP_409_CONFLICT
+        return Response(result, status=response_status)
 
     @action(detail=False, methods=['post'], url_path='rules/add')
     def add_ufw_rule(self, request, pk=None, customer_pk=None, server_pk=None):
@@ -194,20 +263,24 @@ class FirewallRuleViewSet(viewsets.ViewSet):
         if not port:
             return Response({"error": "Port is required to add a rule."}, status=status.HTTP_400_BAD_REQUEST)
 
-        command = self._build_ufw_rule_command(action_type, port, protocol, source)
-        
+        try:
+            command = self._build_ufw_rule_command(action_type, port, protocol, source)
+        except FirewallRuleError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
         output, error = self._execute_ssh_command(server, command)
         response_error = self._handle_ssh_response(output, error)
         if response_error:
             return response_error
 
+        self._sync_rules(server)
         return Response({"status": "Rule added successfully"}, status=status.HTTP_200_OK)
 
     @action(detail=False, methods=['post'], url_path='rules/delete')
     def delete_ufw_rule(self, request, pk=None, customer_pk=None, server_pk=None):
         """
-        Deletes a UFW rule by its ID from a specific server.
-        Requires 'id' in request data.
+        Deletes a UFW rule from a specific server.
+        Requires 'id' (the rule's 'id' from the rules listing) in request data.
         """
         server_id = server_pk if server_pk is not None else pk
         server = self._get_server_object(server_id)
@@ -215,21 +288,25 @@ class FirewallRuleViewSet(viewsets.ViewSet):
 
         if not rule_id:
             return Response({"error": "Rule ID is required to delete a rule."}, status=status.HTTP_400_BAD_REQUEST)
+        rule = self._get_rule_object(server, rule_id)
 
-        command = f'echo y | sudo ufw delete {rule_id}'
-        
-        output, error = self._execute_ssh_command(server, command)
+        try:
+            output, error = self._delete_rule_on_host(server, rule)
+        except FirewallRuleError as e:
+            return Response({"error": f"Stored rule is invalid: {e}"}, status=status.HTTP_400_BAD_REQUEST)
         response_error = self._handle_ssh_response(output, error)
         if response_error:
             return response_error
 
+        self._sync_rules(server)
         return Response({"status": "Rule deleted successfully"}, status=status.HTTP_200_OK)
 
     @action(detail=False, methods=['post'], url_path='rules/edit')
     def edit_ufw_rule(self, request, pk=None, customer_pk=None, server_pk=None):
         """
-        Edits an existing UFW rule by deleting the old one and adding a new one.
-        Requires 'id', 'port', 'action', and 'protocol' in request data.
+        Edits an existing UFW rule by replacing it with the new one over one SSH session.
+        The new rule is added before the old one is deleted, and a failed step rolls back.
+        Requires 'id' (the rule's 'id' from the rules listing), 'port', 'action', and 'protocol' in request data.
         """
         server_id = server_pk if server_pk is not None else pk
         server = self._get_server_object(server_id)
@@ -242,29 +319,62 @@ class FirewallRuleViewSet(viewsets.ViewSet):
 
         if not all([rule_id, new_port, new_action]):
             return Response({"error": "Missing required data (id, port, action) for rule edit."}, status=status.HTTP_400_BAD_REQUEST)
+        rule = self._get_rule_object(server, rule_id)
+        new_rule = {'action': new_action, 'port': new_port, 'protocol': new_protocol, 'source': new_source}
+        try:
+            result = apply_firewall_rules(server, [new_rule], prune=False, remove=[row_rule(rule)])
+        except FirewallRuleError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except (ConnectionError, RuntimeError) as e:
+            logger.error(f"Failed to edit UFW rule {rule.id} on server {server.id}: {e}")
+            return Response({"error": f"Operation failed: {e}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        record_ufw_rules(server, result['rules'], authoritative=result['status'] != 'rolled_back')
+        if result['status'] == 'rolled_back':
+            return Response(
+                {"error": f"Failed to update rule, changes were rolled back: {result['error']}"},
+                status=status.HTTP_409_CONFLICT,
+            )
+        return Response({"status": "Rule updated successfully"}, status=status.HTTP_200_OK)
 
-        # Step 1: Delete the old rule
-        delete_command = f'echo y | sudo ufw delete {rule_id}'
-        output, delete_error = self._execute_ssh_command(server, delete_command)
-        response_error = self._handle_ssh_response(output, delete_error)
-        if response_error:
-            return Response({"error": f"Failed to delete old rule: {delete_error}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    @action(detail=False, methods=['post'], url_path='rules/apply')
+    def apply_ufw_rules(self, request, pk=None, customer_pk=None, server_pk=None):
+        """
+        Replaces the server's UFW rules with the desired rule set in 'rules'
+        (each with 'port', 'action', 'protocol' and 'source').
+        Only the missing rules are added and the extra ones deleted, over one SSH session;
+        a failed step rolls back the steps already applied. 'dry_run' returns the plan only.
+        """
+        server_id = server_pk if server_pk is not None else pk
+        server = self._get_server_object(server_id)
+        desired = request.data.get('rules')
+        dry_run = bool(request.data.get('dry_run', False))
 
-        # Step 2: Add the new rule with updated parameters
-        add_command = self._build_ufw_rule_command(new_action, new_port, new_protocol, new_source)
-        
-        output, add_error = self._execute_ssh_command(server, add_command)
-        response_error = self._handle_ssh_response(output, add_error)
-        if response_error:
-            # Consider logging a warning here if the deletion succeeded but addition failed,
-            # as the server might be in an inconsistent state.
-            logger.warning(
-                f"UFW rule deletion succeeded for server {server.id} (Rule ID: {rule_id}), "
-                f"but addition of new rule failed: {add_error}"
-            )
-            return Response({"error": f"Failed to add new rule: {add_error}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        if not isinstance(desired, list):
+            return Response({"error": "'rules' must be a list of rules."}, status=status.HTTP_400_BAD_REQUEST)
 
-        return Response({"status": "Rule updated successfully"}, status=status.HTTP_200_OK)
+        try:
+            result = apply_firewall_rules(server, desired, dry_run=dry_run)
+        except FirewallRuleError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except (ConnectionError, RuntimeError) as e:
+            logger.error(f"Failed to apply firewall rules on server {server.id}: {e}")
+            return Response({"error": f"Operation failed: {e}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        if result['status'] != 'planned':
+            result['drift'] = record_ufw_rules(server, result['rules'], authoritative=result['status'] != 'rolled_back')
+        if result['status'] in ('applied', 'rolled_back'):
+            log_action(
+                user=request.user,
+                action='Firewall rules applied' if result['status'] == 'applied' else 'Firewall rules rolled back',
+                request=request,
+                details=(
+                    f"Firewall rules for server '{server.server_name}': {len(result['plan']['add'])} added, "
+                    f"{len(result['plan']['delete'])} deleted ({result['status']})."
+                ),
+            )
+        response_status = status.HTTP_200_OK if result['status'] != 'rolled_back' else status.HTTP_409_CONFLICT
+        return Response(result, status=response_status)
 
     @action(detail=False, methods=['get'], url_path='status')
     def get_firewall_status(self, request, pk=None, customer_pk=None, server_pk=None):
@@ -9,12 +9,25 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 
 # Local application imports
+from ServerPilot_API.Servers.facts import collect_facts, evaluate_fact_risks
+from ServerPilot_API.Servers.filters import SecurityRecommendationFilter
+from ServerPilot_API.Servers.findings import (
+    diff_scans,
+    passed_findings,
+    record_scan_findings,
+    scan_findings,
+    StoredThenPassedFindings,
+    summarize_scans,
+)
+from ServerPilot_API.Servers.fixes import apply_fixes, prepare_fix_command
 from ServerPilot_API.Servers.models import Server, SecurityRecommendation, SecurityScan
 from ServerPilot_API.Servers.permissions import IsOwnerOrAdmin
 from ServerPilot_API.Servers.serializers import (
     SecurityRecommendationSerializer,
     SecurityScanSerializer,
+    SecurityScanSummarySerializer,
 )
+from ServerPilot_API.audit_log.pagination import StandardResultsSetPagination
 from ServerPilot_API.audit_log.services import log_action
 from ServerPilot_API.security.models import SecurityRisk
 
@@ -57,22 +70,6 @@ class SecurityAdvisorViewSet(viewsets.ViewSet):
         self.check_object_permissions(self.request, server.customer)
         return server
 
-    def _prepare_fix_command(self, command: str) -> str:
-        """
-        Modifies a given command to run non-interactively if necessary.
-        Currently handles 'ufw enable' by piping 'y' to it.
-
-        Args:
-            command (str): The original command string.
-
-        Returns:
-            str: The modified command string.
-        """
-        if 'ufw enable' in command:
-            logger.debug(f"Modifying command for non-interactive UFW enable: '{command}'")
-            return f'echo y | {command}'
-        return command
-
     def _check_for_risk(self, risk: SecurityRisk, output: str, exit_status: int) -> bool:
         """
         Determines if a security risk is found based on the command's output
@@ -99,15 +96,17 @@ class SecurityAdvisorViewSet(viewsets.ViewSet):
         logger.debug(f"Pattern '{risk.match_pattern}' match found for '{risk.title}': {match_found}")
         return match_found
 
-    def _process_single_risk(self, server: Server, scan: SecurityScan, risk: SecurityRisk):
+    def _process_single_risk(self, server: Server, risk: SecurityRisk):
         """
-        Processes a single security risk: executes its check command on the server,
-        analyzes the output, and creates a SecurityRecommendation based on the findings.
+        Processes a single security risk: executes its check command on the server
+        and analyzes the output.
 
         Args:
             server (Server): The server object being scanned.
-            scan (SecurityScan): The current security scan object.
             risk (SecurityRisk): The specific security risk to process.
+
+        Returns:
+            tuple | None: (risk, is_risk_found, output), or None if the SSH connection failed.
         """
         logger.info(f"[Security Scan] Checking risk: '{risk.title}' for server: {server.id}")
         logger.debug(f"[Security Scan] Executing command: {risk.check_command}")
@@ -117,8 +116,8 @@ class SecurityAdvisorViewSet(viewsets.ViewSet):
 
         if not conn_success:
             logger.warning(f"[Security Scan] SSH connection failed for risk '{risk.title}': {output}")
-            # Do not create a recommendation if SSH connection itself failed
-            return
+            # Do not record a finding if SSH connection itself failed
+            return None
 
         logger.debug(
             f"[Security Scan] Command for '{risk.title}' executed with exit code {exit_status}. "
@@ -128,32 +127,17 @@ class SecurityAdvisorViewSet(viewsets.ViewSet):
         is_risk_found = self._check_for_risk(risk, output, exit_status)
 
         if is_risk_found:
-            logger.info(f"[Security Scan] Risk '{risk.title}' found. Creating pending recommendation.")
-            SecurityRecommendation.objects.create(
-                scan=scan,
-                risk_level=risk.risk_level,
-                title=risk.title,
-                description=risk.description,
-                solution=risk.fix_command,
-                status='pending'  # Explicitly set status for found risks
-            )
+            logger.info(f"[Security Scan] Risk '{risk.title}' found.")
         else:
-            # If no match was found, it means the check passed.
-            logger.info(f"[Security Scan] Check passed for: '{risk.title}'. Creating 'passed' recommendation.")
-            SecurityRecommendation.objects.create(
-                scan=scan,
-                risk_level='low',  # Passed checks are considered low risk/informational
-                title=f"Check Passed: {risk.title}",
-                description='This security check passed successfully. No action required.',
-                solution='',  # Provide empty string instead of None
-                status='passed'
-            )
+            logger.info(f"[Security Scan] Check passed for: '{risk.title}'.")
+        return risk, is_risk_found, output
 
     @action(detail=False, methods=['post'], url_path='run-security-scan')
     def run_security_scan(self, request, *args, **kwargs) -> Response:
         """
         Initiates a security scan on the server based on predefined security risks.
-        Iterates through enabled risks, executes checks, and creates recommendations.
+        Iterates through enabled risks, executes checks, and records the findings.
+        Risks declaring a fact rule are evaluated against the server's collected facts.
         """
         server = self.get_server_object(**kwargs)
         scan = None  # Initialize scan to None
@@ -162,8 +146,22 @@ class SecurityAdvisorViewSet(viewsets.ViewSet):
             risks = SecurityRisk.objects.filter(is_enabled=True).order_by('id') # Order for consistent processing
             scan = SecurityScan.objects.create(server=server, status='running') # Set status to running initially
 
+            # Risks with a fact rule are evaluated locally against one facts collection.
+            fact_risks = [risk for risk in risks if risk.fact_rule]
+            results = []
+            if fact_risks:
+                try:
+                    server_facts = collect_facts(server)
+                    results.extend(evaluate_fact_risks(fact_risks, server_facts.facts))
+                except RuntimeError as e:
+                    logger.warning(f"[Security Scan] Facts collection failed for server {server.id}: {e}")
             for risk in risks:
-                self._process_single_risk(server, scan, risk)
+                if risk.fact_rule:
+                    continue
+                result = self._process_single_risk(server, risk)
+                if result is not None:
+                    results.append(result)
+            record_scan_findings(scan, results, checked_risk_ids=[risk.id for risk in risks])
 
             scan.status = 'completed'
             scan.save()
@@ -196,16 +194,18 @@ class SecurityAdvisorViewSet(viewsets.ViewSet):
 
         try:
             # Ensure the recommendation belongs to the specified server
-            recommendation = SecurityRecommendation.objects.get(pk=recommendation_id, scan__server=server)
+            recommendation = SecurityRecommendation.objects.select_related('risk').get(
+                pk=recommendation_id, scan__server=server
+            )
 
-            if not recommendation.solution:
+            if not recommendation.fix_command:
                 logger.warning(f"No solution command available for recommendation ID {recommendation_id}.")
                 return Response(
                     {'error': 'No solution command available for this recommendation.'},
                     status=status.HTTP_400_BAD_REQUEST
                 )
 
-            command_to_run = self._prepare_fix_command(recommendation.solution)
+            command_to_run = prepare_fix_command(recommendation.fix_command)
             
             # Use a reasonable timeout for SSH commands
             success, output, exit_status = server.connect_ssh(command=command_to_run, timeout=60)
@@ -217,7 +217,7 @@ class SecurityAdvisorViewSet(viewsets.ViewSet):
                     request.user, 
                     'recommendation_fix', 
                     request, 
-                    f'Successfully fixed recommendation "{recommendation.title}" on server {server.server_name}'
+                    f'Successfully fixed recommendation "{recommendation}" on server {server.server_name}'
                 )
                 logger.info(f"Recommendation {recommendation_id} fixed successfully on server {server.id}.")
                 return Response({'status': 'success', 'message': 'Recommendation fixed successfully.'}, status=status.HTTP_200_OK)
@@ -226,7 +226,7 @@ class SecurityAdvisorViewSet(viewsets.ViewSet):
                     request.user, 
                     'recommendation_fix_failed', 
                     request, 
-                    f'Failed to fix recommendation "{recommendation.title}" on server {server.server_name}: {output}'
+                    f'Failed to fix recommendation "{recommendation}" on server {server.server_name}: {output}'
                 )
                 logger.error(
                     f"Failed to apply fix for recommendation {recommendation_id} on server {server.id}. "
@@ -247,6 +247,59 @@ class SecurityAdvisorViewSet(viewsets.ViewSet):
             )
             return Response({'status': 'error', 'message': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+    @action(detail=False, methods=['post'], url_path='fix-recommendations')
+    def fix_recommendations(self, request, *args, **kwargs) -> Response:
+        """
+        Applies the solution commands of several recommendations over one SSH session.
+        Fixes are ordered by risk dependencies; the response lists a result per recommendation.
+        """
+        server = self.get_server_object(**kwargs)
+        recommendation_ids = request.data.get('recommendation_ids')
+
+        if not isinstance(recommendation_ids, list) or not recommendation_ids:
+            logger.warning("Attempted to batch fix recommendations without 'recommendation_ids'.")
+            return Response({'error': 'recommendation_ids must be a non-empty list.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            found = {
+                rec.id: rec for rec in SecurityRecommendation.objects.select_related('risk')
+                .prefetch_related('risk__depends_on')
+                .filter(pk__in=recommendation_ids, scan__server=server)
+            }
+            recommendations, results = [], []
+            for recommendation_id in dict.fromkeys(recommendation_ids):
+                rec = found.get(recommendation_id)
+                if rec is None:
+                    results.append({'id': recommendation_id, 'status': 'error', 'output': 'Recommendation not found.'})
+                elif not rec.fix_command:
+                    results.append({'id': rec.id, 'risk': rec.risk_id, 'status': 'error',
+                                    'output': 'No solution command available for this recommendation.'})
+                else:
+                    recommendations.append(rec)
+
+            if recommendations:
+                results.extend(apply_fixes(server, recommendations))
+
+            fixed = [item['id'] for item in results if item['status'] == 'fixed']
+            log_action(
+                request.user,
+                'recommendation_fix' if len(fixed) == len(results) else 'recommendation_fix_failed',
+                request,
+                f'Batch fix on server {server.server_name}: {len(fixed)} of {len(results)} recommendations fixed'
+            )
+            logger.info(f"Batch fix on server {server.id}: fixed {fixed} of {list(dict.fromkeys(recommendation_ids))}.")
+            return Response({'results': results}, status=status.HTTP_200_OK)
+
+        except ConnectionError as e:
+            logger.error(f"SSH connection failed for batch fix on server {server.id}: {e}")
+            return Response(
+                {'status': 'error', 'message': 'Failed to connect to server.', 'details': str(e)},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        except Exception as e:
+            logger.error(f'Error batch fixing recommendations for server {server.id}: {e}', exc_info=True)
+            return Response({'status': 'error', 'message': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
     @action(detail=False, methods=['get'], url_path='latest-security-scan')
     def latest_security_scan(self, request, *args, **kwargs) -> Response:
         """
@@ -263,6 +316,91 @@ class SecurityAdvisorViewSet(viewsets.ViewSet):
         logger.debug(f"Returning latest security scan for server {server.id}.")
         return Response(serializer.data, status=status.HTTP_200_OK)
 
+    @action(detail=False, methods=['get'], url_path='scans')
+    def scans(self, request, *args, **kwargs) -> Response:
+        """
+        Lists the server's scans, newest first and paginated, with per-scan finding
+        counts by risk level and status instead of the findings themselves.
+        """
+        server = self.get_server_object(**kwargs)
+        paginator = StandardResultsSetPagination()
+        page = paginator.paginate_queryset(SecurityScan.objects.filter(server=server).order_by('-id'), request, view=self)
+        context = {'summaries': summarize_scans(page)}
+        serializer = SecurityScanSummarySerializer(page, many=True, context=context)
+        return paginator.get_paginated_response(serializer.data)
+
+    @action(detail=False, methods=['get'], url_path='recommendations')
+    def recommendations(self, request, *args, **kwargs) -> Response:
+        """
+        Lists the findings of one scan, paginated.
+        Query params: 'scan' (defaults to the latest scan) and the filters
+        'risk_level', 'status', 'risk_found' and 'risk'.
+        """
+        server = self.get_server_object(**kwargs)
+        scans = SecurityScan.objects.filter(server=server)
+        scan_id = request.query_params.get('scan')
+        try:
+            scan = scans.get(pk=scan_id) if scan_id else scans.order_by('-id').first()
+        except (SecurityScan.DoesNotExist, ValueError):
+            return Response({'error': 'Scan not found.'}, status=status.HTTP_404_NOT_FOUND)
+        if scan is None:
+            return Response({'message': 'No security scans found for this server.'}, status=status.HTTP_404_NOT_FOUND)
+
+        filterset = SecurityRecommendationFilter(request.query_params, queryset=scan_findings(scan).order_by('id'))
+        if not filterset.is_valid():
+            return Response(filterset.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        # Stored findings come first, then the passed checks kept in the scan's bitmap;
+        # only the stored rows of the requested page are loaded and serialized.
+        catalog = SecurityRisk.catalog()
+        findings = StoredThenPassedFindings(
+            filterset.qs, [f for f in passed_findings(scan, catalog) if filterset.matches(f)]
+        )
+        paginator = StandardResultsSetPagination()
+        page = paginator.paginate_queryset(findings, request, view=self)
+        serializer = SecurityRecommendationSerializer(context={'risk_catalog': catalog})
+        data = [item if isinstance(item, dict) else serializer.to_representation(item) for item in page]
+        return paginator.get_paginated_response(data)
+
+    @action(detail=False, methods=['get'], url_path='scan-diff')
+    def scan_diff(self, request, *args, **kwargs) -> Response:
+        """
+        Returns what changed between two scans of the server.
+        Query params: 'to' (defaults to the latest scan) and 'from' (defaults to the
+        scan preceding 'to').
+        """
+        server = self.get_server_object(**kwargs)
+        scans = SecurityScan.objects.filter(server=server)
+        to_id = request.query_params.get('to')
+        from_id = request.query_params.get('from')
+
+        try:
+            to_scan = scans.get(pk=to_id) if to_id else scans.order_by('-id').first()
+            if to_scan is None:
+                return Response({'message': 'No security scans found for this server.'}, status=status.HTTP_404_NOT_FOUND)
+            if from_id:
+                from_scan = scans.get(pk=from_id)
+            else:
+                from_scan = to_scan.previous_scan or scans.filter(id__lt=to_scan.id).order_by('-id').first()
+        except (SecurityScan.DoesNotExist, ValueError):
+            logger.warning(f"Scan diff requested with unknown scans from={from_id} to={to_id} for server {server.id}.")
+            return Response({'error': 'Scan not found.'}, status=status.HTTP_404_NOT_FOUND)
+
+        if from_scan is None:
+            # First scan of the server: everything it found is new.
+            diff = {'new': list(scan_findings(to_scan).filter(risk_found=True)), 'resolved': [], 'changed': []}
+        else:
+            diff = diff_scans(from_scan, to_scan)
+
+        context = {'risk_catalog': SecurityRisk.catalog()}
+        return Response({
+            'from_scan': from_scan.id if from_scan else None,
+            'to_scan': to_scan.id,
+            'new': SecurityRecommendationSerializer(diff['new'], many=True, context=context).data,
+            'resolved': SecurityRecommendationSerializer(diff['resolved'], many=True, context=context).data,
+            'changed': diff['changed'],
+        }, status=status.HTTP_200_OK)
+
     @action(detail=False, methods=['patch'], url_path='update-recommendation-status')
     def update_recommendation_status(self, request, *args, **kwargs) -> Response:
         """
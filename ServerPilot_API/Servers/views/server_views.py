@@ -29,7 +29,7 @@ from ServerPilot_API.Servers.models import SecurityScan, SecurityRecommendation
 from ServerPilot_API.Servers.permissions import IsOwnerOrAdmin, AsyncSessionAuthentication
 from ServerPilot_API.audit_log.services import log_action
 from ServerPilot_API.security.models import SecurityRisk
-from ServerPilot_API.security.crypto import encrypt_secret, decrypt_secret
+from ServerPilot_API.security.crypto import encrypt_secret
 
 logger = logging.getLogger(__name__)
 
@@ -111,6 +111,7 @@ class ServerViewSet(viewsets.ModelViewSet):
                 ciphertext=enc['ciphertext'],
                 nonce=enc['nonce'],
                 encrypted_dek=enc['encrypted_dek'],
+                kek_id=enc['kek_id'],
             )
             log_action(
                 request.user,
@@ -146,11 +147,7 @@ class ServerViewSet(viewsets.ModelViewSet):
             return Response({"detail": "Credential not found."}, status=status.HTTP_404_NOT_FOUND)
 
         try:
-            plaintext = decrypt_secret({
-                'ciphertext': bytes(cred.ciphertext),
-                'nonce': bytes(cred.nonce),
-                'encrypted_dek': bytes(cred.encrypted_dek),
-            })
+            plaintext = cred.decrypt()
             # Return as UTF-8 if possible, else base64
             try:
                 value = plaintext.decode('utf-8')
@@ -202,11 +199,7 @@ class ServerViewSet(viewsets.ModelViewSet):
             return Response({"detail": "Credential not found."}, status=status.HTTP_404_NOT_FOUND)
 
         try:
-            secret_bytes = decrypt_secret({
-                'ciphertext': bytes(cred.ciphertext),
-                'nonce': bytes(cred.nonce),
-                'encrypted_dek': bytes(cred.encrypted_dek),
-            })
+            secret_bytes = cred.decrypt()
         except Exception:
             logger.error("Error decrypting credential for test_connection", exc_info=True)
             return Response({"detail": "Failed to decrypt credential."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
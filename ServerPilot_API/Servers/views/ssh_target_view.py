@@ -0,0 +1,45 @@
+import logging
+
+from rest_framework import permissions, status
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from ServerPilot_API.Servers.models import Server
+from ServerPilot_API.Servers.permissions import HasInternalServiceToken
+from ServerPilot_API.Servers.ssh_targets import SshTargetError, resolve_ssh_target
+from ServerPilot_API.audit_log.services import log_action
+
+logger = logging.getLogger(__name__)
+
+
+class SshTargetView(APIView):
+    """
+    Internal endpoint for the WebSocket SSH proxy: resolves a server to its connection
+    parameters and decrypted credential on behalf of the user whose JWT is forwarded.
+    e.g., GET /api/servers/internal/ssh-targets/{server_id}/
+    """
+    permission_classes = [permissions.IsAuthenticated, HasInternalServiceToken]
+
+    def get(self, request, pk=None, *args, **kwargs) -> Response:
+        user = request.user
+        try:
+            server = Server.objects.select_related('customer').get(pk=pk)
+        except Server.DoesNotExist:
+            return Response({'error': 'Server not found.'}, status=status.HTTP_404_NOT_FOUND)
+        if not (user.is_staff or server.customer.owner_id == user.id):
+            # Hide existence
+            return Response({'error': 'Server not found.'}, status=status.HTTP_404_NOT_FOUND)
+        if not server.is_active:
+            return Response({'error': 'Server is inactive.'}, status=status.HTTP_409_CONFLICT)
+
+        try:
+            target = resolve_ssh_target(server)
+        except SshTargetError as e:
+            logger.warning(f"Cannot resolve SSH target for server {server.id}: {e}")
+            return Response({'error': str(e)}, status=status.HTTP_409_CONFLICT)
+
+        log_action(
+            user, 'server_ssh_terminal_target', request,
+            f'Resolved SSH terminal target for server {server.server_name} (ID: {server.id})'
+        )
+        return Response(target, status=status.HTTP_200_OK)
@@ -33,12 +33,13 @@ class SecurityRiskAdmin(admin.ModelAdmin):
     list_display = ('title', 'risk_level', 'is_enabled', 'expect_non_zero_exit', 'required_role', 'created_at')
     list_filter = ('risk_level', 'is_enabled', 'expect_non_zero_exit')
     search_fields = ('title', 'description')
+    filter_horizontal = ('depends_on',)
     fieldsets = (
         ('Risk Details', {
             'fields': ('title', 'description', 'risk_level', 'is_enabled', 'required_role')
         }),
         ('Execution Logic', {
-            'fields': ('check_command', 'match_pattern', 'expect_non_zero_exit', 'fix_command')
+            'fields': ('check_command', 'match_pattern', 'expect_non_zero_exit', 'fact_rule', 'fix_command', 'depends_on')
         }),
     )
 
@@ -5,10 +5,15 @@ Design:
 - AES-256-GCM for data encryption (DEK) with 12-byte random nonce.
 - AES Key Wrap (RFC 3394) with 256-bit KEK for wrapping the DEK (no nonce required).
 - Master key (KEK) is loaded once at import from env var SERVERPILOT_MASTER_KEY.
+- Every wrapped DEK records the id of the KEK that wrapped it (kek_id), so several KEKs
+  can be in use while a rotation is in progress (see the rotate_kek command).
 - Never log plaintext or keys. Keep secrets in memory for as short as possible.
 
 Environment:
 - SERVERPILOT_MASTER_KEY: 32 bytes, base64 or hex encoded are both supported. Raw 32-byte string also supported.
+- SERVERPILOT_MASTER_KEY_ID: id of SERVERPILOT_MASTER_KEY, the KEK new DEKs are wrapped with (default "1").
+- SERVERPILOT_MASTER_KEYRING: other KEKs still needed to unwrap DEKs, as comma-separated
+  "<kek_id>:<key>" pairs (same key formats as above).
 
 Returns and inputs use bytes to avoid implicit encoding issues.
 """
@@ -17,7 +22,8 @@ from __future__ import annotations
 import base64
 import binascii
 import os
-from typing import Dict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List
 
 from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 from cryptography.hazmat.primitives.keywrap import aes_key_wrap, aes_key_unwrap
@@ -25,8 +31,13 @@ from cryptography.hazmat.primitives.keywrap import aes_key_wrap, aes_key_unwrap
 from django.core.exceptions import ImproperlyConfigured
 
 
+DEFAULT_KEK_ID = "1"
+
 # Module-level KEK loaded once
 _KEK: bytes | None = None
+_KEK_ID: str | None = None
+# Other KEKs by id, loaded once
+_KEYRING: Dict[str, bytes] | None = None
 
 
 def _decode_key(value: str) -> bytes:
@@ -69,6 +80,48 @@ def _load_master_key() -> bytes:
     return _KEK
 
 
+def active_kek_id() -> str:
+    """Return the id of the KEK that new DEKs are wrapped with."""
+    global _KEK_ID
+    if _KEK_ID is None:
+        _KEK_ID = os.getenv("SERVERPILOT_MASTER_KEY_ID", "").strip() or DEFAULT_KEK_ID
+    return _KEK_ID
+
+
+def _load_keyring() -> Dict[str, bytes]:
+    global _KEYRING
+    if _KEYRING is not None:
+        return _KEYRING
+    keyring = {}
+    for entry in os.getenv("SERVERPILOT_MASTER_KEYRING", "").split(","):
+        if not entry.strip():
+            continue
+        kek_id, sep, value = entry.strip().partition(":")
+        if not sep or not kek_id or not value:
+            raise ImproperlyConfigured("SERVERPILOT_MASTER_KEYRING entries must look like <kek_id>:<key>")
+        key = _decode_key(value)
+        if len(key) != 32:
+            raise ImproperlyConfigured(f"Keyring KEK {kek_id} must be 32 bytes for AES-256 key wrap")
+        keyring[kek_id] = key
+    _KEYRING = keyring
+    return _KEYRING
+
+
+def get_kek(kek_id: str | None) -> bytes:
+    """Return the KEK with id `kek_id` (None: the active KEK); raises ImproperlyConfigured if unknown."""
+    if not kek_id or kek_id == active_kek_id():
+        return _load_master_key()
+    try:
+        return _load_keyring()[kek_id]
+    except KeyError:
+        raise ImproperlyConfigured(f"KEK {kek_id} is not configured; add it to SERVERPILOT_MASTER_KEYRING") from None
+
+
+def needs_rewrap(kek_id: str | None) -> bool:
+    """Whether a DEK wrapped with KEK `kek_id` should be rewrapped with the active KEK."""
+    return bool(kek_id) and kek_id != active_kek_id()
+
+
 def encrypt_secret(plaintext: bytes) -> Dict[str, bytes]:
     """
     Envelope-encrypt a plaintext secret.
@@ -77,7 +130,8 @@ def encrypt_secret(plaintext: bytes) -> Dict[str, bytes]:
     - Encrypt plaintext with AES-256-GCM using DEK and random 12-byte nonce.
     - Wrap the DEK using AES Key Wrap with the KEK.
 
-    Returns a dict with binary values: {ciphertext, nonce, encrypted_dek}
+    Returns a dict with binary values {ciphertext, nonce, encrypted_dek} and the
+    id of the wrapping KEK as kek_id.
     """
     if not isinstance(plaintext, (bytes, bytearray)):
         raise TypeError("plaintext must be bytes")
@@ -98,6 +152,7 @@ def encrypt_secret(plaintext: bytes) -> Dict[str, bytes]:
             "ciphertext": ciphertext,
             "nonce": nonce,
             "encrypted_dek": wrapped_dek,
+            "kek_id": active_kek_id(),
         }
     finally:
         # Best-effort wipe of DEK from memory
@@ -124,32 +179,93 @@ def rewrap_encrypted_dek(encrypted_dek: bytes, old_kek: bytes, new_kek: bytes) -
         del dek
 
 
+def rewrap_dek(encrypted_dek: bytes, kek_id: str | None, to_kek_id: str | None = None) -> Dict[str, object]:
+    """
+    Re-wrap a DEK wrapped with KEK `kek_id` using KEK `to_kek_id` (default: the active KEK).
+
+    Returns {encrypted_dek, kek_id} for the new wrapping.
+    """
+    to_kek_id = to_kek_id or active_kek_id()
+    return {
+        "encrypted_dek": rewrap_encrypted_dek(encrypted_dek, get_kek(kek_id), get_kek(to_kek_id)),
+        "kek_id": to_kek_id,
+    }
+
+
 def get_loaded_kek() -> bytes:
     """Return the currently loaded KEK (raises if not configured)."""
     return _load_master_key()
 
 
-def decrypt_secret(data: Dict[str, bytes]) -> bytes:
-    """
-    Decrypt ciphertext produced by encrypt_secret().
-
-    Expects keys: ciphertext, nonce, encrypted_dek (all bytes)
-    """
-    KEK = _load_master_key()
-
+def _envelope_parts(data: Dict[str, bytes]):
     ciphertext = data.get("ciphertext")
     nonce = data.get("nonce")
     encrypted_dek = data.get("encrypted_dek")
     if not (isinstance(ciphertext, (bytes, bytearray)) and isinstance(nonce, (bytes, bytearray)) and isinstance(encrypted_dek, (bytes, bytearray))):
         raise TypeError("ciphertext, nonce, encrypted_dek must be bytes")
+    return bytes(ciphertext), bytes(nonce), bytes(encrypted_dek)
 
+
+def _open_envelope(kek: bytes, ciphertext: bytes, nonce: bytes, encrypted_dek: bytes) -> bytes:
     # Unwrap DEK
-    dek = bytearray(aes_key_unwrap(KEK, bytes(encrypted_dek)))
+    dek = bytearray(aes_key_unwrap(kek, encrypted_dek))
     try:
         aead = AESGCM(bytes(dek))
-        plaintext = aead.decrypt(bytes(nonce), bytes(ciphertext), associated_data=None)
-        return plaintext
+        return aead.decrypt(nonce, ciphertext, associated_data=None)
     finally:
         for i in range(len(dek)):
             dek[i] = 0
         del dek
+
+
+def decrypt_secret(data: Dict[str, bytes]) -> bytes:
+    """
+    Decrypt ciphertext produced by encrypt_secret().
+
+    Expects keys: ciphertext, nonce, encrypted_dek (all bytes), and optionally the
+    kek_id the DEK was wrapped with (default: the active KEK).
+    """
+    KEK = get_kek(data.get("kek_id"))
+    return _open_envelope(KEK, *_envelope_parts(data))
+
+
+def decrypt_secrets(
+    envelopes: Iterable[Dict[str, bytes]], max_workers: int | None = None, return_exceptions: bool = False
+) -> List[bytes | Exception]:
+    """
+    Decrypt many envelopes in the format accepted by decrypt_secret(), in order.
+
+    Each KEK is looked up once for the whole batch, and every DEK is wiped as soon as its
+    envelope is opened, as in decrypt_secret(). With `max_workers` > 1 the envelopes are
+    opened on a thread pool; the AES primitives release the GIL, so this scales with cores.
+
+    With `return_exceptions`, an envelope that cannot be decrypted yields its exception
+    in place of the plaintext instead of failing the batch.
+    """
+    keks: Dict[str | None, bytes | Exception] = {}
+
+    def open_one(data: Dict[str, bytes]) -> bytes | Exception:
+        try:
+            kek = keks[data.get("kek_id")]
+            if isinstance(kek, Exception):
+                # A new exception per envelope: one instance must not be raised from several threads
+                raise ImproperlyConfigured(*kek.args)
+            return _open_envelope(kek, *_envelope_parts(data))
+        except Exception as e:
+            if return_exceptions:
+                return e
+            raise
+
+    envelopes = list(envelopes)
+    # Resolve every KEK up front, so workers only read the cache
+    for data in envelopes:
+        kek_id = data.get("kek_id")
+        if kek_id not in keks:
+            try:
+                keks[kek_id] = get_kek(kek_id)
+            except ImproperlyConfigured as e:
+                keks[kek_id] = e
+    if not max_workers or max_workers <= 1 or len(envelopes) <= 1:
+        return [open_one(data) for data in envelopes]
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(envelopes))) as executor:
+        return list(executor.map(open_one, envelopes))
@@ -1,85 +1,90 @@
 """
 Management command to rotate the KEK (SERVERPILOT_MASTER_KEY).
 
-This command re-wraps all ServerCredential.encrypted_dek values using a new KEK
-provided via --new-key argument (supports base64, hex, or raw 32-byte).
+Every ServerCredential records the id of the KEK that wrapped its DEK (kek_id).
+Rotation is done online:
+
+1. Configure every process with the new key as SERVERPILOT_MASTER_KEY and a new
+   SERVERPILOT_MASTER_KEY_ID, keeping the old key in SERVERPILOT_MASTER_KEYRING
+   ("<old id>:<old key>"). New credentials are wrapped with the new KEK, old ones
+   still decrypt, and credentials are rewrapped as they are read.
+2. Run this command to rewrap the remaining credentials.
+3. Once it reports nothing left, drop the old key from SERVERPILOT_MASTER_KEYRING.
 
 Usage:
-  python manage.py rotate_kek --new-key <KEY>
+  python manage.py rotate_kek [--to <kek_id>] [--batch-size 500]
 
 Safety:
 - Does not decrypt application data; only rewraps DEKs.
-- Writes in a transaction. Rolls back on error.
+- Works in chunks, each in its own short transaction locking only its rows.
+  Interrupting it loses at most one chunk; running it again continues where it stopped.
 - Prints summary counts only; never logs plaintext or KEKs.
 """
 from __future__ import annotations
 
-import base64
-import binascii
-from typing import Tuple
-
+from django.core.exceptions import ImproperlyConfigured
 from django.core.management.base import BaseCommand, CommandError
 from django.db import transaction
+from django.db.models import Count
 
 from ServerPilot_API.Servers.models import ServerCredential
-from ServerPilot_API.security.crypto import rewrap_encrypted_dek, get_loaded_kek
-
-
-def _decode_key(value: str) -> bytes:
-    # Try base64
-    try:
-        k = base64.b64decode(value, validate=True)
-        if len(k) in (16, 24, 32):
-            return k
-    except (binascii.Error, ValueError):
-        # Not valid base64; try next format
-        ...
-    # Try hex
-    try:
-        k = binascii.unhexlify(value)
-        if len(k) in (16, 24, 32):
-            return k
-    except (binascii.Error, ValueError):
-        # Not valid hex; fallback below
-        ...
-    # Fallback: raw bytes
-    k = value.encode("utf-8")
-    if len(k) in (16, 24, 32):
-        return k
-    raise CommandError(
-        "New KEK must be 16/24/32 bytes (AES-128/192/256) in base64, hex, or raw."
-    )
+from ServerPilot_API.security.crypto import active_kek_id, get_kek, rewrap_dek
 
 
 class Command(BaseCommand):
-    help = "Rotate SERVERPILOT_MASTER_KEY by rewrapping all ServerCredential DEKs"
+    help = "Rewrap ServerCredential DEKs with the active KEK (or --to), in resumable chunks"
 
     def add_arguments(self, parser):
-        parser.add_argument('--new-key', required=True, help='New KEK (base64, hex, or raw 32-byte string)')
+        parser.add_argument('--to', dest='to_kek_id', help='KEK id to rewrap to (default: SERVERPILOT_MASTER_KEY_ID)')
+        parser.add_argument('--batch-size', type=int, default=500, help='Credentials rewrapped per transaction')
 
     def handle(self, *args, **options):
-        new_key_str = options['new_key']
-        new_kek = _decode_key(new_key_str)
-        if len(new_kek) != 32:
-            raise CommandError('New KEK must be 32 bytes for AES-256 key wrap')
+        to_kek_id = options['to_kek_id'] or active_kek_id()
+        batch_size = options['batch_size']
+        if batch_size <= 0:
+            raise CommandError('--batch-size must be positive')
+
+        pending = ServerCredential.objects.exclude(kek_id=to_kek_id)
+        by_kek = dict(pending.values_list('kek_id').annotate(n=Count('pk')).order_by())
+        # Fail before writing anything if a KEK is missing
+        try:
+            for kek_id in [to_kek_id, *by_kek]:
+                get_kek(kek_id)
+        except ImproperlyConfigured as e:
+            raise CommandError(str(e))
+
+        total = sum(by_kek.values())
+        self.stdout.write(self.style.WARNING(
+            f"Rewrapping {total} credentials to KEK {to_kek_id}"
+            + (f" (currently {', '.join(f'{k}: {n}' for k, n in sorted(by_kek.items()))})" if by_kek else "")
+        ))
 
-        old_kek = get_loaded_kek()
-        if old_kek == new_kek:
-            raise CommandError('New KEK must be different from the current KEK')
-
-        total = ServerCredential.objects.count()
         rotated = 0
-
-        self.stdout.write(self.style.WARNING(f"Starting KEK rotation for {total} credentials..."))
-
-        with transaction.atomic():
-            for cred in ServerCredential.objects.select_for_update().all():
-                try:
-                    new_wrapped = rewrap_encrypted_dek(bytes(cred.encrypted_dek), old_kek, new_kek)
-                    cred.encrypted_dek = new_wrapped
-                    cred.save(update_fields=['encrypted_dek'])
-                    rotated += 1
-                except Exception as e:
-                    raise CommandError(f"Failed to rewrap credential id={cred.id}: {e}")
+        last_pk = 0
+        while True:
+            # Keyset pagination: each chunk is its own query, so no cursor stays open across the writes
+            with transaction.atomic():
+                chunk = []
+                rows = (
+                    pending.filter(pk__gt=last_pk)
+                    .order_by('pk')
+                    .only('pk', 'encrypted_dek', 'kek_id')
+                    .select_for_update()[:batch_size]
+                )
+                for cred in rows.iterator():
+                    try:
+                        wrapped = rewrap_dek(bytes(cred.encrypted_dek), cred.kek_id, to_kek_id)
+                    except Exception as e:
+                        raise CommandError(f"Failed to rewrap credential id={cred.pk}: {e}")
+                    cred.encrypted_dek = wrapped['encrypted_dek']
+                    cred.kek_id = wrapped['kek_id']
+                    chunk.append(cred)
+                if not chunk:
+                    break
+                # bulk_update skips save(): the secrets are unchanged, so no target change is announced
+                ServerCredential.objects.bulk_update(chunk, ['encrypted_dek', 'kek_id'])
+            rotated += len(chunk)
+            last_pk = chunk[-1].pk
+            self.stdout.write(f"  {rotated}/{total}")
 
         self.stdout.write(self.style.SUCCESS(f"KEK rotation completed. Rotated {rotated}/{total} credentials."))
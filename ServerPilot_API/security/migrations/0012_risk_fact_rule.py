@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('security', '0011_securitysettings_self_registration_enabled'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='securityrisk',
+            name='fact_rule',
+            field=models.JSONField(blank=True, help_text='Rule evaluated against collected host facts.', null=True),
+        ),
+    ]
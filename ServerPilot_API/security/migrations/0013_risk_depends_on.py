@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('security', '0012_risk_fact_rule'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='securityrisk',
+            name='depends_on',
+            field=models.ManyToManyField(blank=True, help_text="Risks whose fix must run before this risk's fix.", related_name='dependents', to='security.securityrisk'),
+        ),
+    ]
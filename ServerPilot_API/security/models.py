@@ -1,5 +1,6 @@
 from django.db import models
 from django.conf import settings
+from django.core.cache import cache
 
 class PasswordPolicy(models.Model):
     min_length = models.PositiveIntegerField(default=8)
@@ -59,6 +60,10 @@ class SecuritySettings(models.Model):
         verbose_name_plural = "Security Settings"
 
 
+RISK_CATALOG_CACHE_KEY = "security:risk-catalog"
+RISK_CATALOG_CACHE_TIMEOUT = 300  # seconds
+
+
 class SecurityRisk(models.Model):
     """Model representing a security risk check that can be executed on a server or system."""
 
@@ -79,9 +84,19 @@ class SecurityRisk(models.Model):
     # If True, a non-zero exit code from the check_command is expected and considered a success for matching.
     expect_non_zero_exit = models.BooleanField(default=False, help_text="Set to True if a non-zero exit code indicates the risk is present.")
 
+    # Optional declarative rule evaluated against collected host facts instead of
+    # running check_command (see ServerPilot_API.security.rules).
+    fact_rule = models.JSONField(null=True, blank=True, help_text="Rule evaluated against collected host facts.")
+
     # Command to automatically fix / mitigate the risk
     fix_command = models.TextField(blank=True)
 
+    # Risks whose fix must be applied before this one (e.g. install ufw before enabling it).
+    depends_on = models.ManyToManyField(
+        'self', symmetrical=False, related_name='dependents', blank=True,
+        help_text="Risks whose fix must run before this risk's fix.",
+    )
+
     risk_level = models.CharField(max_length=8, choices=RiskLevel.choices, default=RiskLevel.LOW)
 
     # Django group / role name that is required to execute the fix. Default is 'admin'
@@ -95,6 +110,44 @@ class SecurityRisk(models.Model):
     def __str__(self):
         return self.title
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self._invalidate_caches()
+
+    def delete(self, *args, **kwargs):
+        # Findings keep the risk's text through the on_delete of their foreign key.
+        result = super().delete(*args, **kwargs)
+        self._invalidate_caches()
+        return result
+
+    @staticmethod
+    def _invalidate_caches():
+        from ServerPilot_API.Servers.models import bump_compliance_matrix_version
+
+        cache.delete(RISK_CATALOG_CACHE_KEY)
+        bump_compliance_matrix_version()
+
+    @staticmethod
+    def catalog():
+        """
+        Return {risk_id: {title, description, solution, risk_level}} for every risk.
+        Scan findings store only the risk id, so their text is resolved through this
+        cached mapping instead of a per-row join.
+        """
+        catalog = cache.get(RISK_CATALOG_CACHE_KEY)
+        if catalog is None:
+            catalog = {
+                row['id']: {
+                    'title': row['title'],
+                    'description': row['description'],
+                    'solution': row['fix_command'],
+                    'risk_level': row['risk_level'],
+                }
+                for row in SecurityRisk.objects.values('id', 'title', 'description', 'fix_command', 'risk_level')
+            }
+            cache.set(RISK_CATALOG_CACHE_KEY, catalog, RISK_CATALOG_CACHE_TIMEOUT)
+        return catalog
+
     class Meta:
         verbose_name = "Security Risk"
         verbose_name_plural = "Security Risks"
@@ -0,0 +1,169 @@
+"""
+Declarative security rules evaluated against collected host facts.
+
+A SecurityRisk may carry a `fact_rule` instead of relying on its shell
+`check_command`. The rule is evaluated locally against the facts bundle collected
+from the host (see ServerPilot_API.Servers.facts), so changing a rule does not
+require connecting to any server again.
+
+Rule grammar (JSON):
+    {"fact": "sshd_config.permitrootlogin", "op": "eq", "value": "yes"}
+    {"all": [<rule>, ...]}   every sub-rule matches
+    {"any": [<rule>, ...]}   at least one sub-rule matches
+    {"not": <rule>}          the sub-rule does not match
+
+`fact` is a dotted path into the facts bundle. A rule that matches means the
+risk is present.
+"""
+import re
+from typing import Any, Dict, List, Tuple
+
+_MISSING = object()
+
+OPERATORS = {
+    'eq': lambda actual, expected: _normalise(actual) == _normalise(expected),
+    'ne': lambda actual, expected: _normalise(actual) != _normalise(expected),
+    'in': lambda actual, expected: _normalise(actual) in [_normalise(v) for v in expected],
+    'not_in': lambda actual, expected: _normalise(actual) not in [_normalise(v) for v in expected],
+    'contains': lambda actual, expected: _contains(actual, expected),
+    'not_contains': lambda actual, expected: not _contains(actual, expected),
+    'matches': lambda actual, expected: re.search(expected, str(actual)) is not None,
+    'gt': lambda actual, expected: _number(actual) > _number(expected),
+    'gte': lambda actual, expected: _number(actual) >= _number(expected),
+    'lt': lambda actual, expected: _number(actual) < _number(expected),
+    'lte': lambda actual, expected: _number(actual) <= _number(expected),
+}
+# Operators that only look at whether the fact is present.
+PRESENCE_OPERATORS = ('exists', 'missing')
+
+
+class RuleError(ValueError):
+    """Raised when a fact rule is malformed."""
+
+
+def _normalise(value):
+    # Facts are mostly strings read from the host; compare numbers the same way.
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        value = str(value)
+    if isinstance(value, str):
+        return value.strip().lower()
+    return value
+
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        raise RuleError(f"Value {value!r} is not numeric.")
+
+
+def _contains(actual, expected):
+    if isinstance(actual, dict):
+        return expected in actual
+    if isinstance(actual, (list, tuple, set)):
+        return _normalise(expected) in [_normalise(v) for v in actual]
+    return str(expected).lower() in str(actual).lower()
+
+
+def resolve_fact(facts: Dict[str, Any], path: str):
+    """
+    Return the value at a dotted path, or a sentinel when it is missing.
+    Keys that themselves contain dots (sysctl names, file paths) are matched
+    greedily, e.g. 'sysctl.net.ipv4.ip_forward' or 'file_permissions./etc/issue.net.mode'.
+    """
+    parts = path.split('.')
+    value = facts
+    i = 0
+    while i < len(parts):
+        if isinstance(value, dict):
+            for j in range(len(parts), i, -1):
+                key = '.'.join(parts[i:j])
+                if key in value:
+                    value = value[key]
+                    i = j
+                    break
+            else:
+                return _MISSING
+        elif isinstance(value, list) and parts[i].isdigit() and int(parts[i]) < len(value):
+            value = value[int(parts[i])]
+            i += 1
+        else:
+            return _MISSING
+    return value
+
+
+def validate_rule(rule) -> None:
+    """Raise RuleError if the rule does not follow the grammar."""
+    if not isinstance(rule, dict):
+        raise RuleError("A rule must be an object.")
+    if 'all' in rule or 'any' in rule:
+        children = rule.get('all', rule.get('any'))
+        if not isinstance(children, list) or not children:
+            raise RuleError("'all' and 'any' expect a non-empty list of rules.")
+        for child in children:
+            validate_rule(child)
+        return
+    if 'not' in rule:
+        validate_rule(rule['not'])
+        return
+    if not isinstance(rule.get('fact'), str) or not rule['fact']:
+        raise RuleError("A rule needs a 'fact' path.")
+    op = rule.get('op')
+    if op in PRESENCE_OPERATORS:
+        return
+    if op not in OPERATORS:
+        raise RuleError(f"Unknown operator {op!r}.")
+    if 'value' not in rule:
+        raise RuleError(f"Operator {op!r} needs a 'value'.")
+    if op in ('in', 'not_in') and not isinstance(rule['value'], list):
+        raise RuleError(f"Operator {op!r} expects a list value.")
+    if op == 'matches':
+        try:
+            re.compile(rule['value'])
+        except re.error as e:
+            raise RuleError(f"Invalid regular expression: {e}")
+
+
+def rule_facts(rule) -> List[str]:
+    """Return the fact paths a rule reads, in order of appearance."""
+    if 'all' in rule or 'any' in rule:
+        return [path for child in rule.get('all', rule.get('any')) for path in rule_facts(child)]
+    if 'not' in rule:
+        return rule_facts(rule['not'])
+    return [rule['fact']]
+
+
+def evaluate_rule(rule, facts: Dict[str, Any]) -> bool:
+    """Evaluate a rule against a facts bundle. Missing facts never match a comparison."""
+    if 'all' in rule:
+        return all(evaluate_rule(child, facts) for child in rule['all'])
+    if 'any' in rule:
+        return any(evaluate_rule(child, facts) for child in rule['any'])
+    if 'not' in rule:
+        return not evaluate_rule(rule['not'], facts)
+
+    actual = resolve_fact(facts, rule['fact'])
+    op = rule['op']
+    if op == 'exists':
+        return actual is not _MISSING
+    if op == 'missing':
+        return actual is _MISSING
+    if actual is _MISSING:
+        return False
+    try:
+        return OPERATORS[op](actual, rule['value'])
+    except RuleError:
+        return False
+
+
+def evaluate_risk(risk, facts: Dict[str, Any]) -> Tuple[bool, str]:
+    """
+    Evaluate a risk's fact rule. Returns (risk_found, evidence) where evidence lists
+    the values of the facts the rule looked at, so output hashes change with them.
+    """
+    found = evaluate_rule(risk.fact_rule, facts)
+    evidence = []
+    for path in rule_facts(risk.fact_rule):
+        value = resolve_fact(facts, path)
+        evidence.append(f"{path}={'<missing>' if value is _MISSING else value}")
+    return found, '\n'.join(evidence)
@@ -1,5 +1,6 @@
 from rest_framework import serializers
 from .models import PasswordPolicy, SecuritySettings, SecurityRisk
+from .rules import RuleError, validate_rule
 
 class PasswordPolicySerializer(serializers.ModelSerializer):
     class Meta:
@@ -17,3 +18,12 @@ class SecurityRiskSerializer(serializers.ModelSerializer):
     class Meta:
         model = SecurityRisk
         fields = '__all__'
+
+    def validate_fact_rule(self, value):
+        if value is None:
+            return value
+        try:
+            validate_rule(value)
+        except RuleError as e:
+            raise serializers.ValidationError(str(e))
+        return value
@@ -0,0 +1,104 @@
+import json
+import os
+from io import StringIO
+
+import pytest
+from cryptography.exceptions import InvalidTag
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+
+from ServerPilot_API.Customers.models import Customer
+from ServerPilot_API.Servers.models import Server, ServerCredential
+from ServerPilot_API.security import crypto
+
+pytestmark = pytest.mark.django_db
+
+OLD_KEK = os.urandom(32)
+NEW_KEK = os.urandom(32)
+
+
+@pytest.fixture(autouse=True)
+def keys(monkeypatch):
+    monkeypatch.setattr(crypto, "_KEK", NEW_KEK)
+    monkeypatch.setattr(crypto, "_KEK_ID", "2")
+    monkeypatch.setattr(crypto, "_KEYRING", {"1": OLD_KEK})
+
+
+# From a password up to a large private key
+SIZES = [1, 16, 256, 4096, 16384]
+
+
+@pytest.mark.parametrize("size", SIZES)
+def test_round_trip_and_rewrap(size):
+    secret = os.urandom(size)
+    enc = crypto.encrypt_secret(secret)
+    assert len(enc["ciphertext"]) == size + 16 and len(enc["nonce"]) == 12
+    assert crypto.decrypt_secret(enc) == secret
+    assert crypto.decrypt_secret({**enc, "ciphertext": bytearray(enc["ciphertext"])}) == secret
+
+    rewrapped = crypto.rewrap_encrypted_dek(enc["encrypted_dek"], NEW_KEK, OLD_KEK)
+    assert crypto.decrypt_secret({**enc, "encrypted_dek": rewrapped, "kek_id": "1"}) == secret
+
+
+def test_decrypt_secret_rejects_non_bytes():
+    enc = crypto.encrypt_secret(b"s3cret")
+    with pytest.raises(TypeError):
+        crypto.decrypt_secret({**enc, "nonce": enc["nonce"].hex()})
+    with pytest.raises(TypeError):
+        crypto.decrypt_secrets([{**enc, "ciphertext": None}])
+
+
+@pytest.mark.parametrize("max_workers", [None, 4])
+def test_decrypt_secrets_in_order(max_workers):
+    envelopes = [crypto.encrypt_secret(f"secret-{i}".encode()) for i in range(10)]
+    assert crypto.decrypt_secrets(envelopes, max_workers=max_workers) == [f"secret-{i}".encode() for i in range(10)]
+
+
+def test_decrypt_secrets_errors():
+    good = crypto.encrypt_secret(b"good")
+    tampered = {**crypto.encrypt_secret(b"bad"), "nonce": os.urandom(12)}
+    unknown = {**crypto.encrypt_secret(b"lost"), "kek_id": "0"}
+
+    with pytest.raises(InvalidTag):
+        crypto.decrypt_secrets([good, tampered])
+    results = crypto.decrypt_secrets([good, tampered, unknown, unknown], max_workers=2, return_exceptions=True)
+    assert results[0] == b"good"
+    assert isinstance(results[1], InvalidTag)
+    assert isinstance(results[2], ImproperlyConfigured)
+    # Envelopes sharing a missing KEK each get their own exception.
+    assert results[3] is not results[2] and results[3].args == results[2].args
+
+
+def test_latest_credential_per_server(django_user_model, django_assert_num_queries, monkeypatch):
+    owner = django_user_model.objects.create_user(username="owner", email="owner@example.com", password="pass")
+    customer = Customer.objects.create(owner=owner, email="cust@example.com")
+    servers = [Server.objects.create(customer=customer, server_name=f"S{i}", server_ip=f"10.0.0.{i}") for i in range(3)]
+
+    monkeypatch.setattr(crypto, "_KEK_ID", "1")
+    monkeypatch.setattr(crypto, "_KEK", OLD_KEK)
+    ServerCredential.objects.create(server=servers[0], username="old", **crypto.encrypt_secret(b"old"))
+    monkeypatch.setattr(crypto, "_KEK_ID", "2")
+    monkeypatch.setattr(crypto, "_KEK", NEW_KEK)
+    ServerCredential.objects.create(server=servers[0], username="new", **crypto.encrypt_secret(b"new"))
+    ServerCredential.objects.create(server=servers[1], username="deploy", **crypto.encrypt_secret(b"pw"))
+
+    with django_assert_num_queries(1):
+        credentials = ServerCredential.latest_for([s.id for s in servers])
+    assert {server_id: (cred.username, cred.decrypt(rewrap=False)) for server_id, cred in credentials.items()} == {
+        servers[0].id: ("new", b"new"),
+        servers[1].id: ("deploy", b"pw"),
+    }
+
+
+def test_bench_crypto_command():
+    out = StringIO()
+    call_command("bench_crypto", "--sizes", "16,16384", "--iterations", "4", "--batch-size", "2", "--workers", "2", "--json", stdout=out)
+    results = json.loads(out.getvalue())
+    assert {(r["operation"], r["size"]) for r in results} == {
+        (operation, size)
+        for operation in ["encrypt_secret", "decrypt_secret", "rewrap_encrypted_dek", "decrypt_secrets", "decrypt_secrets x2"]
+        for size in (16, 16384)
+    }
+    assert all(r["ops_per_sec"] > 0 and r["peak_bytes_per_call"] >= 0 for r in results)
+    # The throwaway KEK does not leak into the configured keys
+    assert crypto._KEK == NEW_KEK and crypto._KEK_ID == "2"
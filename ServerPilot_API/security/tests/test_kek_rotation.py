@@ -0,0 +1,103 @@
+import os
+from io import StringIO
+
+import pytest
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.core.management.base import CommandError
+
+from ServerPilot_API.Customers.models import Customer
+from ServerPilot_API.Servers.models import Server, ServerCredential
+from ServerPilot_API.security import crypto
+
+pytestmark = pytest.mark.django_db
+
+OLD_KEK = os.urandom(32)
+NEW_KEK = os.urandom(32)
+
+
+def use_keys(monkeypatch, active_id, active_key, keyring=None):
+    monkeypatch.setattr(crypto, "_KEK", active_key)
+    monkeypatch.setattr(crypto, "_KEK_ID", active_id)
+    monkeypatch.setattr(crypto, "_KEYRING", keyring or {})
+
+
+@pytest.fixture
+def server(django_user_model):
+    owner = django_user_model.objects.create_user(username="owner", email="owner@example.com", password="pass")
+    customer = Customer.objects.create(owner=owner, email="cust@example.com")
+    return Server.objects.create(customer=customer, server_name="S1", server_ip="10.0.0.5")
+
+
+def add_credentials(server, count):
+    for i in range(count):
+        enc = crypto.encrypt_secret(f"secret-{i}".encode())
+        ServerCredential.objects.create(server=server, username=f"user{i}", **enc)
+
+
+def test_encrypt_records_kek_id_and_decrypts_with_keyring(monkeypatch):
+    use_keys(monkeypatch, "1", OLD_KEK)
+    enc = crypto.encrypt_secret(b"s3cret")
+    assert enc["kek_id"] == "1"
+
+    use_keys(monkeypatch, "2", NEW_KEK, {"1": OLD_KEK})
+    assert crypto.decrypt_secret(enc) == b"s3cret"
+    assert crypto.needs_rewrap("1") and not crypto.needs_rewrap("2")
+
+    rewrapped = {**enc, **crypto.rewrap_dek(enc["encrypted_dek"], enc["kek_id"])}
+    assert rewrapped["kek_id"] == "2"
+    use_keys(monkeypatch, "2", NEW_KEK)
+    assert crypto.decrypt_secret(rewrapped) == b"s3cret"
+    with pytest.raises(ImproperlyConfigured):
+        crypto.decrypt_secret(enc)
+
+
+def test_keyring_from_environment(monkeypatch):
+    monkeypatch.setattr(crypto, "_KEYRING", None)
+    monkeypatch.setenv("SERVERPILOT_MASTER_KEYRING", f"1:{OLD_KEK.hex()}, 0:{NEW_KEK.hex()}")
+    assert crypto._load_keyring() == {"1": OLD_KEK, "0": NEW_KEK}
+
+    monkeypatch.setattr(crypto, "_KEYRING", None)
+    monkeypatch.setenv("SERVERPILOT_MASTER_KEYRING", OLD_KEK.hex())
+    with pytest.raises(ImproperlyConfigured):
+        crypto._load_keyring()
+
+
+def test_rotate_kek_rewraps_in_chunks(monkeypatch, server):
+    use_keys(monkeypatch, "1", OLD_KEK)
+    add_credentials(server, 5)
+
+    use_keys(monkeypatch, "2", NEW_KEK, {"1": OLD_KEK})
+    out = StringIO()
+    call_command("rotate_kek", "--batch-size", "2", stdout=out)
+    assert "Rotated 5/5" in out.getvalue()
+    assert set(ServerCredential.objects.values_list("kek_id", flat=True)) == {"2"}
+
+    # Nothing left to do; the old KEK is no longer needed.
+    use_keys(monkeypatch, "2", NEW_KEK)
+    call_command("rotate_kek", stdout=StringIO())
+    secrets = sorted(cred.decrypt().decode() for cred in ServerCredential.objects.all())
+    assert secrets == [f"secret-{i}" for i in range(5)]
+
+
+def test_rotate_kek_refuses_unknown_kek(monkeypatch, server):
+    use_keys(monkeypatch, "1", OLD_KEK)
+    add_credentials(server, 1)
+
+    use_keys(monkeypatch, "2", NEW_KEK)
+    with pytest.raises(CommandError, match="KEK 1 is not configured"):
+        call_command("rotate_kek", stdout=StringIO())
+    assert ServerCredential.objects.get().kek_id == "1"
+
+
+def test_decrypt_rewraps_lazily(monkeypatch, server):
+    use_keys(monkeypatch, "1", OLD_KEK)
+    add_credentials(server, 1)
+
+    use_keys(monkeypatch, "2", NEW_KEK, {"1": OLD_KEK})
+    cred = ServerCredential.objects.get()
+    assert cred.decrypt(rewrap=False) == b"secret-0"
+    assert ServerCredential.objects.get().kek_id == "1"
+    assert cred.decrypt() == b"secret-0"
+    assert ServerCredential.objects.get().kek_id == "2"
+    assert ServerCredential.objects.get().decrypt() == b"secret-0"
@@ -117,3 +117,9 @@ def test_create_missing_required_field_returns_400(api_client, admin_user, secur
     res = auth(api_client, admin_user).post(base_url, bad_payload, format="json")
     assert res.status_code == 400
     assert "title" in res.data
+
+
+@pytest.mark.parametrize("risk_ids", [1, [1, "2"], [1.5], [True], [None]])
+def test_reevaluate_rejects_non_integer_risk_ids(api_client, admin_user, risk_ids):
+    res = auth(api_client, admin_user).post(reverse("security-risk-reevaluate"), {"risk_ids": risk_ids}, format="json")
+    assert res.status_code == 400
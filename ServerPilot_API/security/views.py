@@ -1,4 +1,5 @@
 from rest_framework import viewsets, permissions, status
+from rest_framework.decorators import action
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from .models import PasswordPolicy, SecuritySettings, SecurityRisk
@@ -75,3 +76,28 @@ class SecurityRiskViewSet(viewsets.ModelViewSet):
     serializer_class = SecurityRiskSerializer
     permission_classes = [permissions.IsAdminUser]
 
+    @action(detail=False, methods=['post'], url_path='reevaluate')
+    def reevaluate(self, request):
+        """
+        Queue a re-evaluation of fact rules against the cached facts of all servers.
+        Accepts an optional 'risk_ids' list to limit the re-evaluation.
+        """
+        from ServerPilot_API.Servers.tasks import reevaluate_fact_rules
+
+        risk_ids = request.data.get('risk_ids')
+        if risk_ids is not None and (
+            not isinstance(risk_ids, list)
+            or not all(isinstance(risk_id, int) and not isinstance(risk_id, bool) for risk_id in risk_ids)
+        ):
+            return Response({'error': 'risk_ids must be a list of integers.'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            task = reevaluate_fact_rules.delay(risk_ids)
+            return Response(
+                {'message': 'Fact rule re-evaluation started.', 'task_id': task.id},
+                status=status.HTTP_202_ACCEPTED
+            )
+        except Exception as e:
+            return Response(
+                {'error': f'Failed to start re-evaluation task: {str(e)}'},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
@@ -387,7 +387,7 @@ const FirewallTab = () => {
                     <TableRow key={rule.id}>
                       {editingRuleId === rule.id ? (
                         <>
-                          <TableCell>{rule.id}</TableCell>
+                          <TableCell>{rule.ufw_number ?? '-'}</TableCell>
                           <TableCell>
                             <Select 
                               size="small" 
@@ -439,7 +439,7 @@ const FirewallTab = () => {
                         </>
                       ) : (
                         <>
-                          <TableCell>{rule.id}</TableCell>
+                          <TableCell>{rule.ufw_number ?? '-'}</TableCell>
                           <TableCell>{rule.protocol}</TableCell>
                           <TableCell>{rule.port}</TableCell>
                           <TableCell>{rule.action}</TableCell>
@@ -0,0 +1,154 @@
+# jwt_cache.py
+"""Cache of verified JWTs.
+
+Verifying a token (decode + HMAC + claim checks) is done once; afterwards the
+token's SHA-256 digest maps to its claims until the token's `exp`, so repeated
+connects with the same token skip the crypto entirely. The cache is a bounded
+LRU and never holds the token itself.
+
+Revocation hook: `revoke(jti=..., subject=..., token=...)` makes matching tokens
+fail verification from then on, whether cached or not. Revoking a subject
+rejects its tokens issued (`iat`) at or before the revocation. Revocations are
+kept only until the longest-lived affected token would have expired anyway.
+
+`listen_for_revocations` applies revocations published as JSON on a Redis
+channel, e.g. {"sub": "42"}, {"jti": "..."} or {"jti": "...", "exp": 1700000000},
+so every worker and replica sees them.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger("ws_ssh_proxy")
+
+# Expired revocations are swept at most this often (seconds)
+_SWEEP_INTERVAL = 60.0
+
+
+def token_digest(token: str) -> bytes:
+    return hashlib.sha256(token.encode("utf-8")).digest()
+
+
+class VerifiedTokenCache:
+    def __init__(self, max_entries: int = 10000, max_revocation_age: float = 86400.0, clock: Callable[[], float] = time.time):
+        self.max_entries = max_entries
+        self.max_revocation_age = max_revocation_age
+        self.clock = clock
+        # digest -> (exp, claims)
+        self._entries: "OrderedDict[bytes, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        # jti / subject / digest -> revoked until (epoch seconds)
+        self._revoked_jti: Dict[str, float] = {}
+        self._revoked_digest: Dict[bytes, float] = {}
+        # subject -> (revoked at, revoked until)
+        self._revoked_subject: Dict[str, Tuple[float, float]] = {}
+        self._next_sweep = 0.0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, token: str) -> Optional[Dict[str, Any]]:
+        """Return the cached claims of `token`, or None if it has to be verified."""
+        digest = token_digest(token)
+        entry = self._entries.get(digest)
+        if entry is None:
+            self.misses += 1
+            return None
+        if entry[0] <= self.clock():
+            del self._entries[digest]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(digest)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, token: str, claims: Dict[str, Any]):
+        exp = claims.get("exp")
+        if not isinstance(exp, (int, float)):
+            return
+        digest = token_digest(token)
+        self._entries[digest] = (float(exp), claims)
+        self._entries.move_to_end(digest)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def is_revoked(self, token: str, claims: Dict[str, Any]) -> bool:
+        if not (self._revoked_jti or self._revoked_digest or self._revoked_subject):
+            return False
+        now = self.clock()
+        if now >= self._next_sweep:
+            self._expire_revocations(now)
+            self._next_sweep = now + _SWEEP_INTERVAL
+        if token_digest(token) in self._revoked_digest:
+            return True
+        jti = claims.get("jti")
+        if jti is not None and str(jti) in self._revoked_jti:
+            return True
+        subject = claims.get("sub", claims.get("user_id"))
+        if subject is not None and str(subject) in self._revoked_subject:
+            revoked_at = self._revoked_subject[str(subject)][0]
+            issued_at = claims.get("iat")
+            return not isinstance(issued_at, (int, float)) or issued_at <= revoked_at
+        return False
+
+    def revoke(self, jti: Optional[str] = None, subject: Optional[str] = None, token: Optional[str] = None, until: Optional[float] = None):
+        """Revoke a token by jti, by raw token, or all tokens of `subject` issued up to now.
+
+        `until` is when the revocation can be forgotten (normally the token's exp);
+        it defaults to now + max_revocation_age.
+        """
+        now = self.clock()
+        until = until if until is not None else now + self.max_revocation_age
+        if jti is not None:
+            self._revoked_jti[str(jti)] = until
+        if token is not None:
+            digest = token_digest(token)
+            self._revoked_digest[digest] = until
+            self._entries.pop(digest, None)
+        if subject is not None:
+            self._revoked_subject[str(subject)] = (now, until)
+        if jti is not None or subject is not None:
+            for digest, (_exp, claims) in list(self._entries.items()):
+                if (jti is not None and str(claims.get("jti")) == str(jti)) or (
+                    subject is not None and str(claims.get("sub", claims.get("user_id"))) == str(subject)
+                ):
+                    del self._entries[digest]
+
+    def _expire_revocations(self, now: float):
+        for revoked in (self._revoked_jti, self._revoked_digest):
+            for key in [key for key, until in revoked.items() if until <= now]:
+                del revoked[key]
+        for key in [key for key, (_at, until) in self._revoked_subject.items() if until <= now]:
+            del self._revoked_subject[key]
+
+    def clear(self):
+        self._entries.clear()
+
+
+async def listen_for_revocations(cache: VerifiedTokenCache, redis_url: str, channel: str):
+    """Apply revocations published on `channel`; reconnects until cancelled."""
+    import redis.asyncio as redis
+
+    while True:
+        try:
+            client = redis.from_url(redis_url)
+            async with client.pubsub() as pubsub:
+                await pubsub.subscribe(channel)
+                async for message in pubsub.listen():
+                    if message.get("type") != "message":
+                        continue
+                    try:
+                        data = json.loads(message["data"])
+                        cache.revoke(jti=data.get("jti"), subject=data.get("sub"), until=data.get("exp"))
+                    except (TypeError, ValueError, AttributeError) as e:
+                        logger.warning("Ignoring malformed JWT revocation message: %s", e)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning("JWT revocation listener failed, retrying in 5s: %s", e)
+            await asyncio.sleep(5)
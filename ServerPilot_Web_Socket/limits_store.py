@@ -0,0 +1,295 @@
+# limits_store.py
+"""Connection accounting and rate limits shared between proxy workers.
+
+Both limits are enforced by a store with the same async interface:
+
+- `hit(key)`: count a connection attempt against the sliding-window rate limit.
+- `acquire(key, limit)`: take one of `limit` concurrent-connection slots and
+  return a lease id (None if all slots are taken). Leases expire after
+  `lease_ttl` seconds unless renewed, so slots held by a crashed worker free
+  themselves; `ConnectionLease` renews its lease in the background.
+- `release(key, lease_id)`: give the slot back.
+
+`RedisLimitStore` performs every operation in a single Lua script, so checks
+are atomic across uvicorn workers and replicas. Each script only touches the
+key it is passed, so it also runs on Redis Cluster. It uses Redis server time,
+so worker clocks do not need to agree. `LocalLimitStore` keeps the same state in
+process memory; it is used when no REDIS_URL is configured and as a fallback
+while Redis is unreachable. With `fail_closed`, a Redis error instead refuses
+new connections (existing ones keep their slots) until Redis is back.
+"""
+import asyncio
+import logging
+import time
+import uuid
+from typing import Awaitable, Callable, Dict, Optional
+
+from rate_limit import SlidingWindowRateLimiter
+
+logger = logging.getLogger("ws_ssh_proxy")
+
+# KEYS[1] = hash of window index -> attempts in that window
+# ARGV[1] = limit, ARGV[2] = window (seconds)
+# Returns 1 if the attempt is allowed (and counted), 0 otherwise.
+RATE_LIMIT_SCRIPT = """
+local limit = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local index = math.floor(now / window)
+for _, field in ipairs(redis.call('HKEYS', KEYS[1])) do
+    if tonumber(field) < index - 1 then
+        redis.call('HDEL', KEYS[1], field)
+    end
+end
+local previous = tonumber(redis.call('HGET', KEYS[1], tostring(index - 1)) or '0')
+local current = tonumber(redis.call('HGET', KEYS[1], tostring(index)) or '0')
+local overlap = 1 - (now / window - index)
+if previous * overlap + current >= limit then
+    return 0
+end
+redis.call('HINCRBY', KEYS[1], tostring(index), 1)
+redis.call('EXPIRE', KEYS[1], window * 2)
+return 1
+"""
+
+# KEYS[1] = sorted set of lease id -> expiry (ms)
+# ARGV[1] = limit, ARGV[2] = lease id, ARGV[3] = ttl (ms)
+# Returns 1 if the lease was granted, 0 if all slots are taken.
+ACQUIRE_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local ttl = tonumber(ARGV[3])
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now)
+if redis.call('ZCARD', KEYS[1]) >= tonumber(ARGV[1]) then
+    return 0
+end
+redis.call('ZADD', KEYS[1], now + ttl, ARGV[2])
+redis.call('PEXPIRE', KEYS[1], ttl)
+return 1
+"""
+
+# KEYS[1] = sorted set of leases, ARGV[1] = lease id, ARGV[2] = ttl (ms)
+# Returns 1 if the lease was still held and has been extended, 0 if it had expired.
+RENEW_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local ttl = tonumber(ARGV[2])
+local expiry = redis.call('ZSCORE', KEYS[1], ARGV[1])
+if not expiry or tonumber(expiry) <= now then
+    redis.call('ZREM', KEYS[1], ARGV[1])
+    return 0
+end
+redis.call('ZADD', KEYS[1], now + ttl, ARGV[1])
+if redis.call('PTTL', KEYS[1]) < ttl then
+    redis.call('PEXPIRE', KEYS[1], ttl)
+end
+return 1
+"""
+
+
+class LocalLimitStore:
+    """In-process store: limits hold per worker only."""
+
+    def __init__(self, rate_limit: int, window: float = 60.0, lease_ttl: float = 30.0, max_keys: int = 100000):
+        self.rate_limiter = SlidingWindowRateLimiter(rate_limit, window=window, max_keys=max_keys)
+        self.lease_ttl = lease_ttl
+        self.leases: Dict[str, Dict[str, float]] = {}  # key -> {lease id: expiry}
+
+    async def hit(self, key: str) -> bool:
+        return self.rate_limiter.hit(key)
+
+    def _live(self, key: str) -> Dict[str, float]:
+        now = time.monotonic()
+        leases = self.leases.get(key, {})
+        for lease_id in [lid for lid, expiry in leases.items() if expiry <= now]:
+            del leases[lease_id]
+        return leases
+
+    async def acquire(self, key: str, limit: int, lease_id: Optional[str] = None) -> Optional[str]:
+        leases = self._live(key)
+        if len(leases) >= limit:
+            return None
+        lease_id = lease_id or uuid.uuid4().hex
+        leases[lease_id] = time.monotonic() + self.lease_ttl
+        self.leases[key] = leases
+        return lease_id
+
+    async def renew(self, key: str, lease_id: str) -> bool:
+        leases = self._live(key)
+        if lease_id not in leases:
+            return False
+        leases[lease_id] = time.monotonic() + self.lease_ttl
+        return True
+
+    async def release(self, key: str, lease_id: str):
+        leases = self.leases.get(key)
+        if leases is not None:
+            leases.pop(lease_id, None)
+            if not leases:
+                del self.leases[key]
+
+    def active(self, key: str) -> int:
+        return len(self._live(key))
+
+
+class RedisLimitStore:
+    """Redis-backed store shared by every worker; falls back to a local store when Redis fails.
+
+    `on_fallback(operation)` is called for every operation Redis could not serve
+    ("hit", "acquire", "renew" or "release"), e.g. to count it in a metric.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        rate_limit: int,
+        window: int = 60,
+        lease_ttl: float = 30.0,
+        prefix: str = "ws_ssh:",
+        max_keys: int = 100000,
+        fail_closed: bool = False,
+        on_fallback: Optional[Callable[[str], None]] = None,
+    ):
+        import redis.asyncio as redis  # only needed when REDIS_URL is configured
+
+        self.redis = redis.from_url(url)
+        self.rate_limit = rate_limit
+        self.window = int(window)
+        self.lease_ttl = lease_ttl
+        self.prefix = prefix
+        self.fail_closed = fail_closed
+        self.on_fallback = on_fallback
+        self.fallback = LocalLimitStore(rate_limit, window=window, lease_ttl=lease_ttl, max_keys=max_keys)
+        self._rate_limit = self.redis.register_script(RATE_LIMIT_SCRIPT)
+        self._acquire = self.redis.register_script(ACQUIRE_SCRIPT)
+        self._renew = self.redis.register_script(RENEW_SCRIPT)
+
+    @property
+    def _ttl_ms(self) -> int:
+        return int(self.lease_ttl * 1000)
+
+    def _failed(self, operation: str, error: Exception, consequence: str):
+        logger.error("Redis %s failed, %s: %s", operation, consequence, error)
+        if self.on_fallback is not None:
+            self.on_fallback(operation)
+
+    async def hit(self, key: str) -> bool:
+        try:
+            allowed = await self._rate_limit(keys=[f"{self.prefix}rate:{key}"], args=[self.rate_limit, self.window])
+            return bool(allowed)
+        except Exception as e:
+            if self.fail_closed:
+                self._failed("hit", e, "refusing the connection")
+                return False
+            self._failed("hit", e, "using the local limiter")
+            return await self.fallback.hit(key)
+
+    async def acquire(self, key: str, limit: int, lease_id: Optional[str] = None) -> Optional[str]:
+        lease_id = lease_id or uuid.uuid4().hex
+        try:
+            granted = await self._acquire(keys=[f"{self.prefix}leases:{key}"], args=[limit, lease_id, self._ttl_ms])
+            return lease_id if granted else None
+        except Exception as e:
+            if self.fail_closed:
+                self._failed("acquire", e, "refusing the connection")
+                return None
+            self._failed("acquire", e, "using local accounting")
+            return await self.fallback.acquire(key, limit, lease_id)
+
+    async def renew(self, key: str, lease_id: str) -> bool:
+        try:
+            return bool(await self._renew(keys=[f"{self.prefix}leases:{key}"], args=[lease_id, self._ttl_ms]))
+        except Exception as e:
+            if self.fail_closed:
+                # Keep the connection; its slot is counted again once Redis is back
+                self._failed("renew", e, "keeping the lease")
+                return True
+            self._failed("renew", e, "using local accounting")
+            return await self.fallback.renew(key, lease_id)
+
+    async def release(self, key: str, lease_id: str):
+        await self.fallback.release(key, lease_id)
+        try:
+            await self.redis.zrem(f"{self.prefix}leases:{key}", lease_id)
+        except Exception as e:
+            self._failed("release", e, "the lease will expire on its own")
+
+
+class ConnectionLease:
+    """A concurrency slot held for the lifetime of one connection and renewed in the background.
+
+    If the lease expired and its slot has been taken by another connection in the
+    meantime, renewal stops and `on_lost` is awaited so the connection can be ended.
+    """
+
+    def __init__(
+        self,
+        store,
+        key: str,
+        limit: int,
+        renew_interval: float,
+        on_lost: Optional[Callable[[], Awaitable[None]]] = None,
+    ):
+        self.store = store
+        self.key = key
+        self.limit = limit
+        self.renew_interval = renew_interval
+        self.on_lost = on_lost
+        self.lease_id: Optional[str] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def acquire(self) -> bool:
+        self.lease_id = await self.store.acquire(self.key, self.limit)
+        if self.lease_id is None:
+            return False
+        self._task = asyncio.create_task(self._renew_loop())
+        return True
+
+    async def _renew_loop(self):
+        while True:
+            await asyncio.sleep(self.renew_interval)
+            if not await self.store.renew(self.key, self.lease_id):
+                # Expired (e.g. the event loop stalled past the TTL); take a slot again if one is free.
+                logger.warning("Connection lease for %s expired; re-acquiring", self.key)
+                if await self.store.acquire(self.key, self.limit, self.lease_id) is None:
+                    logger.warning("Connection slot for %s was taken meanwhile; ending the connection", self.key)
+                    # on_lost usually releases the lease; this task must not cancel itself
+                    self._task = None
+                    if self.on_lost is not None:
+                        await self.on_lost()
+                    return
+
+    async def release(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self.lease_id is not None:
+            await self.store.release(self.key, self.lease_id)
+            self.lease_id = None
+
+
+def create_limits_store(
+    redis_url: Optional[str],
+    rate_limit: int,
+    window: int,
+    lease_ttl: float,
+    prefix: str,
+    max_keys: int,
+    fail_closed: bool = False,
+    on_fallback: Optional[Callable[[str], None]] = None,
+):
+    if redis_url:
+        logger.info("Using Redis for shared connection limits")
+        return RedisLimitStore(
+            redis_url,
+            rate_limit,
+            window=window,
+            lease_ttl=lease_ttl,
+            prefix=prefix,
+            max_keys=max_keys,
+            fail_closed=fail_closed,
+            on_fallback=on_fallback,
+        )
+    logger.info("REDIS_URL not set; connection limits are enforced per worker")
+    return LocalLimitStore(rate_limit, window=window, lease_ttl=lease_ttl, max_keys=max_keys)
@@ -0,0 +1,411 @@
+# loadtest.py
+"""Load test for ws_server: how many concurrent terminals can one process sustain?
+
+Starts a local asyncssh server standing in for the managed hosts: every session
+gets a fake shell that echoes input immediately (like a tty) and streams output
+at `--output-rate` bytes/s. N simulated clients then connect through
+/ws/servers/{id}/ssh with valid JWTs, type a keystroke every
+`--keystroke-interval` seconds and read everything the proxy forwards.
+
+Reported after the run:
+- throughput: terminal output received by all clients (MB/s)
+- keystroke echo latency p50/p99/max: from sending a key to receiving its echo
+- memory per session: growth of the proxy's RSS divided by the sessions opened
+- CPU per MB forwarded: proxy CPU seconds per MB of output delivered
+
+Proxy CPU and memory come from its /metrics endpoint (process_* series), so a
+proxy started elsewhere can be measured as long as it can reach the SSH
+stand-in (`--ssh-host`). With `--spawn-proxy` a proxy is started on a free port
+with the rate limit raised for the test; other settings (RECORDING_DIR, ...)
+are taken from the environment, which makes it easy to compare configurations.
+
+The load generator runs in one process too; when its own CPU use approaches a
+full core the numbers measure the generator rather than the proxy, so it is
+reported as well.
+
+Examples:
+    python loadtest.py --spawn-proxy --clients 200 --duration 30
+    python loadtest.py --url ws://10.0.0.2:5000 --jwt-secret-file jwt.key --ssh-host 10.0.0.3 --clients 500
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import re
+import resource
+import secrets
+import socket
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional
+
+import asyncssh
+import httpx
+import jwt  # PyJWT
+import websockets
+
+# Echoed keystrokes look like "#<seq>;"; the streamed output never contains '#'
+_MARKER_RE = re.compile(rb"#(\d+);")
+_OUTPUT_LINE = b"x" * 78 + b"\r\n"
+
+
+# ---------- SSH STAND-IN ----------
+class _AcceptAnyPassword(asyncssh.SSHServer):
+    def begin_auth(self, username: str) -> bool:
+        return True
+
+    def password_auth_supported(self) -> bool:
+        return True
+
+    def validate_password(self, username: str, password: str) -> bool:
+        return True
+
+
+def _fake_shell(output_rate: int, chunk_size: int):
+    payload = (_OUTPUT_LINE * (chunk_size // len(_OUTPUT_LINE) + 1))[:chunk_size]
+
+    async def stream(process: asyncssh.SSHServerProcess):
+        interval = chunk_size / output_rate
+        next_write = time.monotonic()
+        while True:
+            process.stdout.write(payload)
+            # Respect the proxy's flow control instead of buffering without bound
+            await process.stdout.drain()
+            next_write += interval
+            await asyncio.sleep(max(0.0, next_write - time.monotonic()))
+
+    async def shell(process: asyncssh.SSHServerProcess):
+        streamer = asyncio.create_task(stream(process)) if output_rate > 0 else None
+        try:
+            while True:
+                data = await process.stdin.read(4096)
+                if not data:
+                    break
+                process.stdout.write(data)
+        except (asyncssh.BreakReceived, asyncssh.SignalReceived, asyncssh.TerminalSizeChanged):
+            pass
+        except (asyncssh.Error, OSError, BrokenPipeError):
+            pass
+        finally:
+            if streamer is not None:
+                streamer.cancel()
+            process.exit(0)
+
+    return shell
+
+
+async def start_ssh_server(host: str, port: int, output_rate: int, chunk_size: int):
+    return await asyncssh.create_server(
+        _AcceptAnyPassword,
+        host,
+        port,
+        server_host_keys=[asyncssh.generate_private_key("ssh-ed25519")],
+        process_factory=_fake_shell(output_rate, chunk_size),
+        encoding=None,
+        line_editor=False,
+    )
+
+
+# ---------- PROXY ----------
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def spawn_proxy(port: int, jwt_secret: str, log_path: Optional[str]) -> subprocess.Popen:
+    env = dict(os.environ)
+    for name in ("SERVER_API_URL", "JWT_SECRET_FILE", "JWT_ISSUER", "JWT_AUDIENCE", "METRICS_TOKEN", "METRICS_TOKEN_FILE"):
+        env.pop(name, None)
+    env.update({
+        "JWT_SECRET": jwt_secret,
+        "JWT_ALGORITHM": "HS256",
+        "ALLOWED_ORIGINS": "*",
+        "MAX_REQS_PER_MINUTE": str(10 ** 9),
+    })
+    log = open(log_path, "ab") if log_path else subprocess.DEVNULL
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "ws_server:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env=env,
+        stdout=log,
+        stderr=subprocess.STDOUT,
+    )
+
+
+async def scrape(client: httpx.AsyncClient, url: str, token: Optional[str]) -> Dict[str, float]:
+    """Return the unlabelled samples of the proxy's /metrics."""
+    headers = {"Authorization": f"Bearer {token}"} if token else {}
+    response = await client.get(url, headers=headers)
+    response.raise_for_status()
+    samples = {}
+    for line in response.text.splitlines():
+        if line.startswith("#") or "{" in line:
+            continue
+        name, _, value = line.partition(" ")
+        try:
+            samples[name] = float(value)
+        except ValueError:
+            pass
+    return samples
+
+
+async def wait_for_proxy(client: httpx.AsyncClient, url: str, proc: subprocess.Popen, timeout: float = 20.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"proxy exited with status {proc.returncode}")
+        try:
+            await scrape(client, url, None)
+            return
+        except httpx.HTTPError:
+            await asyncio.sleep(0.2)
+    raise RuntimeError("proxy did not start listening in time")
+
+
+# ---------- CLIENTS ----------
+class Stats:
+    def __init__(self):
+        self.connected = 0
+        self.failed = 0
+        self.errors: Dict[str, int] = {}
+        self.connect_times: List[float] = []
+        self.echo_latencies: List[float] = []
+        self.bytes = 0
+        self.frames = 0
+        # Only samples taken while this is set count towards the latency percentiles
+        self.measuring = False
+
+    def error(self, reason: str):
+        self.errors[reason] = self.errors.get(reason, 0) + 1
+
+
+async def run_client(index: int, args, token: str, ssh_host: str, ssh_port: int, stats: Stats, stop: asyncio.Event):
+    uri = f"{args.url}/ws/servers/{args.server_id + index}/ssh?output=binary"
+    started = time.perf_counter()
+    try:
+        async with websockets.connect(
+            uri, subprotocols=["jwt", token], origin=args.origin, max_size=None, open_timeout=30
+        ) as ws:
+            json.loads(await ws.recv())  # output_mode
+            if not args.no_init:
+                await ws.send(json.dumps({"host": ssh_host, "port": ssh_port, "username": "loadtest", "password": "x"}))
+            while True:
+                message = json.loads(await asyncio.wait_for(ws.recv(), 30))
+                if message.get("type") == "session":
+                    break
+                if message.get("type") == "error":
+                    raise RuntimeError(message.get("message", "error"))
+            stats.connected += 1
+            stats.connect_times.append(time.perf_counter() - started)
+
+            sent: Dict[int, float] = {}
+
+            async def type_keys():
+                seq = 0
+                while not stop.is_set():
+                    seq += 1
+                    sent[seq] = time.perf_counter()
+                    await ws.send(json.dumps({"type": "cmd", "payload": f"#{seq};"}))
+                    await asyncio.sleep(args.keystroke_interval)
+
+            typer = asyncio.create_task(type_keys())
+            tail = b""
+            try:
+                while not stop.is_set():
+                    try:
+                        frame = await asyncio.wait_for(ws.recv(), 1.0)
+                    except asyncio.TimeoutError:
+                        continue
+                    if isinstance(frame, str):
+                        continue  # ping / status
+                    stats.bytes += len(frame)
+                    stats.frames += 1
+                    if b"#" in frame or tail:
+                        received = time.perf_counter()
+                        data = tail + frame
+                        for match in _MARKER_RE.finditer(data):
+                            sent_at = sent.pop(int(match.group(1)), None)
+                            if sent_at is not None and stats.measuring:
+                                stats.echo_latencies.append(received - sent_at)
+                        # A marker may be split across frames
+                        cut = data.rfind(b"#")
+                        tail = data[cut:] if cut != -1 and b";" not in data[cut:] else b""
+            finally:
+                typer.cancel()
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        if not stop.is_set():
+            stats.failed += 1
+            stats.error(type(e).__name__ + (f": {e}" if isinstance(e, RuntimeError) else ""))
+
+
+# ---------- REPORT ----------
+def percentile(values: List[float], p: float) -> float:
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100.0 * (len(ordered) - 1))))]
+
+
+def _cpu_seconds() -> float:
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+async def main(args) -> Dict[str, object]:
+    jwt_secret = args.jwt_secret
+    if args.jwt_secret_file:
+        with open(args.jwt_secret_file) as f:
+            jwt_secret = f.read().strip()
+    proxy: Optional[subprocess.Popen] = None
+    if args.spawn_proxy:
+        jwt_secret = jwt_secret or secrets.token_urlsafe(32)
+        port = _free_port()
+        args.url = f"ws://127.0.0.1:{port}"
+        proxy = spawn_proxy(port, jwt_secret, args.proxy_log)
+    if not jwt_secret:
+        raise SystemExit("--jwt-secret, --jwt-secret-file or --spawn-proxy is required")
+    metrics_url = args.metrics_url or args.url.replace("ws://", "http://", 1).replace("wss://", "https://", 1) + "/metrics"
+
+    ssh_server = await start_ssh_server(args.ssh_bind, 0, args.output_rate, args.chunk_size)
+    ssh_port = ssh_server.sockets[0].getsockname()[1]
+    ssh_host = args.ssh_host or args.ssh_bind
+
+    stats = Stats()
+    stop = asyncio.Event()
+    tasks: List[asyncio.Task] = []
+    http = httpx.AsyncClient(timeout=10)
+    try:
+        if proxy is not None:
+            await wait_for_proxy(http, metrics_url, proxy)
+        baseline = await scrape(http, metrics_url, args.metrics_token)
+
+        now = int(time.time())
+        for i in range(args.clients):
+            claims = {"sub": f"{args.subject}-{i}", "iat": now, "exp": now + int(args.duration + args.ramp) + 600}
+            token = jwt.encode(claims, jwt_secret, algorithm="HS256")
+            tasks.append(asyncio.create_task(run_client(i, args, token, ssh_host, ssh_port, stats, stop)))
+            if args.ramp:
+                await asyncio.sleep(args.ramp / args.clients)
+        # Let the last handshakes finish before measuring the steady state
+        settle_deadline = time.monotonic() + 30
+        while stats.connected + stats.failed < args.clients and time.monotonic() < settle_deadline:
+            await asyncio.sleep(0.1)
+        await asyncio.sleep(1.0)
+
+        loaded = await scrape(http, metrics_url, args.metrics_token)
+        bytes_start, generator_cpu_start, wall_start = stats.bytes, _cpu_seconds(), time.monotonic()
+        stats.measuring = True
+        await asyncio.sleep(args.duration)
+        stats.measuring = False
+        final = await scrape(http, metrics_url, args.metrics_token)
+        wall = time.monotonic() - wall_start
+        forwarded = stats.bytes - bytes_start
+        generator_cpu = _cpu_seconds() - generator_cpu_start
+    finally:
+        stop.set()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await http.aclose()
+        ssh_server.close()
+        if proxy is not None:
+            proxy.terminate()
+            try:
+                proxy.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proxy.kill()
+
+    sessions = loaded.get("ws_ssh_sessions_active", stats.connected) or stats.connected
+    rss_growth = loaded.get("process_resident_memory_bytes", 0) - baseline.get("process_resident_memory_bytes", 0)
+    proxy_cpu = final.get("process_cpu_seconds_total", 0) - loaded.get("process_cpu_seconds_total", 0)
+    megabytes = forwarded / 1e6
+    return {
+        "clients": args.clients,
+        "connected": stats.connected,
+        "failed": stats.failed,
+        "errors": stats.errors,
+        "connect_p50_ms": percentile(stats.connect_times, 50) * 1000,
+        "connect_p99_ms": percentile(stats.connect_times, 99) * 1000,
+        "duration_s": wall,
+        "throughput_mb_s": megabytes / wall if wall else 0.0,
+        "requested_mb_s": args.output_rate * stats.connected / 1e6,
+        "frames": stats.frames,
+        "echo_samples": len(stats.echo_latencies),
+        "echo_p50_ms": percentile(stats.echo_latencies, 50) * 1000,
+        "echo_p99_ms": percentile(stats.echo_latencies, 99) * 1000,
+        "echo_max_ms": max(stats.echo_latencies) * 1000 if stats.echo_latencies else float("nan"),
+        "proxy_rss_mb": loaded.get("process_resident_memory_bytes", 0) / 2 ** 20,
+        "memory_per_session_kb": rss_growth / sessions / 1024 if sessions else float("nan"),
+        "proxy_cpu_percent": proxy_cpu / wall * 100 if wall else 0.0,
+        # Meaningless when (almost) nothing was forwarded, e.g. --output-rate 0
+        "cpu_seconds_per_mb": proxy_cpu / megabytes if megabytes >= 0.1 else float("nan"),
+        "queue_full_stalls": final.get("ws_ssh_output_queue_full_total", 0) - loaded.get("ws_ssh_output_queue_full_total", 0),
+        "generator_cpu_percent": generator_cpu / wall * 100 if wall else 0.0,
+        "same_host": proxy is not None,
+    }
+
+
+def print_report(r: Dict[str, object]):
+    print(f"clients:           {r['connected']}/{r['clients']} connected, {r['failed']} failed "
+          f"(connect p50 {r['connect_p50_ms']:.1f} ms, p99 {r['connect_p99_ms']:.1f} ms)")
+    for reason, count in sorted(r["errors"].items(), key=lambda item: -item[1]):
+        print(f"  {count} x {reason}")
+    print(f"throughput:        {r['throughput_mb_s']:.2f} MB/s forwarded "
+          f"({r['requested_mb_s']:.2f} MB/s generated), {r['frames']} frames in {r['duration_s']:.1f} s")
+    print(f"keystroke echo:    p50 {r['echo_p50_ms']:.1f} ms, p99 {r['echo_p99_ms']:.1f} ms, "
+          f"max {r['echo_max_ms']:.1f} ms ({r['echo_samples']} samples)")
+    print(f"proxy memory:      {r['memory_per_session_kb']:.1f} KiB per session (RSS {r['proxy_rss_mb']:.1f} MiB under load)")
+    per_mb = "n/a" if math.isnan(r["cpu_seconds_per_mb"]) else f"{r['cpu_seconds_per_mb'] * 1000:.1f} ms"
+    print(f"proxy CPU:         {per_mb} per MB forwarded ({r['proxy_cpu_percent']:.0f}% of one core)")
+    print(f"slow-client stalls: {r['queue_full_stalls']:.0f}")
+    print(f"load generator:    {r['generator_cpu_percent']:.0f}% of one core")
+    if r["generator_cpu_percent"] > 90:
+        print("warning: the load generator is CPU bound; run it on more cores or machines for meaningful numbers")
+    elif r["same_host"] and r["generator_cpu_percent"] + r["proxy_cpu_percent"] > 90 * (os.cpu_count() or 1):
+        print("warning: proxy and load generator together saturate this machine; latencies include CPU contention")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the WebSocket SSH proxy.")
+    target = parser.add_argument_group("proxy")
+    target.add_argument("--url", default="ws://127.0.0.1:5000", help="proxy base URL (default %(default)s)")
+    target.add_argument("--spawn-proxy", action="store_true", help="start ws_server with uvicorn on a free port")
+    target.add_argument("--proxy-log", help="append the spawned proxy's output to this file")
+    target.add_argument("--jwt-secret", default=os.environ.get("JWT_SECRET"), help="HS256 secret of the proxy (default $JWT_SECRET)")
+    target.add_argument("--jwt-secret-file", help="read the JWT secret from this file")
+    target.add_argument("--subject", default="loadtest", help="JWT subject prefix; client i uses <subject>-<i>")
+    target.add_argument("--origin", help="Origin header to send (needed unless the proxy allows '*')")
+    target.add_argument("--metrics-url", help="proxy /metrics URL (default derived from --url)")
+    target.add_argument("--metrics-token", default=os.environ.get("METRICS_TOKEN"), help="bearer token for /metrics")
+    target.add_argument("--server-id", type=int, default=100000, help="first server_id; client i uses server_id + i")
+    target.add_argument("--no-init", action="store_true",
+                        help="do not send connection parameters (proxy resolves server ids via SERVER_API_URL)")
+
+    load = parser.add_argument_group("load")
+    load.add_argument("--clients", type=int, default=50, help="concurrent terminals (default %(default)s)")
+    load.add_argument("--ramp", type=float, default=5.0, help="seconds over which clients connect (default %(default)s)")
+    load.add_argument("--duration", type=float, default=20.0, help="measured seconds after ramp-up (default %(default)s)")
+    load.add_argument("--output-rate", type=int, default=10000, help="output bytes/s per session (default %(default)s; 0 = idle)")
+    load.add_argument("--chunk-size", type=int, default=1024, help="bytes per output write (default %(default)s)")
+    load.add_argument("--keystroke-interval", type=float, default=0.2, help="seconds between keystrokes (default %(default)s)")
+
+    ssh = parser.add_argument_group("ssh stand-in")
+    ssh.add_argument("--ssh-bind", default="127.0.0.1", help="address the fake SSH server listens on")
+    ssh.add_argument("--ssh-host", help="address the proxy uses to reach the fake SSH server (default --ssh-bind)")
+
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    arguments = parse_args()
+    results = asyncio.run(main(arguments))
+    if arguments.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_report(results)
@@ -0,0 +1,173 @@
+# mux.py
+"""Several terminals over one WebSocket and one SSH connection.
+
+Each logical channel is a PTY session on the SSH connection shared by the
+WebSocket. Output is sent as binary messages made of a 2-byte big-endian
+channel id followed by raw UTF-8 terminal output; everything else is JSON text
+carrying a "channel" field (see README, "Multiplexed Terminals").
+
+Flow control is per channel: at most `window` bytes of output may be
+unacknowledged by the client. A channel that runs out of credit stops reading
+from its SSH channel, so SSH's own per-channel window throttles that one
+remote shell while the other channels keep flowing.
+"""
+import asyncio
+import logging
+import struct
+import time
+from typing import Awaitable, Callable, Optional, Tuple
+
+from output_framing import OUTPUT_MODE_BINARY, forward_output
+
+logger = logging.getLogger("ws_ssh_proxy")
+
+CHANNEL_HEADER = struct.Struct("!H")
+MAX_CHANNEL_ID = 0xFFFF
+
+
+def encode_frame(channel_id: int, data: bytes) -> bytes:
+    return CHANNEL_HEADER.pack(channel_id) + data
+
+
+def decode_frame(frame: bytes) -> Tuple[int, bytes]:
+    """Split a binary message into (channel id, payload)."""
+    if len(frame) < CHANNEL_HEADER.size:
+        raise ValueError("frame too short")
+    return CHANNEL_HEADER.unpack_from(frame)[0], frame[CHANNEL_HEADER.size:]
+
+
+class CreditWindow:
+    """Bytes a channel may send before the client acknowledges them."""
+
+    def __init__(self, window: int):
+        self.window = window
+        self.in_flight = 0
+        self._open = asyncio.Event()
+        self._open.set()
+
+    async def reserve(self, size: int):
+        # A frame may overshoot the window; the next one waits for acks.
+        await self._open.wait()
+        self.in_flight += size
+        if self.in_flight >= self.window:
+            self._open.clear()
+
+    def ack(self, size: int):
+        self.in_flight = max(0, self.in_flight - size)
+        if self.in_flight < self.window:
+            self._open.set()
+
+    def release(self):
+        """Unblock a waiting sender for good (the channel is going away)."""
+        self.window = float("inf")
+        self._open.set()
+
+
+class MuxChannel:
+    """One PTY on a shared SSH connection, forwarding its output as tagged frames."""
+
+    def __init__(
+        self,
+        channel_id: int,
+        process,
+        send_frame: Callable[[bytes], Awaitable[None]],
+        window: int,
+        max_frame_bytes: int = 32768,
+        flush_interval: float = 0.01,
+        on_frame: Optional[Callable[[int], None]] = None,
+        recorder=None,
+        max_output_bytes: int = 0,
+    ):
+        self.channel_id = channel_id
+        self.process = process
+        self.send_frame = send_frame
+        self.credit = CreditWindow(window)
+        self.max_frame_bytes = max_frame_bytes
+        self.flush_interval = flush_interval
+        self.on_frame = on_frame
+        self.recorder = recorder
+        # Bounded: a channel without credit backs up into SSH instead of into memory
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=64)
+        self.tasks = []
+        # Activity and budgets, as for a single-terminal session; 0 disables the output limit
+        self.max_output_bytes = max_output_bytes
+        self.started_at = time.monotonic()
+        self.last_activity = self.started_at
+        self.input_bytes = 0
+        self.output_bytes = 0
+        self.end_reason: Optional[str] = None
+
+    def start(self, on_exit: Callable[["MuxChannel"], Awaitable[None]]):
+        """Start forwarding; `on_exit` is awaited when the remote shell ends (not on close())."""
+        self.tasks = [asyncio.create_task(self._pump()), asyncio.create_task(self._forward(on_exit))]
+
+    async def _pump(self):
+        try:
+            while True:
+                data = await self.process.stdout.read(self.max_frame_bytes)
+                if not data:
+                    break
+                self.last_activity = time.monotonic()
+                self.output_bytes += len(data)
+                if self.max_output_bytes and self.output_bytes > self.max_output_bytes:
+                    self.end_reason = "output_budget"
+                    break
+                if self.recorder is not None:
+                    self.recorder.record_output(data)
+                await self.queue.put(data)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Typically the shell exited and the SSH channel closed under the read
+            logger.info("Mux channel %s output ended: %s", self.channel_id, e)
+        await self.queue.put(None)
+
+    async def _send(self, frame: bytes):
+        await self.credit.reserve(len(frame))
+        await self.send_frame(encode_frame(self.channel_id, frame))
+
+    async def _forward(self, on_exit):
+        try:
+            await forward_output(
+                self.queue,
+                self._send,
+                mode=OUTPUT_MODE_BINARY,
+                max_bytes=self.max_frame_bytes,
+                flush_interval=self.flush_interval,
+                on_frame=self.on_frame,
+            )
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # The WebSocket went away; the handler closes every channel
+            logger.debug("Mux channel %s stopped sending: %s", self.channel_id, e)
+            return
+        await on_exit(self)
+
+    def write(self, data: str) -> int:
+        """Send input to the shell; returns the number of bytes written."""
+        encoded = data.encode("utf-8")
+        self.process.stdin.write(encoded)
+        self.input_bytes += len(encoded)
+        self.last_activity = time.monotonic()
+        if self.recorder is not None:
+            self.recorder.record_input(data)
+        return len(encoded)
+
+    def resize(self, cols: int, rows: int):
+        self.process.change_terminal_size(cols, rows)
+
+    def ack(self, size: int):
+        self.credit.ack(size)
+
+    async def close(self):
+        self.credit.release()
+        for task in self.tasks:
+            if task is not asyncio.current_task() and not task.done():
+                task.cancel()
+        try:
+            self.process.close()
+        except Exception:
+            pass
+        if self.recorder is not None:
+            await self.recorder.close()
@@ -0,0 +1,158 @@
+# output_framing.py
+"""Coalesce SSH stdout into bounded WebSocket frames.
+
+The SSH receive loop pushes raw byte chunks onto a queue; `forward_output`
+drains it and sends one frame per flush, where a flush happens when the
+pending output reaches `max_bytes` or `flush_interval` seconds after the first
+byte arrived. Frames never end in the middle of a UTF-8 sequence: the tail of
+an incomplete character is held back until the rest of it arrives.
+
+Two wire formats are supported:
+- binary: the frame is the raw UTF-8 bytes, sent as a binary WebSocket message
+- json:   {"type": "output", "output": "<text>"} sent as a text message (legacy)
+"""
+import asyncio
+import codecs
+from typing import Awaitable, Callable, Optional
+
+OUTPUT_MODE_BINARY = "binary"
+OUTPUT_MODE_JSON = "json"
+OUTPUT_MODES = (OUTPUT_MODE_BINARY, OUTPUT_MODE_JSON)
+
+
+def utf8_boundary(buf, end: Optional[int] = None) -> int:
+    """Return the length of the longest prefix of `buf[:end]` that does not end inside a UTF-8 sequence."""
+    end = len(buf) if end is None else end
+    # A UTF-8 sequence is at most 4 bytes, so only the last 3 bytes can start an incomplete one.
+    for back in range(1, min(4, end + 1)):
+        byte = buf[end - back]
+        if byte & 0xC0 != 0x80:  # not a continuation byte
+            if byte >= 0xF0:
+                needed = 4
+            elif byte >= 0xE0:
+                needed = 3
+            elif byte >= 0xC0:
+                needed = 2
+            else:
+                needed = 1
+            return end - back if needed > back else end
+    return end
+
+
+class FrameCoalescer:
+    """Accumulate output bytes and cut them into frames on UTF-8 boundaries."""
+
+    def __init__(self, mode: str = OUTPUT_MODE_BINARY, max_bytes: int = 32768):
+        if mode not in OUTPUT_MODES:
+            raise ValueError(f"unsupported output mode: {mode}")
+        self.mode = mode
+        self.max_bytes = max_bytes
+        self.buffer = bytearray()
+        # Text frames are decoded incrementally so partial characters carry over to the next frame.
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+
+    def __len__(self) -> int:
+        return len(self.buffer)
+
+    def feed(self, data: bytes):
+        self.buffer += data
+
+    @property
+    def full(self) -> bool:
+        return len(self.buffer) >= self.max_bytes
+
+    def take(self, final: bool = False):
+        """Return the next frame (bytes or str depending on the mode), or None if there is nothing to send."""
+        if not self.buffer:
+            return None
+        limit = min(len(self.buffer), self.max_bytes)
+        if final and limit == len(self.buffer):
+            cut = limit
+        else:
+            cut = utf8_boundary(self.buffer, limit)
+            if cut == 0:
+                # Nothing but a partial character; keep waiting unless this is the end of the stream.
+                if not final:
+                    return None
+                cut = limit
+        chunk = bytes(self.buffer[:cut])
+        del self.buffer[:cut]
+        if self.mode == OUTPUT_MODE_BINARY:
+            return chunk
+        return self._decoder.decode(chunk, final=final and not self.buffer)
+
+
+def frame_sender(websocket, mode: str) -> Callable[[object], Awaitable[None]]:
+    """Return a coroutine function that sends one frame in `mode` over `websocket`."""
+    if mode == OUTPUT_MODE_BINARY:
+        return websocket.send_bytes
+
+    async def send_json(text: str):
+        await websocket.send_json({"type": "output", "output": text})
+
+    return send_json
+
+
+async def forward_output(
+    queue: asyncio.Queue,
+    send: Callable[[object], Awaitable[None]],
+    mode: str = OUTPUT_MODE_BINARY,
+    max_bytes: int = 32768,
+    flush_interval: float = 0.01,
+    on_frame: Optional[Callable[[int], None]] = None,
+):
+    """Drain byte chunks from `queue` and send coalesced frames until a None sentinel arrives.
+
+    `on_frame`, if given, is called with the byte size of every frame sent.
+    """
+    coalescer = FrameCoalescer(mode, max_bytes)
+    loop = asyncio.get_running_loop()
+    eof = False
+    # Set when the pending bytes are only the start of a character, which cannot be sent yet.
+    stalled = False
+    while not eof:
+        if not len(coalescer) or stalled:
+            data = await queue.get()
+            if data is None:
+                eof = True
+            else:
+                coalescer.feed(data)
+        # Pending output (new, or left over from a full frame) goes out within flush_interval.
+        deadline = loop.time() + flush_interval
+        # Keep collecting until the frame is full or the flush interval has passed.
+        while not eof and not coalescer.full:
+            try:
+                data = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    data = await asyncio.wait_for(queue.get(), timeout=remaining)
+                except asyncio.TimeoutError:
+                    break
+            if data is None:
+                eof = True
+                break
+            coalescer.feed(data)
+
+        stalled = False
+        while len(coalescer):
+            size = len(coalescer)
+            frame = coalescer.take(final=eof)
+            if frame is None:
+                stalled = True
+                break
+            await send(frame)
+            if on_frame is not None:
+                on_frame(size - len(coalescer))
+            if not eof and not coalescer.full:
+                # Give the remainder (if any) a flush interval to be topped up by more output.
+                break
+
+
+def negotiate_output_mode(requested: Optional[str]) -> str:
+    """Map the client's requested output mode to a supported one, defaulting to JSON for old clients."""
+    requested = (requested or "").strip().lower()
+    return requested if requested in OUTPUT_MODES else OUTPUT_MODE_JSON
+
@@ -0,0 +1,111 @@
+# rate_limit.py
+"""Per-client connection rate limiting for the WebSocket SSH proxy.
+
+`SlidingWindowRateLimiter` approximates a sliding window with two fixed-window
+counters per key (the current and the previous window, weighted by how much of
+the previous window still overlaps the sliding one). Every check is O(1), and
+keys are kept in least-recently-seen order so idle ones can be evicted from the
+front once they are older than two windows, or when `max_keys` is reached.
+
+`client_ip` resolves the address to rate limit on, honouring X-Forwarded-For /
+X-Real-IP only when the direct peer is a trusted proxy.
+"""
+import ipaddress
+import time
+from collections import OrderedDict
+from typing import Callable, Iterable, List, Optional, Union
+
+IPNetwork = Union[ipaddress.IPv4Network, ipaddress.IPv6Network]
+
+
+class SlidingWindowRateLimiter:
+    def __init__(
+        self,
+        limit: int,
+        window: float = 60.0,
+        max_keys: int = 100000,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.limit = limit
+        self.window = window
+        self.max_keys = max_keys
+        self.clock = clock
+        # key -> [current window index, current count, previous window count]
+        self._buckets: "OrderedDict[str, list]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def _evict(self, now: float):
+        # Keys are in last-seen order, so expired ones are all at the front.
+        while self._buckets:
+            key, bucket = next(iter(self._buckets.items()))
+            if now // self.window - bucket[0] < 2 and len(self._buckets) < self.max_keys:
+                break
+            self._buckets.popitem(last=False)
+
+    def hit(self, key: str) -> bool:
+        """Record an attempt for `key`; return False if it exceeds the limit (the attempt is then not counted)."""
+        now = self.clock()
+        self._evict(now)
+        position = now / self.window
+        index = int(position)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [index, 0, 0]
+        else:
+            self._buckets.move_to_end(key)
+            if index != bucket[0]:
+                # Roll the window: the old current count becomes the previous one if it is adjacent.
+                bucket[2] = bucket[1] if index - bucket[0] == 1 else 0
+                bucket[1] = 0
+                bucket[0] = index
+        overlap = 1.0 - (position - index)
+        if bucket[2] * overlap + bucket[1] >= self.limit:
+            return False
+        bucket[1] += 1
+        return True
+
+
+def parse_trusted_proxies(value: Optional[str]) -> List[IPNetwork]:
+    """Parse a comma-separated list of proxy IPs or CIDR ranges."""
+    networks = []
+    for item in (value or "").split(","):
+        item = item.strip()
+        if item:
+            networks.append(ipaddress.ip_network(item, strict=False))
+    return networks
+
+
+def _is_trusted(host: str, trusted: Iterable[IPNetwork]) -> bool:
+    try:
+        address = ipaddress.ip_address(host)
+    except ValueError:
+        return False
+    return any(address in network for network in trusted)
+
+
+def client_ip(peer_host: Optional[str], headers, trusted: Iterable[IPNetwork]) -> str:
+    """Return the client IP for a connection from `peer_host` (no port: it changes per connection).
+
+    If the peer is a trusted proxy, X-Forwarded-For is walked from the right and
+    the first address that is not itself a trusted proxy is used; X-Real-IP is the
+    fallback when no X-Forwarded-For header is present.
+    """
+    if not peer_host:
+        return "unknown"
+    trusted = list(trusted)
+    if not trusted or not _is_trusted(peer_host, trusted):
+        return peer_host
+    forwarded = headers.get("x-forwarded-for")
+    if forwarded:
+        hops = [hop.strip() for hop in forwarded.split(",") if hop.strip()]
+        for hop in reversed(hops):
+            if not _is_trusted(hop, trusted):
+                return hop
+        if hops:
+            return hops[0]
+    real_ip = headers.get("x-real-ip")
+    if real_ip and real_ip.strip():
+        return real_ip.strip()
+    return peer_host
@@ -0,0 +1,265 @@
+# recording.py
+"""Terminal session recording in asciinema v2 format, gzip-compressed.
+
+Each session is written to `<dir>/<recording id>.cast.gz`: an asciinema v2
+header line followed by `[elapsed, "o"|"i"|"m", text]` event lines. The file
+is a series of concatenated gzip members, so `gunzip -c file.cast.gz > file.cast`
+(or any gzip reader) yields a plain .cast file for `asciinema play`.
+
+Hot path: `record_output` / `record_input` only append to an in-memory list.
+A background task per session hands batches to a worker thread for encoding,
+compression and file I/O, so the event loop never blocks on zlib or disk.
+
+Bounded memory: at most `max_buffer_bytes` of events are pending. If the writer
+falls behind, further events are dropped, and a marker event noting the number
+of bytes lost is written once the writer catches up. Worst-case overhead per
+recorded session is therefore about
+    max_buffer_bytes + 256 KiB (zlib deflate state at level 6) + one batch being written,
+i.e. roughly 2 x max_buffer_bytes + 256 KiB (768 KiB with the 256 KiB default).
+
+Seeking: a new gzip member is started at least every `index_interval` seconds
+of session time, and the sidecar `<recording id>.idx` (JSON lines) records the
+session time and compressed byte offset of each member. `read_events` finds the
+last member starting before the requested time from this sparse index and only
+decompresses from there.
+"""
+import asyncio
+import bisect
+import codecs
+import json
+import logging
+import os
+import re
+import time
+import zlib
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger("ws_ssh_proxy")
+
+RECORDING_ID_RE = re.compile(r"^[A-Za-z0-9_.-]+$")
+
+
+def recording_paths(directory: str, recording_id: str) -> Tuple[str, str]:
+    """Return the (cast, index) file paths of a recording; raises ValueError for unsafe ids."""
+    if not RECORDING_ID_RE.match(recording_id) or recording_id.startswith("."):
+        raise ValueError("invalid recording id")
+    base = os.path.join(directory, recording_id)
+    return f"{base}.cast.gz", f"{base}.idx"
+
+
+class SessionRecorder:
+    def __init__(
+        self,
+        directory: str,
+        recording_id: str,
+        meta: Dict[str, Any],
+        width: int = 80,
+        height: int = 24,
+        max_buffer_bytes: int = 256 * 1024,
+        flush_bytes: int = 64 * 1024,
+        flush_interval: float = 1.0,
+        index_interval: float = 10.0,
+    ):
+        self.recording_id = recording_id
+        self.cast_path, self.index_path = recording_paths(directory, recording_id)
+        self.meta = meta
+        self.width = width
+        self.height = height
+        self.max_buffer_bytes = max_buffer_bytes
+        self.flush_bytes = flush_bytes
+        self.flush_interval = flush_interval
+        self.index_interval = index_interval
+
+        self.started = time.monotonic()
+        self.events: List[Tuple[float, str, bytes]] = []
+        self.buffered = 0
+        self.dropped = 0
+        self.closed = False
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+        # Writer-thread state (only touched inside _write_batch)
+        self._decoders = {
+            "o": codecs.getincrementaldecoder("utf-8")(errors="replace"),
+            "i": codecs.getincrementaldecoder("utf-8")(errors="replace"),
+        }
+        self._file = None
+        self._index = None
+        self._compressor = None
+        self._member_started_at: Optional[float] = None
+        self._events_written = 0
+
+    # ----- hot path (event loop) -----
+    def _append(self, kind: str, data: bytes):
+        if self.closed or not data:
+            return
+        if self.buffered + len(data) > self.max_buffer_bytes:
+            self.dropped += len(data)
+            return
+        self.events.append((time.monotonic() - self.started, kind, data))
+        self.buffered += len(data)
+        if self.buffered >= self.flush_bytes:
+            self._wakeup.set()
+
+    def record_output(self, data: bytes):
+        self._append("o", data)
+
+    def record_input(self, data: str):
+        self._append("i", data.encode("utf-8"))
+
+    # ----- background writer -----
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    def _take(self) -> Tuple[List[Tuple[float, str, bytes]], int]:
+        events, dropped = self.events, self.dropped
+        self.events, self.buffered, self.dropped = [], 0, 0
+        return events, dropped
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while not self.closed:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            events, dropped = self._take()
+            if events or dropped:
+                try:
+                    await loop.run_in_executor(None, self._write_batch, events, dropped, False)
+                except Exception as e:
+                    logger.exception("Failed to write session recording %s: %s", self.recording_id, e)
+
+    async def close(self):
+        """Flush what is pending and finish the file."""
+        if self.closed:
+            return
+        self.closed = True
+        self._wakeup.set()
+        if self._task is not None:
+            try:
+                await self._task
+            except Exception:
+                pass
+        events, dropped = self._take()
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, self._write_batch, events, dropped, True)
+        except Exception as e:
+            logger.exception("Failed to finish session recording %s: %s", self.recording_id, e)
+
+    # ----- writer thread -----
+    def _open(self):
+        self._file = open(self.cast_path, "ab")
+        self._index = open(self.index_path, "a", encoding="utf-8")
+        header = {
+            "version": 2,
+            "width": self.width,
+            "height": self.height,
+            "timestamp": int(time.time()),
+            "env": {"TERM": "xterm"},
+        }
+        self._index.write(json.dumps({"meta": self.meta, "started": header["timestamp"]}) + "\n")
+        self._start_member(0.0)
+        self._file.write(self._compressor.compress((json.dumps(header) + "\n").encode("utf-8")))
+
+    def _start_member(self, at: float):
+        self._compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31: gzip container
+        self._member_started_at = at
+        self._index.write(json.dumps({"t": round(at, 6), "offset": self._file.tell(), "event": self._events_written}) + "\n")
+
+    def _finish_member(self):
+        self._file.write(self._compressor.flush(zlib.Z_FINISH))
+        self._compressor = None
+
+    def _write_batch(self, events: List[Tuple[float, str, bytes]], dropped: int, final: bool):
+        if self._file is None:
+            if not events and not dropped and final:
+                return
+            self._open()
+        lines = []
+        if dropped:
+            at = events[0][0] if events else time.monotonic() - self.started
+            lines.append(json.dumps([round(at, 6), "m", f"recording gap: {dropped} bytes dropped"]))
+        for at, kind, data in events:
+            if at - self._member_started_at >= self.index_interval:
+                if lines:
+                    self._file.write(self._compressor.compress(("\n".join(lines) + "\n").encode("utf-8")))
+                    lines = []
+                self._finish_member()
+                self._start_member(at)
+            text = self._decoders[kind].decode(data)
+            if text:
+                lines.append(json.dumps([round(at, 6), kind, text]))
+                self._events_written += 1
+        chunk = self._compressor.compress(("\n".join(lines) + "\n").encode("utf-8")) if lines else b""
+        if final:
+            self._file.write(chunk)
+            self._finish_member()
+            self._file.close()
+            self._index.close()
+        else:
+            # Sync flush makes everything written so far readable without ending the member.
+            self._file.write(chunk + self._compressor.flush(zlib.Z_SYNC_FLUSH))
+            self._file.flush()
+            self._index.flush()
+
+
+def read_index(index_path: str) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+    """Return (meta record, index entries) of a recording."""
+    with open(index_path, "r", encoding="utf-8") as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    if not records or "meta" not in records[0]:
+        raise ValueError("recording index is missing its meta record")
+    return records[0], records[1:]
+
+
+def _decompressed_lines(cast_path: str, offset: int) -> Iterator[str]:
+    """Yield the text lines of the gzip members starting at byte `offset`."""
+    with open(cast_path, "rb") as f:
+        f.seek(offset)
+        decompressor = zlib.decompressobj(31)
+        pending = b""
+        while True:
+            block = f.read(64 * 1024)
+            if not block:
+                break
+            while block:
+                pending += decompressor.decompress(block)
+                block = decompressor.unused_data
+                if decompressor.eof:
+                    decompressor = zlib.decompressobj(31)
+            *lines, pending = pending.split(b"\n")
+            for line in lines:
+                yield line.decode("utf-8")
+        # A recording that is still being written ends with a sync-flushed, unfinished member.
+        if pending:
+            yield pending.decode("utf-8", errors="replace")
+
+
+def read_events(directory: str, recording_id: str, start: float = 0.0, end: Optional[float] = None) -> Tuple[Optional[Dict[str, Any]], List[list]]:
+    """Return (asciinema header or None, events with start <= time < end) of a recording."""
+    cast_path, index_path = recording_paths(directory, recording_id)
+    _meta, entries = read_index(index_path)
+    times = [entry["t"] for entry in entries]
+    position = max(bisect.bisect_right(times, start) - 1, 0)
+    offset = entries[position]["offset"] if entries else 0
+
+    header = None
+    events = []
+    for line in _decompressed_lines(cast_path, offset):
+        if not line:
+            continue
+        record = json.loads(line)
+        if isinstance(record, dict):
+            header = record
+            continue
+        if record[0] < start:
+            continue
+        if end is not None and record[0] >= end:
+            break
+        events.append(record)
+    if header is None:
+        # Seeked past the header; it is always at the very start of the first member.
+        header = next((json.loads(line) for line in _decompressed_lines(cast_path, 0) if line), None)
+    return header, events
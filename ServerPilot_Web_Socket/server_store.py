@@ -0,0 +1,105 @@
+# server_store.py
+"""Resolve server ids to SSH targets through the Django API.
+
+`ServerStore.get` asks the internal endpoint
+`GET {SERVER_API_URL}/api/servers/internal/ssh-targets/{id}/`, forwarding the
+client's JWT (Django decides whether that user may open the server) together
+with the shared X-Internal-Token. Django decrypts the stored credential, so no
+secret ever passes through the browser.
+
+Answers are cached per (server id, token subject) for `ttl` seconds. Django
+publishes a server id on a Redis channel whenever the server or its credentials
+change, and `listen_for_invalidations` drops the matching entries; without Redis
+the TTL bounds how stale an entry can get.
+"""
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+import httpx
+
+logger = logging.getLogger("ws_ssh_proxy")
+
+
+class ServerStoreError(Exception):
+    """The target could not be resolved; `status` is the HTTP status returned by the API (0 if unreachable)."""
+
+    def __init__(self, message: str, status: int = 0):
+        super().__init__(message)
+        self.status = status
+
+
+class ServerStore:
+    def __init__(self, api_url: str, internal_token: str, ttl: float = 30.0, max_entries: int = 1024, timeout: float = 10.0):
+        self.api_url = api_url.rstrip("/")
+        self.internal_token = internal_token
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.client = httpx.AsyncClient(timeout=timeout)
+        # (server id, subject) -> (expires at, target)
+        self._cache: "OrderedDict[Tuple[int, str], Tuple[float, Dict[str, Any]]]" = OrderedDict()
+
+    async def get(self, server_id: int, subject: str, token: str) -> Dict[str, Any]:
+        key = (server_id, subject)
+        cached = self._cache.get(key)
+        if cached is not None and cached[0] > time.monotonic():
+            self._cache.move_to_end(key)
+            return cached[1]
+
+        try:
+            response = await self.client.get(
+                f"{self.api_url}/api/servers/internal/ssh-targets/{server_id}/",
+                headers={"Authorization": f"Bearer {token}", "X-Internal-Token": self.internal_token},
+            )
+        except httpx.HTTPError as e:
+            raise ServerStoreError(f"server API unreachable: {e}")
+        if response.status_code != 200:
+            try:
+                message = response.json().get("error") or response.json().get("detail")
+            except Exception:
+                message = None
+            raise ServerStoreError(message or f"server API returned {response.status_code}", response.status_code)
+
+        target = response.json()
+        self._cache[key] = (time.monotonic() + self.ttl, target)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+        return target
+
+    def invalidate(self, server_id: Optional[int] = None):
+        """Drop cached targets of `server_id` (all targets if None)."""
+        if server_id is None:
+            self._cache.clear()
+            return
+        for key in [key for key in self._cache if key[0] == server_id]:
+            del self._cache[key]
+
+    async def listen_for_invalidations(self, redis_url: str, channel: str):
+        """Subscribe to `channel` and invalidate the published server ids; reconnects until cancelled."""
+        import redis.asyncio as redis
+
+        while True:
+            try:
+                client = redis.from_url(redis_url)
+                async with client.pubsub() as pubsub:
+                    await pubsub.subscribe(channel)
+                    # Anything published while we were not subscribed is lost.
+                    self.invalidate()
+                    async for message in pubsub.listen():
+                        if message.get("type") != "message":
+                            continue
+                        try:
+                            self.invalidate(int(message["data"]))
+                        except (TypeError, ValueError):
+                            self.invalidate()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Server store invalidation listener failed, retrying in 5s: %s", e)
+                await asyncio.sleep(5)
+
+    async def close(self):
+        await self.client.aclose()
@@ -0,0 +1,193 @@
+# sessions.py
+"""Detachable terminal sessions.
+
+A terminal session outlives the WebSocket that opened it: when the client goes
+away the session is detached and kept for a grace period, during which its
+output keeps being drained into a bounded scrollback buffer. A client that
+presents the session token within the grace period is reattached to the same
+SSH process and gets the scrollback replayed.
+
+Sessions are held in process memory, so a client has to reconnect to the same
+worker (sticky sessions) to reattach.
+
+The owner of a session can share it read-only: watchers subscribe to the same
+output stream through their own bounded queue and never slow the owner down.
+"""
+import asyncio
+import logging
+import secrets
+from collections import deque
+from typing import Callable, Dict, Optional, Set
+
+logger = logging.getLogger("ws_ssh_proxy")
+
+
+class ScrollbackBuffer:
+    """Ring buffer keeping the most recent `max_bytes` of terminal output."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.chunks: deque = deque()
+        self.size = 0
+
+    def append(self, data: bytes):
+        if self.max_bytes <= 0 or not data:
+            return
+        if len(data) >= self.max_bytes:
+            data = data[-self.max_bytes:]
+            self.chunks.clear()
+            self.size = 0
+        self.chunks.append(data)
+        self.size += len(data)
+        while self.size > self.max_bytes:
+            overflow = self.size - self.max_bytes
+            head = self.chunks[0]
+            if len(head) <= overflow:
+                self.chunks.popleft()
+                self.size -= len(head)
+            else:
+                self.chunks[0] = head[overflow:]
+                self.size -= overflow
+
+    def snapshot(self) -> bytes:
+        """Return the buffered output, starting at a UTF-8 character boundary."""
+        data = b"".join(self.chunks)
+        start = 0
+        # Skip continuation bytes left over from a character cut by the ring.
+        while start < len(data) and start < 3 and data[start] & 0xC0 == 0x80:
+            start += 1
+        return data[start:]
+
+
+class WatcherSet:
+    """Read-only subscribers of a session's output, each with its own bounded queue.
+
+    Output is offered without waiting. A watcher whose queue is full loses its
+    backlog and is resynced instead: the terminal is reset and the scrollback
+    replayed, which already contains the output it missed.
+    """
+
+    RESET = b"\x1bc"  # RIS: clear the watcher's terminal before replaying the scrollback
+
+    def __init__(self, max_chunks: int):
+        self.max_chunks = max_chunks
+        self.queues: Set[asyncio.Queue] = set()
+
+    def __len__(self) -> int:
+        return len(self.queues)
+
+    def add(self, snapshot: bytes) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.max_chunks)
+        if snapshot:
+            queue.put_nowait(snapshot)
+        self.queues.add(queue)
+        return queue
+
+    def remove(self, queue: asyncio.Queue):
+        self.queues.discard(queue)
+
+    def publish(self, data: bytes, snapshot: Callable[[], bytes]) -> int:
+        """Queue `data` for every watcher; return how many had to be resynced from `snapshot()`."""
+        resynced = 0
+        for queue in self.queues:
+            if queue.full():
+                self._drain(queue)
+                queue.put_nowait(self.RESET + snapshot())
+                resynced += 1
+            else:
+                queue.put_nowait(data)
+        return resynced
+
+    def close(self):
+        """End every watcher's stream; their writers stop once they reach the sentinel."""
+        for queue in self.queues:
+            if queue.full():
+                self._drain(queue)
+            queue.put_nowait(None)
+        self.queues.clear()
+
+    @staticmethod
+    def _drain(queue: asyncio.Queue):
+        while not queue.empty():
+            queue.get_nowait()
+
+
+class SessionRegistry:
+    """Sessions by token, with expiry of detached sessions after `grace_period` seconds.
+
+    Registered sessions must provide `owner`, `server_id`, `attached` and an async `close()`.
+    """
+
+    def __init__(self, grace_period: float):
+        self.grace_period = grace_period
+        self.sessions: Dict[str, object] = {}
+        self._expiry: Dict[str, asyncio.Task] = {}
+        # Watch token -> session token, for sessions their owner shared read-only
+        self._shared: Dict[str, str] = {}
+
+    def __len__(self) -> int:
+        return len(self.sessions)
+
+    def register(self, session) -> str:
+        token = secrets.token_urlsafe(32)
+        self.sessions[token] = session
+        return token
+
+    def lookup(self, token: Optional[str], owner: str, server_id) -> Optional[object]:
+        """Return the session for `token` if it belongs to `owner` and `server_id`."""
+        if not token:
+            return None
+        session = self.sessions.get(token)
+        if session is None or session.owner != owner or session.server_id != server_id:
+            return None
+        return session
+
+    def share(self, token: str) -> str:
+        """Return a watch token for the session `token`, creating one on first use."""
+        for watch_token, shared in self._shared.items():
+            if shared == token:
+                return watch_token
+        watch_token = secrets.token_urlsafe(32)
+        self._shared[watch_token] = token
+        return watch_token
+
+    def unshare(self, token: str):
+        for watch_token in [w for w, shared in self._shared.items() if shared == token]:
+            del self._shared[watch_token]
+
+    def lookup_shared(self, watch_token: Optional[str], server_id) -> Optional[object]:
+        """Return the session shared under `watch_token` if it is a session on `server_id`."""
+        if not watch_token:
+            return None
+        session = self.sessions.get(self._shared.get(watch_token))
+        if session is None or session.server_id != server_id:
+            return None
+        return session
+
+    def claim(self, token: str):
+        """Stop the expiry timer of a detached session that is being reattached."""
+        task = self._expiry.pop(token, None)
+        if task is not None:
+            task.cancel()
+
+    def detach(self, token: str):
+        """Start the grace period of a session whose client went away."""
+        if token not in self.sessions:
+            return
+        self.claim(token)
+        self._expiry[token] = asyncio.create_task(self._expire(token))
+
+    async def _expire(self, token: str):
+        await asyncio.sleep(self.grace_period)
+        self._expiry.pop(token, None)
+        session = self.sessions.get(token)
+        if session is not None and not session.attached:
+            logger.info("Detached session for server_id=%s expired", session.server_id)
+            await self.close(token)
+
+    async def close(self, token: str):
+        self.claim(token)
+        self.unshare(token)
+        session = self.sessions.pop(token, None)
+        if session is not None:
+            await session.close()
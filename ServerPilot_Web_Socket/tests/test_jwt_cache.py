@@ -0,0 +1,70 @@
+from jwt_cache import VerifiedTokenCache
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def test_entries_expire_at_exp():
+    clock = FakeClock()
+    cache = VerifiedTokenCache(clock=clock)
+    cache.put("token", {"sub": "42", "exp": 1100})
+    assert cache.get("token") == {"sub": "42", "exp": 1100}
+    clock.now = 1100.0
+    assert cache.get("token") is None
+    assert len(cache) == 0
+    # Tokens without a numeric exp are never cached
+    cache.put("forever", {"sub": "42"})
+    assert cache.get("forever") is None
+
+
+def test_lru_bound():
+    cache = VerifiedTokenCache(max_entries=2, clock=FakeClock())
+    cache.put("a", {"exp": 2000})
+    cache.put("b", {"exp": 2000})
+    assert cache.get("a") is not None
+    cache.put("c", {"exp": 2000})
+    assert len(cache) == 2
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+
+
+def test_revoke_by_jti():
+    cache = VerifiedTokenCache(clock=FakeClock())
+    claims = {"sub": "42", "jti": "abc", "exp": 2000}
+    cache.put("token", claims)
+    cache.revoke(jti="abc")
+    assert cache.get("token") is None
+    assert cache.is_revoked("token", claims)
+    assert not cache.is_revoked("other", {"sub": "42", "jti": "def", "exp": 2000})
+
+
+def test_revoke_by_subject_only_affects_earlier_tokens():
+    clock = FakeClock()
+    cache = VerifiedTokenCache(clock=clock)
+    old = {"sub": "42", "iat": 900, "exp": 2000}
+    cache.put("old", old)
+    cache.revoke(subject="42")
+    assert cache.get("old") is None
+    assert cache.is_revoked("old", old)
+    assert cache.is_revoked("no-iat", {"user_id": 42, "exp": 2000})
+    assert not cache.is_revoked("new", {"sub": "42", "iat": 1001, "exp": 2000})
+    assert not cache.is_revoked("someone-else", {"sub": "7", "iat": 900, "exp": 2000})
+
+
+def test_revoke_by_token_and_forget_after_until():
+    clock = FakeClock()
+    cache = VerifiedTokenCache(clock=clock)
+    claims = {"sub": "42", "exp": 1500}
+    cache.put("token", claims)
+    cache.revoke(token="token", until=1500)
+    assert cache.get("token") is None
+    assert cache.is_revoked("token", claims)
+    assert not cache.is_revoked("other", claims)
+    # Once the token would have expired anyway the revocation is dropped
+    clock.now = 1600.0
+    assert not cache.is_revoked("token", claims)
@@ -0,0 +1,62 @@
+import asyncio
+
+import pytest
+
+from limits_store import ConnectionLease, LocalLimitStore
+
+
+@pytest.mark.asyncio
+async def test_lease_reacquired_after_expiry():
+    store = LocalLimitStore(10, lease_ttl=0.1)
+    lost = []
+
+    async def on_lost():
+        lost.append(True)
+
+    lease = ConnectionLease(store, "server:1", 1, renew_interval=0.2, on_lost=on_lost)
+    assert await lease.acquire()
+    await asyncio.sleep(0.25)
+    # The lease expired between renewals, but the slot was still free
+    assert store.active("server:1") == 1 and not lost
+    await lease.release()
+    assert store.active("server:1") == 0
+
+
+@pytest.mark.asyncio
+async def test_lost_lease_ends_the_connection():
+    store = LocalLimitStore(10, lease_ttl=0.1)
+    lost = asyncio.Event()
+
+    async def on_lost():
+        await lease.release()
+        lost.set()
+
+    lease = ConnectionLease(store, "server:1", 1, renew_interval=0.2, on_lost=on_lost)
+    assert await lease.acquire()
+    await asyncio.sleep(0.15)
+    # Another connection takes the expired slot before the renewal runs
+    other = await store.acquire("server:1", 1)
+    assert other is not None
+    await asyncio.wait_for(lost.wait(), timeout=1)
+    assert store.leases["server:1"] == {other: store.leases["server:1"][other]}
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("fail_closed", [False, True])
+async def test_redis_errors_are_reported_and_optionally_refused(fail_closed):
+    pytest.importorskip("redis")
+    from limits_store import RedisLimitStore
+
+    failures = []
+    # Nothing listens on port 1, so every Redis call fails
+    store = RedisLimitStore(
+        "redis://127.0.0.1:1/0", 10, lease_ttl=30, fail_closed=fail_closed, on_fallback=failures.append
+    )
+    allowed = await store.hit("10.0.0.1")
+    lease_id = await store.acquire("server:1", 1)
+    assert allowed is not fail_closed
+    assert (lease_id is None) is fail_closed
+    assert failures == ["hit", "acquire"]
+    # Connections that already hold a slot are never ended because Redis is down
+    assert await store.renew("server:1", lease_id or "other")
+    assert failures[-1] == "renew"
@@ -0,0 +1,31 @@
+from metrics import MetricsRegistry
+
+
+def test_histogram_renders_cumulative_buckets():
+    registry = MetricsRegistry()
+    histogram = registry.histogram("connect_seconds", "Connect time", ["route"], buckets=(0.1, 1))
+    series = histogram.labels("ssh")
+    for value in (0.05, 0.1, 0.5, 5):
+        series.observe(value)
+
+    assert registry.render().splitlines() == [
+        "# HELP connect_seconds Connect time",
+        "# TYPE connect_seconds histogram",
+        # Bucket bounds are inclusive
+        'connect_seconds_bucket{route="ssh",le="0.1"} 2',
+        'connect_seconds_bucket{route="ssh",le="1"} 3',
+        'connect_seconds_bucket{route="ssh",le="+Inf"} 4',
+        'connect_seconds_sum{route="ssh"} 5.65',
+        'connect_seconds_count{route="ssh"} 4',
+    ]
+
+
+def test_unlabelled_histogram_and_label_escaping():
+    registry = MetricsRegistry()
+    registry.histogram("latency", "Latency", buckets=(1,)).observe(2)
+    registry.counter("errors_total", "Errors", ["reason"]).labels('bad "quote"').inc()
+    lines = registry.render().splitlines()
+    assert 'latency_bucket{le="1"} 0' in lines
+    assert 'latency_bucket{le="+Inf"} 1' in lines
+    assert "latency_sum 2" in lines and "latency_count 1" in lines
+    assert 'errors_total{reason="bad \\"quote\\""} 1' in lines
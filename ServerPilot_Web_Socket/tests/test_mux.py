@@ -0,0 +1,66 @@
+import asyncio
+
+import pytest
+
+from mux import CHANNEL_HEADER, MuxChannel, decode_frame, encode_frame
+
+
+class FakeStream:
+    def __init__(self, chunks=()):
+        self.chunks = asyncio.Queue()
+        for chunk in chunks:
+            self.chunks.put_nowait(chunk)
+        self.written = []
+
+    async def read(self, size):
+        return await self.chunks.get()
+
+    def write(self, data):
+        self.written.append(data)
+
+
+class FakeProcess:
+    def __init__(self, chunks=()):
+        self.stdout = FakeStream(chunks)
+        self.stdin = FakeStream()
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def test_frame_round_trip():
+    assert decode_frame(encode_frame(7, b"out")) == (7, b"out")
+    with pytest.raises(ValueError):
+        decode_frame(b"\x00")
+
+
+@pytest.mark.asyncio
+async def test_channel_tracks_activity_and_input():
+    channel = MuxChannel(1, FakeProcess(), send_frame=None, window=1024)
+    started = channel.last_activity
+    await asyncio.sleep(0.01)
+    assert channel.write("é") == 2
+    assert channel.input_bytes == 2 and channel.last_activity > started
+    assert channel.process.stdin.written == ["é".encode()]
+
+
+@pytest.mark.asyncio
+async def test_channel_ends_when_output_budget_is_exceeded():
+    frames, exited = [], asyncio.Event()
+
+    async def send_frame(frame):
+        frames.append(frame)
+
+    async def on_exit(channel):
+        exited.set()
+
+    process = FakeProcess([b"a" * 60, b"b" * 60, b"c" * 60])
+    channel = MuxChannel(3, process, send_frame, window=1024, flush_interval=0.001, max_output_bytes=100)
+    channel.start(on_exit)
+    await asyncio.wait_for(exited.wait(), timeout=1)
+
+    assert channel.end_reason == "output_budget"
+    assert b"".join(frame[CHANNEL_HEADER.size:] for frame in frames) == b"a" * 60
+    await channel.close()
+    assert process.closed
@@ -0,0 +1,69 @@
+import asyncio
+
+import pytest
+
+from output_framing import OUTPUT_MODE_BINARY, OUTPUT_MODE_JSON, FrameCoalescer, forward_output, utf8_boundary
+
+
+async def run_forwarder(queue, frames, **kwargs):
+    async def send(frame):
+        frames.append(frame)
+
+    return asyncio.create_task(forward_output(queue, send, **kwargs))
+
+
+def test_utf8_boundary_holds_back_partial_characters():
+    data = "aé€".encode()
+    assert utf8_boundary(data) == len(data)
+    assert utf8_boundary(data[:-1]) == 3
+    assert utf8_boundary(data[:2]) == 1
+
+
+def test_json_frames_never_split_characters():
+    coalescer = FrameCoalescer(OUTPUT_MODE_JSON, max_bytes=4)
+    coalescer.feed("é€".encode())
+    assert [coalescer.take(), coalescer.take(), coalescer.take(final=True)] == ["é", "€", None]
+
+
+@pytest.mark.asyncio
+async def test_remainder_of_a_full_frame_is_flushed_without_more_output():
+    queue, frames = asyncio.Queue(), []
+    task = await run_forwarder(queue, frames, mode=OUTPUT_MODE_BINARY, max_bytes=100, flush_interval=0.01)
+    queue.put_nowait(b"a" * 80)
+    queue.put_nowait(b"b" * 80)
+
+    # The last 60 bytes (e.g. a shell prompt) must not wait for more output or EOF.
+    await asyncio.sleep(0.1)
+    assert [len(frame) for frame in frames] == [100, 60]
+    assert b"".join(frames) == b"a" * 80 + b"b" * 80
+
+    queue.put_nowait(None)
+    await asyncio.wait_for(task, timeout=1)
+
+
+@pytest.mark.asyncio
+async def test_partial_character_waits_for_the_rest():
+    queue, frames = asyncio.Queue(), []
+    task = await run_forwarder(queue, frames, mode=OUTPUT_MODE_BINARY, max_bytes=100, flush_interval=0.01)
+    euro = "€".encode()
+    queue.put_nowait(b"x" + euro[:1])
+    await asyncio.sleep(0.05)
+    assert frames == [b"x"]
+
+    queue.put_nowait(euro[1:])
+    await asyncio.sleep(0.05)
+    assert frames == [b"x", euro]
+
+    queue.put_nowait(None)
+    await asyncio.wait_for(task, timeout=1)
+
+
+@pytest.mark.asyncio
+async def test_output_is_coalesced_and_flushed_on_eof():
+    queue, frames, sizes = asyncio.Queue(), [], []
+    for chunk in (b"ab", b"cd", b"ef", None):
+        queue.put_nowait(chunk)
+    task = await run_forwarder(queue, frames, mode=OUTPUT_MODE_JSON, on_frame=sizes.append)
+    await asyncio.wait_for(task, timeout=1)
+    assert frames == ["abcdef"]
+    assert sizes == [6]
@@ -0,0 +1,65 @@
+from rate_limit import SlidingWindowRateLimiter, client_ip, parse_trusted_proxies
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_sliding_window_rolls_over():
+    clock = FakeClock()
+    limiter = SlidingWindowRateLimiter(2, window=10, clock=clock)
+    assert limiter.hit("a") and limiter.hit("a")
+    assert not limiter.hit("a")
+    # Start of the next window: the previous one still overlaps completely
+    clock.now = 10.0
+    assert not limiter.hit("a")
+    # Half way through, half of the previous window's attempts still count
+    clock.now = 15.0
+    assert limiter.hit("a")
+    assert not limiter.hit("a")
+    # Two windows later nothing is left of the old attempts
+    clock.now = 35.0
+    assert limiter.hit("a") and limiter.hit("a")
+
+
+def test_idle_keys_are_evicted():
+    clock = FakeClock()
+    limiter = SlidingWindowRateLimiter(5, window=10, clock=clock)
+    limiter.hit("a")
+    clock.now = 12.0
+    limiter.hit("b")
+    assert len(limiter) == 2
+    clock.now = 25.0
+    limiter.hit("b")
+    assert len(limiter) == 1
+
+
+def test_max_keys_bound():
+    limiter = SlidingWindowRateLimiter(1, window=10, max_keys=2, clock=FakeClock())
+    assert limiter.hit("a") and limiter.hit("b") and limiter.hit("c")
+    assert len(limiter) == 2
+    # The least recently seen key was dropped, so it starts over
+    assert limiter.hit("a")
+    assert len(limiter) == 2
+
+
+def test_client_ip_walks_forwarded_for_from_the_right():
+    trusted = parse_trusted_proxies("10.0.0.0/8, 192.168.1.1")
+    headers = {"x-forwarded-for": "1.1.1.1, 2.2.2.2, 10.0.0.7", "x-real-ip": "3.3.3.3"}
+    # The client can prepend anything; the first untrusted hop from the right is used
+    assert client_ip("192.168.1.1", headers, trusted) == "2.2.2.2"
+    # Only trusted hops: the leftmost one
+    assert client_ip("10.0.0.1", {"x-forwarded-for": "10.0.0.5, 10.0.0.6"}, trusted) == "10.0.0.5"
+    assert client_ip("10.0.0.1", {"x-real-ip": " 3.3.3.3 "}, trusted) == "3.3.3.3"
+    assert client_ip("10.0.0.1", {}, trusted) == "10.0.0.1"
+
+
+def test_client_ip_ignores_headers_from_untrusted_peers():
+    headers = {"x-forwarded-for": "1.1.1.1", "x-real-ip": "3.3.3.3"}
+    assert client_ip("8.8.8.8", headers, parse_trusted_proxies("10.0.0.0/8")) == "8.8.8.8"
+    assert client_ip("10.0.0.1", headers, []) == "10.0.0.1"
+    assert client_ip(None, headers, parse_trusted_proxies("10.0.0.0/8")) == "unknown"
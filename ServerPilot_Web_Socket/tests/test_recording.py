@@ -0,0 +1,49 @@
+from recording import SessionRecorder, read_events, read_index
+
+
+def write_recording(directory):
+    recorder = SessionRecorder(str(directory), "rec-1", {"owner": "42"}, width=100, height=30, index_interval=10)
+    recorder._write_batch([(0.5, "o", b"hello "), (5.0, "i", b"ls\r"), (12.0, "o", b"\xe2\x82")], 0, False)
+    recorder._write_batch([(12.5, "o", b"\xac done"), (25.0, "o", b"later")], 0, False)
+    recorder._write_batch([(30.0, "o", b"end")], 7, True)
+    return recorder
+
+
+def test_round_trip(tmp_path):
+    write_recording(tmp_path)
+    header, events = read_events(str(tmp_path), "rec-1")
+    assert (header["version"], header["width"], header["height"]) == (2, 100, 30)
+    assert events == [
+        [0.5, "o", "hello "],
+        [5.0, "i", "ls\r"],
+        # A character split across reads is written once it is complete
+        [12.5, "o", "€ done"],
+        [25.0, "o", "later"],
+        [30.0, "m", "recording gap: 7 bytes dropped"],
+        [30.0, "o", "end"],
+    ]
+    meta, _entries = read_index(str(tmp_path / "rec-1.idx"))
+    assert meta["meta"] == {"owner": "42"}
+
+
+def test_seek_through_the_sparse_index(tmp_path):
+    write_recording(tmp_path)
+    _meta, entries = read_index(str(tmp_path / "rec-1.idx"))
+    # A new gzip member starts once index_interval seconds have passed
+    assert [entry["t"] for entry in entries] == [0.0, 12.0, 25.0]
+
+    header, events = read_events(str(tmp_path), "rec-1", start=20, end=30)
+    # The header is still returned although reading started at a later member
+    assert header["width"] == 100
+    assert events == [[25.0, "o", "later"]]
+
+
+def test_writer_falling_behind_drops_bytes(tmp_path):
+    recorder = SessionRecorder(str(tmp_path), "rec-2", {}, max_buffer_bytes=4, flush_bytes=100)
+    recorder.record_output(b"abc")
+    recorder.record_output(b"defg")
+    recorder.record_input("h")
+    events, dropped = recorder._take()
+    assert [(kind, data) for _at, kind, data in events] == [("o", b"abc"), ("i", b"h")]
+    assert dropped == 4
+    assert recorder._take() == ([], 0)
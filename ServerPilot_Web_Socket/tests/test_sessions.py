@@ -0,0 +1,108 @@
+import asyncio
+
+import pytest
+
+from sessions import ScrollbackBuffer, SessionRegistry, WatcherSet
+
+
+class FakeSession:
+    def __init__(self, owner="42", server_id=1, attached=False):
+        self.owner = owner
+        self.server_id = server_id
+        self.attached = attached
+        self.closed = False
+
+    async def close(self):
+        self.closed = True
+
+
+def test_scrollback_keeps_the_tail():
+    buffer = ScrollbackBuffer(8)
+    for chunk in (b"abc", b"defg", b"hijk"):
+        buffer.append(chunk)
+    assert buffer.size == 8 and buffer.snapshot() == b"defghijk"
+
+
+def test_scrollback_snapshot_starts_on_a_character_boundary():
+    buffer = ScrollbackBuffer(4)
+    buffer.append("a€".encode())  # the ring cuts nothing: 4 bytes
+    assert buffer.snapshot() == "a€".encode()
+    buffer.append("é".encode())  # keeps the last 4 bytes: the tail of € and é
+    assert buffer.snapshot() == "é".encode()
+    buffer.append("€€".encode())  # a single chunk longer than the buffer
+    assert buffer.snapshot() == "€".encode()
+
+
+def test_registry_lookup_checks_owner_and_server():
+    registry = SessionRegistry(grace_period=60)
+    token = registry.register(FakeSession(owner="42", server_id=1))
+    assert registry.lookup(token, "42", 1) is not None
+    assert registry.lookup(token, "43", 1) is None
+    assert registry.lookup(token, "42", 2) is None
+    assert registry.lookup("unknown", "42", 1) is None
+    assert registry.lookup(None, "42", 1) is None
+
+
+@pytest.mark.asyncio
+async def test_detached_session_expires_after_the_grace_period():
+    registry = SessionRegistry(grace_period=0.01)
+    session = FakeSession()
+    token = registry.register(session)
+    registry.detach(token)
+    await asyncio.sleep(0.05)
+    assert session.closed and len(registry) == 0
+
+
+@pytest.mark.asyncio
+async def test_reattached_session_survives_the_grace_period():
+    registry = SessionRegistry(grace_period=0.01)
+    session = FakeSession()
+    token = registry.register(session)
+    registry.detach(token)
+    # The client comes back before the grace period ends
+    registry.claim(token)
+    session.attached = True
+    await asyncio.sleep(0.05)
+    assert not session.closed and registry.lookup(token, "42", 1) is session
+
+    # A session that is attached again when its timer fires is kept as well
+    registry.detach(token)
+    await asyncio.sleep(0.05)
+    assert not session.closed
+
+
+@pytest.mark.asyncio
+async def test_share_and_unshare():
+    registry = SessionRegistry(grace_period=60)
+    session = FakeSession(server_id=1)
+    token = registry.register(session)
+    watch_token = registry.share(token)
+    assert registry.share(token) == watch_token
+    assert watch_token != token
+    assert registry.lookup_shared(watch_token, 1) is session
+    assert registry.lookup_shared(watch_token, 2) is None
+    assert registry.lookup_shared(token, 1) is None
+
+    registry.unshare(token)
+    assert registry.lookup_shared(watch_token, 1) is None
+
+    # Closing a session also revokes its watch token
+    watch_token = registry.share(token)
+    await registry.close(token)
+    assert session.closed and registry.lookup_shared(watch_token, 1) is None
+
+
+@pytest.mark.asyncio
+async def test_watcher_overflow_is_resynced_from_the_scrollback():
+    watchers = WatcherSet(max_chunks=2)
+    queue = watchers.add(b"snapshot")
+    assert watchers.publish(b"a", lambda: b"scrollback") == 0
+    # The queue is full: its backlog is replaced by a terminal reset and the scrollback
+    assert watchers.publish(b"b", lambda: b"scrollback") == 1
+    assert queue.qsize() == 1
+    assert queue.get_nowait() == WatcherSet.RESET + b"scrollback"
+
+    assert watchers.publish(b"c", lambda: b"scrollback") == 0
+    watchers.close()
+    assert [queue.get_nowait(), queue.get_nowait()] == [b"c", None]
+    assert len(watchers) == 0
@@ -1,16 +1,27 @@
 # ws_server_hardening.py
 import os
-import time
 import asyncio
 import json
 import logging
-from typing import Optional, Dict, Any
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Depends, HTTPException, status
+import secrets
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Depends, HTTPException, Request, Response, status
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 import asyncssh
 import jwt  # PyJWT
 
+from jwt_cache import VerifiedTokenCache, listen_for_revocations
+from limits_store import ConnectionLease, create_limits_store
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, MetricsRegistry, register_process_metrics
+from mux import MAX_CHANNEL_ID, MuxChannel
+from output_framing import forward_output, frame_sender, negotiate_output_mode
+from rate_limit import client_ip as resolve_client_ip, parse_trusted_proxies
+from recording import SessionRecorder, read_events, read_index, recording_paths
+from server_store import ServerStore, ServerStoreError
+from sessions import ScrollbackBuffer, SessionRegistry, WatcherSet
+
 # ---------- CONFIG ----------
 def _get_env_secret(name: str) -> Optional[str]:
     """Return secret value from env or from a file path specified via NAME_FILE.
@@ -34,9 +45,65 @@ JWT_ALGORITHM = os.environ.get("JWT_ALGORITHM", "HS256")
 ALLOWED_ORIGINS = [o.strip() for o in os.environ.get("ALLOWED_ORIGINS", "*").split(",") if o.strip()]
 JWT_ISSUER = os.environ.get("JWT_ISSUER")
 JWT_AUDIENCE = os.environ.get("JWT_AUDIENCE")
+# Verified tokens are cached (by digest, until their exp) so reconnects skip signature checks
+JWT_CACHE_SIZE = int(os.environ.get("JWT_CACHE_SIZE", "10000"))
+# Redis channel carrying JWT revocations, e.g. {"sub": "42"} or {"jti": "..."} (needs REDIS_URL)
+JWT_REVOCATION_CHANNEL = os.environ.get("JWT_REVOCATION_CHANNEL", "ws_ssh:jwt-revoke")
 MAX_REQS_PER_MINUTE = int(os.environ.get("MAX_REQS_PER_MINUTE", "30"))
+# Upper bound on the number of client IPs tracked by the rate limiter
+RATE_LIMIT_MAX_KEYS = int(os.environ.get("RATE_LIMIT_MAX_KEYS", "100000"))
+# Comma-separated proxy IPs/CIDRs whose X-Forwarded-For / X-Real-IP headers are trusted
+TRUSTED_PROXIES = parse_trusted_proxies(os.environ.get("TRUSTED_PROXIES", ""))
+# Shared store for rate limits and connection counts across workers/replicas; per-process if unset
+REDIS_URL = _get_env_secret("REDIS_URL")
+LIMITS_KEY_PREFIX = os.environ.get("LIMITS_KEY_PREFIX", "ws_ssh:")
+# Refuse new connections while Redis is unreachable instead of falling back to per-process limits
+LIMITS_FAIL_CLOSED = os.environ.get("LIMITS_FAIL_CLOSED", "false").lower() in ("1", "true", "yes")
+# Connection slots expire this long after their worker stops renewing them (e.g. it crashed)
+CONNECTION_LEASE_TTL = int(os.environ.get("CONNECTION_LEASE_TTL", "30"))  # seconds
+# Django API used to resolve server_id to an SSH target; the built-in server_store is used if unset
+SERVER_API_URL = os.environ.get("SERVER_API_URL")
+# Must match WS_PROXY_INTERNAL_TOKEN of the Django API
+SERVER_API_TOKEN = _get_env_secret("SERVER_API_TOKEN")
+SERVER_CACHE_TTL = int(os.environ.get("SERVER_CACHE_TTL", "30"))  # seconds
+# Django publishes server ids on this Redis channel when their SSH target changes
+SERVER_INVALIDATION_CHANNEL = os.environ.get("WS_PROXY_INVALIDATION_CHANNEL", "ws_ssh:ssh-target-invalidate")
+if SERVER_API_URL and not SERVER_API_TOKEN:
+    raise RuntimeError("SERVER_API_TOKEN (or SERVER_API_TOKEN_FILE) must be provided when SERVER_API_URL is set.")
 MAX_CONCURRENT_CONNECTIONS_PER_SERVER = int(os.environ.get("MAX_CONCURRENT_CONNECTIONS_PER_SERVER", "3"))
 WEBSOCKET_PING_INTERVAL = int(os.environ.get("WEBSOCKET_PING_INTERVAL", "20"))  # seconds
+# Terminal output is coalesced into frames of at most this many bytes...
+OUTPUT_FRAME_MAX_BYTES = int(os.environ.get("OUTPUT_FRAME_MAX_BYTES", "32768"))
+# ...flushed at the latest this long after the first pending byte arrived.
+OUTPUT_FLUSH_INTERVAL_MS = int(os.environ.get("OUTPUT_FLUSH_INTERVAL_MS", "10"))
+# Detached terminal sessions are kept this long for the client to reattach (0 disables reattaching)
+SESSION_GRACE_PERIOD = int(os.environ.get("SESSION_GRACE_PERIOD", "60"))  # seconds
+# Recent output replayed to a reattaching client
+SCROLLBACK_BYTES = int(os.environ.get("SCROLLBACK_BYTES", str(256 * 1024)))
+# Sessions are recorded (asciinema v2, gzip) into this directory when set
+RECORDING_DIR = os.environ.get("RECORDING_DIR")
+# Pending recording data per session before events are dropped (see recording.py for the worst-case overhead)
+RECORDING_BUFFER_BYTES = int(os.environ.get("RECORDING_BUFFER_BYTES", str(256 * 1024)))
+# Session time between seek points in a recording
+RECORDING_INDEX_INTERVAL = int(os.environ.get("RECORDING_INDEX_INTERVAL", "10"))  # seconds
+# JWT subjects allowed to play back every recording (owners can always play back their own)
+RECORDING_VIEWERS = {v.strip() for v in os.environ.get("RECORDING_VIEWERS", "").split(",") if v.strip()}
+# Session limits; 0 disables a limit. Idle means no input and no output.
+SESSION_IDLE_TIMEOUT = int(os.environ.get("SESSION_IDLE_TIMEOUT", "1800"))  # seconds
+SESSION_MAX_LIFETIME = int(os.environ.get("SESSION_MAX_LIFETIME", "86400"))  # seconds
+SESSION_MAX_OUTPUT_BYTES = int(os.environ.get("SESSION_MAX_OUTPUT_BYTES", "0"))
+SESSION_MAX_INPUT_BYTES = int(os.environ.get("SESSION_MAX_INPUT_BYTES", "0"))
+# How often the reaper looks for idle and expired sessions
+SESSION_REAPER_INTERVAL = int(os.environ.get("SESSION_REAPER_INTERVAL", "15"))  # seconds
+# Read-only watchers per shared session, and output chunks queued per watcher before it is resynced
+MAX_WATCHERS_PER_SESSION = int(os.environ.get("MAX_WATCHERS_PER_SESSION", "5"))
+WATCHER_QUEUE_CHUNKS = int(os.environ.get("WATCHER_QUEUE_CHUNKS", "64"))
+# Terminals one multiplexed WebSocket may open on its shared SSH connection
+MUX_MAX_CHANNELS = int(os.environ.get("MUX_MAX_CHANNELS", "8"))
+# Unacknowledged output per multiplexed channel before it stops reading from SSH
+MUX_WINDOW_BYTES = int(os.environ.get("MUX_WINDOW_BYTES", str(256 * 1024)))
+# Bearer token required by GET /metrics; open to anyone who can reach the port if unset
+METRICS_TOKEN = _get_env_secret("METRICS_TOKEN")
 
 # ---------- LOGGING ----------
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
@@ -62,8 +129,10 @@ app.add_middleware(
 
 auth_scheme = HTTPBearer(auto_error=False)
 
+jwt_cache = VerifiedTokenCache(max_entries=JWT_CACHE_SIZE)
+
 # ---------- MOCK SECURE STORE ----------
-# Replace this with real vault/db lookup. DO NOT keep secrets in code.
+# Only used when SERVER_API_URL is not set. DO NOT keep secrets in code.
 # The structure:
 # server_store = {
 #   server_id: {
@@ -88,31 +157,97 @@ server_store: Dict[int, Dict[str, Any]] = {
     # Add entries or replace with Vault/DB retrieval
 }
 
-# Track concurrent connections per server_id
-connections_count: Dict[int, int] = {}
-# Simple rate limiter per IP
-rate_limits: Dict[str, list] = {}  # ip -> [timestamps]
+# Servers and credentials from the Django database (see ServerPilot_API/Servers/ssh_targets.py)
+server_api: Optional[ServerStore] = (
+    ServerStore(SERVER_API_URL, SERVER_API_TOKEN, ttl=SERVER_CACHE_TTL) if SERVER_API_URL else None
+)
+
+
+# ---------- METRICS ----------
+# Per-process; series are bound once here so hot-path updates are a plain increment
+metrics = MetricsRegistry()
+register_process_metrics(metrics)
+metrics.gauge(
+    "ws_ssh_sessions_active", "Open SSH sessions (attached or within their grace period)",
+    function=lambda: len(session_registry),
+)
+metrics.gauge(
+    "ws_ssh_sessions_detached", "SSH sessions waiting for their client to reattach",
+    function=lambda: sum(1 for session in session_registry.sessions.values() if not session.attached),
+)
+metrics.gauge(
+    "ws_ssh_output_queued_chunks", "Output chunks waiting to be sent to clients, summed over sessions",
+    function=lambda: sum(session.output_queue.qsize() for session in session_registry.sessions.values() if session.attached),
+)
+websocket_connections_total = metrics.counter("ws_ssh_websocket_connections_total", "Accepted WebSocket connections")
+reattach_total = metrics.counter("ws_ssh_session_reattach_total", "WebSocket connections that reattached to a detached session")
+_rejections = metrics.counter("ws_ssh_rejections_total", "Connections refused, by reason", ["reason"])
+REJECTED = {
+    reason: _rejections.labels(reason)
+    for reason in ("origin", "rate_limit", "auth", "server_lookup", "not_authorized", "concurrency", "missing_params", "ssh_error")
+}
+output_bytes_total = metrics.counter("ws_ssh_output_bytes_total", "Terminal output bytes sent to clients")
+output_frames_total = metrics.counter("ws_ssh_output_frames_total", "Terminal output frames sent to clients")
+input_bytes_total = metrics.counter("ws_ssh_input_bytes_total", "Input bytes written to SSH sessions")
+output_queue_depth = metrics.histogram(
+    "ws_ssh_output_queue_depth", "Chunks already queued for the client when SSH output arrives",
+    buckets=(0, 1, 2, 5, 10, 25, 50, 100, 200),
+)
+output_queue_full_total = metrics.counter(
+    "ws_ssh_output_queue_full_total", "SSH reads that had to wait because the client's output queue was full (slow client)"
+)
+metrics.gauge(
+    "ws_ssh_watchers_active", "Read-only watchers of shared sessions",
+    function=lambda: sum(len(session.watchers) for session in session_registry.sessions.values()),
+)
+# Why sessions were ended by the proxy rather than by the client or the remote shell
+SESSION_END_REASONS = {
+    "idle": "idle timeout",
+    "lifetime": "maximum session lifetime reached",
+    "output_budget": "output limit exceeded",
+    "input_budget": "input limit exceeded",
+    "connection_limit": "connection slot lost",
+}
+_sessions_ended = metrics.counter("ws_ssh_sessions_ended_total", "Sessions closed by the proxy's limits, by reason", ["reason"])
+SESSIONS_ENDED = {reason: _sessions_ended.labels(reason) for reason in SESSION_END_REASONS}
+watcher_resyncs_total = metrics.counter(
+    "ws_ssh_watcher_resyncs_total", "Times a slow watcher's backlog was dropped and replaced by the scrollback"
+)
+mux_channels_active = metrics.gauge("ws_ssh_mux_channels_active", "Terminals open on multiplexed WebSockets")
+ssh_connect_seconds = metrics.histogram("ws_ssh_connect_seconds", "Time to connect and authenticate to the SSH server")
+_limits_store_errors = metrics.counter(
+    "ws_ssh_limits_store_errors_total",
+    "Limit checks Redis could not serve (handled locally or refused, see LIMITS_FAIL_CLOSED), by operation",
+    ["operation"],
+)
+LIMITS_STORE_ERRORS = {operation: _limits_store_errors.labels(operation) for operation in ("hit", "acquire", "renew", "release")}
+
+# Sliding-window rate limit per client IP and leased connection slots per server_id
+limits_store = create_limits_store(
+    REDIS_URL,
+    MAX_REQS_PER_MINUTE,
+    window=60,
+    lease_ttl=CONNECTION_LEASE_TTL,
+    prefix=LIMITS_KEY_PREFIX,
+    max_keys=RATE_LIMIT_MAX_KEYS,
+    fail_closed=LIMITS_FAIL_CLOSED,
+    on_fallback=lambda operation: LIMITS_STORE_ERRORS[operation].inc(),
+)
+
+
+def count_output_frame(size: int):
+    output_frames_total.inc()
+    output_bytes_total.inc(size)
 
 
 # ---------- UTIL ----------
-def check_rate_limit(client_ip: str):
-    now = time.time()
-    window = 60
-    timestamps = rate_limits.setdefault(client_ip, [])
-    # Remove old entries
-    while timestamps and timestamps[0] <= now - window:
-        timestamps.pop(0)
-    if len(timestamps) >= MAX_REQS_PER_MINUTE:
-        return False
-    timestamps.append(now)
-    return True
+async def check_rate_limit(client_ip: str) -> bool:
+    return await limits_store.hit(client_ip)
 
 def get_client_ip(websocket: WebSocket) -> str:
-    # Trusted proxy headers may be needed in production
+    # Forwarded headers are only honoured when the peer is in TRUSTED_PROXIES
     client = websocket.client
-    if client:
-        return f"{client.host}:{client.port}"
-    return "unknown"
+    return resolve_client_ip(client.host if client else None, websocket.headers, TRUSTED_PROXIES)
 
 def get_server_entry(server_id: int) -> Dict[str, Any]:
     entry = server_store.get(server_id)
@@ -120,10 +255,20 @@ def get_server_entry(server_id: int) -> Dict[str, Any]:
         raise KeyError("server_id not found")
     return entry
 
+async def resolve_server_entry(server_id: int, subject: str, token: str) -> Dict[str, Any]:
+    """Return the SSH target of server_id for the user of `token` (raises ServerStoreError or KeyError)."""
+    if server_api is not None:
+        return await server_api.get(server_id, subject, token)
+    return get_server_entry(server_id)
+
 async def verify_jwt(credentials: Optional[HTTPAuthorizationCredentials]) -> Dict[str, Any]:
     if not credentials:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Missing Authorization")
     token = credentials.credentials
+    payload = jwt_cache.get(token)
+    if payload is not None:
+        # Verified before and not expired; revocations purge matching entries
+        return payload
     try:
         decode_kwargs = {
             "key": JWT_SECRET,
@@ -135,12 +280,14 @@ async def verify_jwt(credentials: Optional[HTTPAuthorizationCredentials]) -> Dic
         if JWT_ISSUER:
             decode_kwargs["issuer"] = JWT_ISSUER
         payload = jwt.decode(token, **decode_kwargs)
-        # Minimal checks — extend with exp, aud, iss validation
-        return payload
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token expired")
     except jwt.InvalidTokenError:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
+    if jwt_cache.is_revoked(token, payload):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token revoked")
+    jwt_cache.put(token, payload)
+    return payload
 
 def origin_allowed(websocket: WebSocket) -> bool:
     origin = websocket.headers.get("origin")
@@ -157,12 +304,90 @@ def origin_allowed(websocket: WebSocket) -> bool:
 
 
 # ---------- SSH HELPER ----------
+def session_expiry(started_at: float, last_activity: float, now: float) -> Optional[str]:
+    """Return the reason a terminal started at `started_at` and last active at `last_activity` has to end at `now`."""
+    if SESSION_MAX_LIFETIME and now - started_at > SESSION_MAX_LIFETIME:
+        return "lifetime"
+    if SESSION_IDLE_TIMEOUT and now - last_activity > SESSION_IDLE_TIMEOUT:
+        return "idle"
+    return None
+
+
 class SSHSession:
-    def __init__(self, conn: asyncssh.SSHClientConnection, process: asyncssh.SSHClientProcess):
+    """An interactive shell that can outlive the WebSocket attached to it.
+
+    The receive loop drains stdout into the scrollback buffer and, while a client
+    is attached, into that client's output queue. Read-only watchers get the same
+    output without ever holding up the loop (see sessions.WatcherSet).
+    """
+
+    def __init__(
+        self,
+        conn: asyncssh.SSHClientConnection,
+        process: asyncssh.SSHClientProcess,
+        server_id: int,
+        owner: str,
+        lease: Optional[ConnectionLease] = None,
+        recorder: Optional[SessionRecorder] = None,
+    ):
         self.conn = conn
         self.process = process
+        self.server_id = server_id
+        self.owner = owner
+        self.lease = lease
+        self.recorder = recorder
+        self.token: Optional[str] = None
+        self.scrollback = ScrollbackBuffer(SCROLLBACK_BYTES)
+        self.output_queue: Optional[asyncio.Queue] = None
+        self.watchers = WatcherSet(WATCHER_QUEUE_CHUNKS)
         self.read_task: Optional[asyncio.Task] = None
         self.alive = True
+        # Activity and budgets, checked by the receive loop, send() and reap_sessions()
+        self.started_at = time.monotonic()
+        self.last_activity = self.started_at
+        self.input_bytes = 0
+        self.output_bytes = 0
+        self.end_reason: Optional[str] = None
+
+    @property
+    def attached(self) -> bool:
+        return self.output_queue is not None
+
+    def start(self):
+        self.read_task = asyncio.create_task(self.receive_loop())
+
+    def attach(self) -> asyncio.Queue:
+        """Attach a client: return its output queue, primed with the scrollback. Any previous client is detached."""
+        # Bounded queue to prevent unbounded memory growth under slow clients
+        queue: asyncio.Queue = asyncio.Queue(maxsize=200)
+        snapshot = self.scrollback.snapshot()
+        if snapshot:
+            queue.put_nowait(snapshot)
+        if not self.alive:
+            queue.put_nowait(None)
+        if self.output_queue is not None:
+            self.detach(self.output_queue)
+        self.output_queue = queue
+        return queue
+
+    def watch(self) -> asyncio.Queue:
+        """Add a read-only watcher: return its output queue, primed with the scrollback."""
+        queue = self.watchers.add(self.scrollback.snapshot())
+        if not self.alive:
+            queue.put_nowait(None)
+        return queue
+
+    def detach(self, queue: asyncio.Queue) -> bool:
+        """Detach the client owning `queue`; return False if another client has taken over since."""
+        if self.output_queue is not queue:
+            return False
+        self.output_queue = None
+        # Drop undelivered output (it is in the scrollback) so a blocked put in the receive loop completes,
+        # and end the old writer.
+        while not queue.empty():
+            queue.get_nowait()
+        queue.put_nowait(None)
+        return True
 
     async def send(self, data: str):
         if not self.alive:
@@ -170,17 +395,51 @@ class SSHSession:
         # Do not log full content here
         snippet = data.strip().replace("\n","\\n")
         logger.debug(f"SSH send snippet: {snippet[:200]}")
-        self.process.stdin.write(data)
+        # The process is opened in binary mode (encoding=None)
+        encoded = data.encode("utf-8")
+        self.input_bytes += len(encoded)
+        if SESSION_MAX_INPUT_BYTES and self.input_bytes > SESSION_MAX_INPUT_BYTES:
+            await self.end("input_budget")
+            return
+        self.last_activity = time.monotonic()
+        self.process.stdin.write(encoded)
+        input_bytes_total.inc(len(encoded))
+        if self.recorder is not None:
+            self.recorder.record_input(data)
 
-    async def receive_loop(self, output_queue: asyncio.Queue):
+    async def receive_loop(self):
         try:
             while self.alive:
-                data = await self.process.stdout.read(1024)
+                # Raw bytes; the writer coalesces them and decodes UTF-8 on frame boundaries
+                data = await self.process.stdout.read(OUTPUT_FRAME_MAX_BYTES)
                 if not data:
                     # EOF: remote closed the session
                     logger.info("SSH remote closed stream (EOF)")
                     break
-                await output_queue.put(data)
+                self.last_activity = time.monotonic()
+                self.output_bytes += len(data)
+                if SESSION_MAX_OUTPUT_BYTES and self.output_bytes > SESSION_MAX_OUTPUT_BYTES:
+                    self.end_reason = "output_budget"
+                    SESSIONS_ENDED["output_budget"].inc()
+                    logger.info("Session for server_id=%s exceeded its output limit", self.server_id)
+                    break
+                self.scrollback.append(data)
+                if self.recorder is not None:
+                    self.recorder.record_output(data)
+                if self.watchers:
+                    resynced = self.watchers.publish(data, self.scrollback.snapshot)
+                    if resynced:
+                        watcher_resyncs_total.inc(resynced)
+                queue = self.output_queue
+                if queue is not None:
+                    depth = queue.qsize()
+                    output_queue_depth.observe(depth)
+                    if depth >= queue.maxsize:
+                        output_queue_full_total.inc()
+                    await queue.put(data)
+            # Let the attached writer flush whatever is still pending
+            if self.output_queue is not None:
+                await self.output_queue.put(None)
         except asyncio.CancelledError:
             logger.info("SSH receive loop cancelled")
             raise
@@ -188,13 +447,36 @@ class SSHSession:
             logger.exception("Error in SSH receive loop: %s", e)
         finally:
             self.alive = False
+            self.watchers.close()
+            if self.token and not self.attached:
+                # Nobody will reattach to a finished shell; free the slot now rather than after the grace period
+                asyncio.create_task(session_registry.close(self.token))
+
+    def expiry(self, now: float) -> Optional[str]:
+        """Return the reason this session has to be ended at `now`, if any."""
+        return session_expiry(self.started_at, self.last_activity, now)
+
+    async def end(self, reason: str):
+        """Close the session because of one of its limits; the attached client is told why."""
+        self.end_reason = reason
+        SESSIONS_ENDED[reason].inc()
+        logger.info("Ending session for server_id=%s: %s", self.server_id, SESSION_END_REASONS[reason])
+        await session_registry.close(self.token)
 
     async def close(self):
         self.alive = False
+        self.watchers.close()
+        if self.read_task is not None and not self.read_task.done():
+            self.read_task.cancel()
+        if self.output_queue is not None:
+            # End the attached client's writer; it closes the WebSocket
+            while not self.output_queue.empty():
+                self.output_queue.get_nowait()
+            self.output_queue.put_nowait(None)
         try:
             if not self.process.stdin.at_eof():
                 try:
-                    self.process.stdin.write("\x04")  # send EOF (Ctrl-D)
+                    self.process.stdin.write(b"\x04")  # send EOF (Ctrl-D)
                 except Exception:
                     pass
             self.process.close()
@@ -205,14 +487,284 @@ class SSHSession:
             await self.conn.wait_closed()
         except Exception:
             pass
+        if self.lease is not None:
+            await self.lease.release()
+        if self.recorder is not None:
+            await self.recorder.close()
 
 
-# ---------- WEBSOCKET ENDPOINT ----------
-@app.websocket("/ws/servers/{server_id}/ssh")
-async def websocket_ssh(
+# Terminal sessions by reattach token; detached sessions are closed after the grace period
+session_registry = SessionRegistry(SESSION_GRACE_PERIOD)
+# Open multiplexed terminals, each with the coroutine its WebSocket handler uses to end it for a reason
+mux_channel_registry: Dict[MuxChannel, Callable[[MuxChannel, str], Awaitable[None]]] = {}
+
+
+async def reap_sessions():
+    """Periodically end terminals (single and multiplexed) that are idle or past their maximum lifetime."""
+    while True:
+        await asyncio.sleep(SESSION_REAPER_INTERVAL)
+        now = time.monotonic()
+        for session in list(session_registry.sessions.values()):
+            reason = session.expiry(now)
+            if reason is not None:
+                try:
+                    await session.end(reason)
+                except Exception as e:
+                    logger.exception("Failed to end session for server_id=%s: %s", session.server_id, e)
+        for channel, end_channel in list(mux_channel_registry.items()):
+            reason = session_expiry(channel.started_at, channel.last_activity, now)
+            if reason is not None:
+                try:
+                    await end_channel(channel, reason)
+                except Exception as e:
+                    logger.exception("Failed to end mux channel %s: %s", channel.channel_id, e)
+
+
+async def send_end_reason(websocket: WebSocket, ssh_session: SSHSession):
+    """Tell the client why the proxy ended its session, if it did."""
+    if ssh_session.end_reason is not None:
+        message = f"session closed: {SESSION_END_REASONS[ssh_session.end_reason]}"
+        await websocket.send_json({"type": "status", "message": message})
+
+
+async def connect_ssh(
+    host: str,
+    port: int,
+    username: str,
+    auth_method: str,
+    server_entry: Optional[Dict[str, Any]],
+    password: Optional[str] = None,
+) -> asyncssh.SSHClientConnection:
+    """Open an SSH connection with the key or password of `server_entry` (raises on failure)."""
+    # Build connection kwargs
+    conn_kwargs = dict(host=host, port=port, username=username, known_hosts=None, client_keys=None, password=None)
+    if auth_method == "key":
+        private_key = server_entry.get("private_key")
+        if not private_key:
+            raise RuntimeError("private key missing for key auth")
+        # AsyncSSH expects a path or loaded key object. Use asyncssh.import_private_key
+        key_obj = asyncssh.import_private_key(private_key)
+        conn_kwargs["client_keys"] = [key_obj]
+    elif auth_method == "password":
+        # discouraged; if used, should be kept encrypted in the store
+        conn_kwargs["password"] = password or (server_entry.get("password") if server_entry else None)
+    else:
+        raise RuntimeError("unsupported auth_method")
+
+    # Establish SSH connection
+    connect_started = time.monotonic()
+    conn = await asyncssh.connect(**conn_kwargs)
+    ssh_connect_seconds.observe(time.monotonic() - connect_started)
+    return conn
+
+
+def start_recorder(server_id: int, owner: str, host: str, username: str) -> Optional[SessionRecorder]:
+    """Start recording a new terminal when RECORDING_DIR is set."""
+    if not RECORDING_DIR:
+        return None
+    recording_id = f"{server_id}-{time.strftime('%Y%m%dT%H%M%S', time.gmtime())}-{secrets.token_hex(4)}"
+    recorder = SessionRecorder(
+        RECORDING_DIR,
+        recording_id,
+        meta={"server_id": server_id, "owner": owner, "host": host, "username": username},
+        max_buffer_bytes=RECORDING_BUFFER_BYTES,
+        index_interval=RECORDING_INDEX_INTERVAL,
+    )
+    recorder.start()
+    logger.info("Recording session for server_id=%s as %s", server_id, recording_id)
+    return recorder
+
+
+async def open_ssh_session(
     websocket: WebSocket,
     server_id: int,
+    server_entry: Optional[Dict[str, Any]],
+    jwt_sub: str,
+) -> Optional[SSHSession]:
+    """Open a new SSH shell for an accepted WebSocket, or close the WebSocket and return None."""
+    # Limit concurrent connections per server_id (a lease renewed for as long as the session lives)
+    connection_lease = ConnectionLease(
+        limits_store, f"server:{server_id}", MAX_CONCURRENT_CONNECTIONS_PER_SERVER, CONNECTION_LEASE_TTL / 3
+    )
+    if not await connection_lease.acquire():
+        logger.warning("Too many concurrent connections to server_id %s", server_id)
+        REJECTED["concurrency"].inc()
+        await websocket.send_json({"type": "error", "message": "too many concurrent connections to this server"})
+        await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER)
+        return None
+
+    # Prepare SSH auth (allow override from client initial message)
+    host: Optional[str] = None
+    port: int = 22
+    username: Optional[str] = None
+    auth_method: str = "key"
+    password: Optional[str] = None
+
+    if server_entry is not None:
+        host = server_entry.get("host")
+        port = server_entry.get("port", 22)
+        username = server_entry.get("username")
+        auth_method = server_entry.get("auth_method", "key")
+
+    # Optionally receive initial parameters from client (non-blocking with short timeout).
+    # Not when targets come from the Django API: those sessions start at once and never take secrets from the browser.
+    # Expected JSON: { "host": "...", "port": 22, "username": "...", "password": "..." }
+    if server_api is None:
+        try:
+            init_text = await asyncio.wait_for(websocket.receive_text(), timeout=10)
+            try:
+                init_obj = json.loads(init_text)
+                if isinstance(init_obj, dict) and ("host" in init_obj and "username" in init_obj) and ("password" in init_obj or "private_key" in init_obj):
+                    host = init_obj.get("host", host)
+                    port = int(init_obj.get("port", port))
+                    username = init_obj.get("username", username)
+                    if "password" in init_obj:
+                        password = init_obj.get("password")
+                        auth_method = "password"
+                    elif "private_key" in init_obj:
+                        # Not recommended to send keys over WS; keep for completeness
+                        server_entry = {**(server_entry or {}), "private_key": init_obj.get("private_key"), "auth_method": "key"}
+                        auth_method = "key"
+            except json.JSONDecodeError:
+                # Not an init control message; push into terminal after connection established
+                pass
+        except asyncio.TimeoutError:
+            # No init message provided; proceed with server_store config
+            logger.info("No client init parameters received within 10s; proceeding with server_store configuration")
+        except WebSocketDisconnect:
+            logger.info("Client disconnected before the SSH session was opened")
+            await connection_lease.release()
+            return None
+
+    if not host or not username:
+        logger.warning("Closing WS after accept: missing connection parameters (host or username)")
+        REJECTED["missing_params"].inc()
+        await connection_lease.release()
+        await websocket.send_json({"type": "error", "message": "missing connection parameters"})
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return None
+
+    logger.info("Attempting SSH connect to %s:%s as %s (auth_method=%s)", host, port, username, auth_method)
+
+    try:
+        conn = await connect_ssh(host, port, username, auth_method, server_entry, password)
+        try:
+            # Create an interactive shell (pty)
+            process = await conn.create_process(term_type="xterm", encoding=None)
+        except Exception:
+            conn.close()
+            raise
+    except Exception as e:
+        logger.exception("Failed to open SSH session to server_id=%s: %s", server_id, e)
+        REJECTED["ssh_error"].inc()
+        await connection_lease.release()
+        # Avoid leaking internal errors to client, send sanitized message
+        try:
+            await websocket.send_json({"type": "error", "message": "internal server error"})
+            await websocket.close(code=status.WS_1011_INTERNAL_ERROR)
+        except Exception:
+            pass
+        return None
+
+    recorder = start_recorder(server_id, jwt_sub, host, username)
+    ssh_session = SSHSession(conn, process, server_id, jwt_sub, lease=connection_lease, recorder=recorder)
+    ssh_session.token = session_registry.register(ssh_session)
+    connection_lease.on_lost = lambda: ssh_session.end("connection_limit")
+    ssh_session.start()
+    return ssh_session
+
+
+# ---------- RECORDINGS ----------
+@app.get("/recordings/{recording_id}")
+async def get_recording(
+    recording_id: str,
+    start: float = 0.0,
+    end: Optional[float] = None,
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(auth_scheme),
 ):
+    """Play back a recording: the asciinema header and the events between `start` and `end` seconds."""
+    payload = await verify_jwt(credentials)
+    subject = str(payload.get("sub") or payload.get("user_id") or "")
+    if not RECORDING_DIR:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Recording not found")
+    try:
+        _cast_path, index_path = recording_paths(RECORDING_DIR, recording_id)
+        meta, _entries = await asyncio.to_thread(read_index, index_path)
+    except (ValueError, OSError):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Recording not found")
+    if subject != str(meta["meta"].get("owner")) and subject not in RECORDING_VIEWERS:
+        # Hide existence
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Recording not found")
+    header, events = await asyncio.to_thread(read_events, RECORDING_DIR, recording_id, start, end)
+    return {"header": header, "events": events}
+
+
+# ---------- METRICS ENDPOINT ----------
+@app.get("/metrics")
+async def get_metrics(request: Request):
+    """Prometheus scrape endpoint for this worker."""
+    if METRICS_TOKEN:
+        auth_header = request.headers.get("authorization", "")
+        supplied = auth_header[7:].strip() if auth_header.lower().startswith("bearer ") else ""
+        if not secrets.compare_digest(supplied.encode(), METRICS_TOKEN.encode()):
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid metrics token")
+    return Response(content=metrics.render(), media_type=METRICS_CONTENT_TYPE)
+
+
+# ---------- LIFECYCLE ----------
+_background_tasks = set()
+
+
+@app.on_event("startup")
+async def start_background_tasks():
+    if server_api is not None and REDIS_URL:
+        task = asyncio.create_task(server_api.listen_for_invalidations(REDIS_URL, SERVER_INVALIDATION_CHANNEL))
+        _background_tasks.add(task)
+    if REDIS_URL:
+        _background_tasks.add(asyncio.create_task(listen_for_revocations(jwt_cache, REDIS_URL, JWT_REVOCATION_CHANNEL)))
+    if SESSION_IDLE_TIMEOUT or SESSION_MAX_LIFETIME:
+        _background_tasks.add(asyncio.create_task(reap_sessions()))
+
+
+@app.on_event("shutdown")
+async def stop_background_tasks():
+    for task in _background_tasks:
+        task.cancel()
+    _background_tasks.clear()
+    if server_api is not None:
+        await server_api.close()
+
+
+# ---------- WEBSOCKET ENDPOINTS ----------
+async def ping_loop(websocket: WebSocket):
+    try:
+        while True:
+            await asyncio.sleep(WEBSOCKET_PING_INTERVAL)
+            await websocket.send_json({"type": "ping"})
+    except asyncio.CancelledError:
+        raise
+    except Exception:
+        # If ping fails, this will trigger higher-level cleanup
+        logger.info("Ping to client failed or client not responsive")
+        try:
+            await websocket.close()
+        except Exception:
+            pass
+
+
+async def accept_websocket(
+    websocket: WebSocket,
+    server_id: int,
+    hello: Dict[str, Any],
+    resolve_target: bool = True,
+) -> Optional[Tuple[str, str, Optional[Dict[str, Any]]]]:
+    """Check origin, rate limit and JWT, accept, send `hello` and resolve server_id.
+
+    With `resolve_target=False` (watchers, authorized by their watch token) the SSH
+    target is not looked up, so its credential is neither fetched nor decrypted.
+
+    Returns (JWT subject, client IP, server entry or None), or None once the WebSocket has been closed.
+    """
     # NOTE: Authenticate BEFORE accepting the WebSocket
     client_ip = get_client_ip(websocket)
     logger.info("New websocket connection request: server_id=%s from %s", server_id, client_ip)
@@ -220,33 +772,34 @@ async def websocket_ssh(
     # Validate Origin
     if not origin_allowed(websocket):
         logger.warning("Closing WS before accept due to disallowed Origin: %s", websocket.headers.get("origin"))
+        REJECTED["origin"].inc()
         try:
             await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
         except Exception:
             pass
-        return
+        return None
 
     # Rate limit by IP
-    if not check_rate_limit(client_ip):
+    if not await check_rate_limit(client_ip):
         logger.warning("Closing WS before accept: rate limit exceeded for %s", client_ip)
+        REJECTED["rate_limit"].inc()
         try:
             await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER)
         except Exception:
             pass
-        return
+        return None
 
     # Validate JWT
     try:
         # Build HTTPAuthorizationCredentials manually from header or query param
         # Prefer subprotocol for token: client should send like ['jwt', '<token>']
         token: Optional[str] = None
+        # header format is comma-separated values; expecting something like ['jwt', '<token>']
         subproto_header = websocket.headers.get("sec-websocket-protocol")
-        if subproto_header:
-            # header format is comma-separated values
-            parts = [p.strip() for p in subproto_header.split(",") if p.strip()]
-            # Expecting something like ['jwt', '<token>']
-            if len(parts) >= 2 and parts[0].lower() == "jwt":
-                token = parts[1]
+        subprotocols = [p.strip() for p in subproto_header.split(",") if p.strip()] if subproto_header else []
+        offers_jwt_subprotocol = bool(subprotocols) and subprotocols[0].lower() == "jwt"
+        if offers_jwt_subprotocol and len(subprotocols) >= 2:
+            token = subprotocols[1]
         # Fallbacks: Authorization header, then query string
         auth_header = websocket.headers.get("authorization")
         if auth_header and auth_header.lower().startswith("bearer "):
@@ -262,134 +815,111 @@ async def websocket_ssh(
     except HTTPException as e:
         # Close without accepting to avoid establishing session for unauthenticated clients
         logger.warning("Closing WS before accept due to auth error: %s", e.detail)
+        REJECTED["auth"].inc()
         try:
             # Some clients expect a close frame; send policy violation code
             await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
         except Exception:
             pass
-        return
+        return None
 
-    jwt_sub = payload.get("sub", "unknown")
+    # Django (SimpleJWT) access tokens identify the user with "user_id" rather than "sub"
+    jwt_sub = str(payload.get("sub") or payload.get("user_id") or "unknown")
     logger.info("Authenticated JWT sub=%s for client=%s", mask_secret(str(jwt_sub)), client_ip)
 
     # Try to load server entry, but don't hard-fail yet; client may provide explicit connection params
     server_entry: Optional[Dict[str, Any]] = None
+    server_error: Optional[ServerStoreError] = None
     try:
-        server_entry = get_server_entry(server_id)
+        if resolve_target:
+            server_entry = await resolve_server_entry(server_id, jwt_sub, token)
+    except ServerStoreError as e:
+        server_error = e
     except KeyError:
         logger.warning("server_id not found in store, will wait up to 10s for client-provided params: %s", server_id)
 
     # Accept after successful authentication (and CORS/origin checks if applicable)
     # If client offered 'jwt' subprotocol, select it
-    accept_subprotocol = None
-    subproto_header = websocket.headers.get("sec-websocket-protocol")
-    if subproto_header:
-        parts = [p.strip() for p in subproto_header.split(",") if p.strip()]
-        if parts and parts[0].lower() == "jwt":
-            accept_subprotocol = "jwt"
-    await websocket.accept(subprotocol=accept_subprotocol)
+    await websocket.accept(subprotocol="jwt" if offers_jwt_subprotocol else None)
+    websocket_connections_total.inc()
+
+    await websocket.send_json(hello)
+
+    if server_error is not None:
+        # The Django API answered 403/404 for servers this user may not open
+        logger.warning("Cannot resolve server_id %s for %s: %s", server_id, mask_secret(jwt_sub), server_error)
+        REJECTED["server_lookup"].inc()
+        if server_error.status in (403, 404):
+            await websocket.send_json({"type": "error", "message": "server not found"})
+            await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        elif server_error.status == 409:
+            await websocket.send_json({"type": "error", "message": str(server_error)})
+            await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        else:
+            await websocket.send_json({"type": "error", "message": "server lookup failed"})
+            await websocket.close(code=status.WS_1011_INTERNAL_ERROR)
+        return None
 
     # Authorization: check allowed_clients if present (only applicable when server entry exists)
     if server_entry is not None:
         allowed = server_entry.get("allowed_clients")
         if allowed and jwt_sub not in allowed:
             logger.warning("Client %s not authorized for server %s", jwt_sub, server_id)
+            REJECTED["not_authorized"].inc()
             await websocket.send_json({"type": "error", "message": "not authorized for this server"})
             await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
-            return
-
-    # Limit concurrent connections per server_id
-    cnt = connections_count.get(server_id, 0)
-    if cnt >= MAX_CONCURRENT_CONNECTIONS_PER_SERVER:
-        logger.warning("Too many concurrent connections to server_id %s", server_id)
-        await websocket.send_json({"type": "error", "message": "too many concurrent connections to this server"})
-        await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER)
-        return
-    connections_count[server_id] = cnt + 1
+            return None
 
-    # Prepare SSH auth (allow override from client initial message)
-    host: Optional[str] = None
-    port: int = 22
-    username: Optional[str] = None
-    auth_method: str = "key"
-    password: Optional[str] = None
+    return jwt_sub, client_ip, server_entry
 
-    if server_entry is not None:
-        host = server_entry.get("host")
-        port = server_entry.get("port", 22)
-        username = server_entry.get("username")
-        auth_method = server_entry.get("auth_method", "key")
-
-    # Optionally receive initial parameters from client (non-blocking with short timeout)
-    # Expected JSON: { "host": "...", "port": 22, "username": "...", "password": "..." }
-    try:
-        init_text = await asyncio.wait_for(websocket.receive_text(), timeout=10)
-        try:
-            init_obj = json.loads(init_text)
-            if isinstance(init_obj, dict) and ("host" in init_obj and "username" in init_obj) and ("password" in init_obj or "private_key" in init_obj):
-                host = init_obj.get("host", host)
-                port = int(init_obj.get("port", port))
-                username = init_obj.get("username", username)
-                if "password" in init_obj:
-                    password = init_obj.get("password")
-                    auth_method = "password"
-                elif "private_key" in init_obj:
-                    # Not recommended to send keys over WS; keep for completeness
-                    server_entry = {**(server_entry or {}), "private_key": init_obj.get("private_key"), "auth_method": "key"}
-                    auth_method = "key"
-        except json.JSONDecodeError:
-            # Not an init control message; push into terminal after connection established
-            pass
-    except asyncio.TimeoutError:
-        # No init message provided; proceed with server_store config
-        logger.info("No client init parameters received within 10s; proceeding with server_store configuration")
 
-    if not host or not username:
-        logger.warning("Closing WS after accept: missing connection parameters (host or username)")
-        await websocket.send_json({"type": "error", "message": "missing connection parameters"})
-        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+@app.websocket("/ws/servers/{server_id}/ssh")
+async def websocket_ssh(
+    websocket: WebSocket,
+    server_id: int,
+):
+    # Output framing: clients opt into binary frames with ?output=binary; anything else gets JSON frames
+    output_mode = negotiate_output_mode(websocket.query_params.get("output"))
+    accepted = await accept_websocket(websocket, server_id, {"type": "output_mode", "mode": output_mode})
+    if accepted is None:
         return
+    jwt_sub, client_ip, server_entry = accepted
 
-    logger.info("Attempting SSH connect to %s:%s as %s (auth_method=%s)", host, port, username, auth_method)
+    # Reattach to a detached session if the client presents its token (?session=<token>)
+    resume_token = websocket.query_params.get("session")
+    ssh_session = session_registry.lookup(resume_token, jwt_sub, server_id)
+    if ssh_session is not None:
+        session_registry.claim(ssh_session.token)
+        reattach_total.inc()
+        logger.info("Reattaching %s to detached session for server_id=%s", client_ip, server_id)
+    else:
+        if resume_token:
+            await websocket.send_json({"type": "status", "message": "session expired; starting a new one"})
+        ssh_session = await open_ssh_session(websocket, server_id, server_entry, jwt_sub)
+        if ssh_session is None:
+            return
 
-    ssh_session: Optional[SSHSession] = None
-    # Bounded queue to prevent unbounded memory growth under slow clients
-    output_queue: asyncio.Queue = asyncio.Queue(maxsize=200)
+    output_queue = ssh_session.attach()
+    session_info = {"type": "session", "token": ssh_session.token, "grace_period": SESSION_GRACE_PERIOD}
+    if ssh_session.recorder is not None:
+        session_info["recording"] = ssh_session.recorder.recording_id
+    await websocket.send_json(session_info)
 
     try:
-        # Build connection kwargs
-        conn_kwargs = dict(host=host, port=port, username=username, known_hosts=None, client_keys=None, password=None)
-        if auth_method == "key":
-            private_key = server_entry.get("private_key")
-            if not private_key:
-                raise RuntimeError("private key missing for key auth")
-            # AsyncSSH expects a path or loaded key object. Use asyncssh.import_private_key
-            key_obj = asyncssh.import_private_key(private_key)
-            conn_kwargs["client_keys"] = [key_obj]
-        elif auth_method == "password":
-            # discouraged; if used, should be kept encrypted in the store
-            conn_kwargs["password"] = password or (server_entry.get("password") if server_entry else None)
-        else:
-            raise RuntimeError("unsupported auth_method")
-
-        # Establish SSH connection
-        conn = await asyncssh.connect(**conn_kwargs)
-        # Create an interactive shell (pty)
-        process = await conn.create_process(term_type="xterm")
-        ssh_session = SSHSession(conn, process)
-
-        # Start SSH receive loop
-        recv_task = asyncio.create_task(ssh_session.receive_loop(output_queue))
-
-        # Start websocket writer task: forwards SSH -> websocket
+        # Start websocket writer task: forwards SSH -> websocket in coalesced frames
         async def writer():
             try:
-                while True:
-                    data = await output_queue.get()
-                    if data is None:
-                        break
-                    # Send in small chunks to avoid huge JSON messages
-                    await websocket.send_json({"type": "output", "output": data})
+                await forward_output(
+                    output_queue,
+                    frame_sender(websocket, output_mode),
+                    mode=output_mode,
+                    max_bytes=OUTPUT_FRAME_MAX_BYTES,
+                    flush_interval=OUTPUT_FLUSH_INTERVAL_MS / 1000.0,
+                    on_frame=count_output_frame,
+                )
+                # The shell exited, the proxy ended the session, or another connection took it over
+                await send_end_reason(websocket, ssh_session)
+                await websocket.close()
             except asyncio.CancelledError:
                 logger.debug("writer task cancelled")
                 raise
@@ -399,22 +929,7 @@ async def websocket_ssh(
         writer_task = asyncio.create_task(writer())
 
         # Start ping task to ensure client alive
-        async def ping_loop():
-            try:
-                while True:
-                    await asyncio.sleep(WEBSOCKET_PING_INTERVAL)
-                    await websocket.send_json({"type": "ping"})
-            except asyncio.CancelledError:
-                raise
-            except Exception:
-                # If ping fails, this will trigger higher-level cleanup
-                logger.info("Ping to client failed or client not responsive")
-                try:
-                    await websocket.close()
-                except Exception:
-                    pass
-
-        ping_task = asyncio.create_task(ping_loop())
+        ping_task = asyncio.create_task(ping_loop(websocket))
 
         # Main receive loop: websocket -> ssh
         while True:
@@ -424,9 +939,13 @@ async def websocket_ssh(
                 # make sure server side still healthy but do not close immediately
                 logger.debug("Websocket receive timed out; continuing loop to keep connection")
                 continue
-            except WebSocketDisconnect:
+            except (WebSocketDisconnect, RuntimeError):
+                # RuntimeError: the writer already closed the socket
                 logger.info("Client disconnected")
                 break
+            if not ssh_session.alive:
+                # The shell exited or the proxy ended the session; the writer is closing the socket
+                continue
 
             # allow only short control messages in JSON format or raw input for shell
             try:
@@ -442,6 +961,14 @@ async def websocket_ssh(
                     await ssh_session.send(payload)
                 elif msg_type == "keepalive":
                     await websocket.send_json({"type": "status", "message": "alive"})
+                elif msg_type == "share":
+                    watch_token = session_registry.share(ssh_session.token)
+                    await websocket.send_json({"type": "share", "watch_token": watch_token})
+                elif msg_type == "unshare":
+                    # Revoke the watch token and disconnect current watchers
+                    session_registry.unshare(ssh_session.token)
+                    ssh_session.watchers.close()
+                    await websocket.send_json({"type": "status", "message": "session no longer shared"})
                 else:
                     # unknown control, ignore
                     logger.debug("Unknown msg_type from client: %s", str(msg_type)[:100])
@@ -458,11 +985,6 @@ async def websocket_ssh(
             pass
     finally:
         # Cancel tasks & cleanup
-        try:
-            if 'recv_task' in locals() and not recv_task.done():
-                recv_task.cancel()
-        except Exception:
-            pass
         try:
             if 'writer_task' in locals() and not writer_task.done():
                 writer_task.cancel()
@@ -473,8 +995,296 @@ async def websocket_ssh(
                 ping_task.cancel()
         except Exception:
             pass
-        if ssh_session:
-            await ssh_session.close()
-        # update connection count
-        connections_count[server_id] = max(0, connections_count.get(server_id, 1) - 1)
+        # Keep a live shell for the grace period unless another connection already took it over
+        if ssh_session.detach(output_queue):
+            if ssh_session.alive and SESSION_GRACE_PERIOD > 0:
+                session_registry.detach(ssh_session.token)
+                logger.info("Detached session for server_id=%s; kept for %ss", server_id, SESSION_GRACE_PERIOD)
+            else:
+                await session_registry.close(ssh_session.token)
         logger.info("Closed websocket-ssh session for server_id=%s from %s", server_id, client_ip)
+
+
+@app.websocket("/ws/servers/{server_id}/watch")
+async def websocket_watch(
+    websocket: WebSocket,
+    server_id: int,
+):
+    """Follow a session shared by its owner (?watch=<watch token>), read-only."""
+    output_mode = negotiate_output_mode(websocket.query_params.get("output"))
+    accepted = await accept_websocket(
+        websocket, server_id, {"type": "output_mode", "mode": output_mode}, resolve_target=False
+    )
+    if accepted is None:
+        return
+    jwt_sub, client_ip, _server_entry = accepted
+
+    ssh_session = session_registry.lookup_shared(websocket.query_params.get("watch"), server_id)
+    if ssh_session is None:
+        await websocket.send_json({"type": "error", "message": "shared session not found"})
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    if len(ssh_session.watchers) >= MAX_WATCHERS_PER_SESSION:
+        await websocket.send_json({"type": "error", "message": "too many watchers for this session"})
+        await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER)
+        return
+
+    watch_queue = ssh_session.watch()
+    logger.info("%s (sub=%s) is watching a session on server_id=%s", client_ip, mask_secret(jwt_sub), server_id)
+    await websocket.send_json({"type": "watching", "server_id": server_id})
+
+    async def writer():
+        try:
+            await forward_output(
+                watch_queue,
+                frame_sender(websocket, output_mode),
+                mode=output_mode,
+                max_bytes=OUTPUT_FRAME_MAX_BYTES,
+                flush_interval=OUTPUT_FLUSH_INTERVAL_MS / 1000.0,
+                on_frame=count_output_frame,
+            )
+            # The shell exited, the session was ended, or the owner stopped sharing
+            await send_end_reason(websocket, ssh_session)
+            await websocket.close()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.debug("watch writer stopped: %s", e)
+
+    writer_task = asyncio.create_task(writer())
+    ping_task = asyncio.create_task(ping_loop(websocket))
+    try:
+        # Watchers cannot type into the terminal; only keepalives are answered
+        while True:
+            try:
+                text = await websocket.receive_text()
+            except (WebSocketDisconnect, RuntimeError):
+                break
+            try:
+                obj = json.loads(text)
+            except json.JSONDecodeError:
+                continue
+            if isinstance(obj, dict) and obj.get("type") == "keepalive":
+                await websocket.send_json({"type": "status", "message": "alive"})
+    finally:
+        writer_task.cancel()
+        ping_task.cancel()
+        ssh_session.watchers.remove(watch_queue)
+        logger.info("Watcher %s left session on server_id=%s", client_ip, server_id)
+
+
+@app.websocket("/ws/servers/{server_id}/mux")
+async def websocket_mux(
+    websocket: WebSocket,
+    server_id: int,
+):
+    """Several terminals (channels) on one WebSocket and one SSH connection; see mux.py for the framing."""
+    hello = {"type": "mux", "version": 1, "max_channels": MUX_MAX_CHANNELS, "window": MUX_WINDOW_BYTES}
+    accepted = await accept_websocket(websocket, server_id, hello)
+    if accepted is None:
+        return
+    jwt_sub, client_ip, server_entry = accepted
+
+    # Multiplexed terminals always use the stored target; connection parameters are never taken from the client
+    if server_entry is None or not server_entry.get("host") or not server_entry.get("username"):
+        logger.warning("Closing mux WS: server_id %s has no stored SSH target", server_id)
+        REJECTED["missing_params"].inc()
+        await websocket.send_json({"type": "error", "message": "server not found"})
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    # One connection slot for the WebSocket, however many channels it opens
+    connection_lease = ConnectionLease(
+        limits_store, f"server:{server_id}", MAX_CONCURRENT_CONNECTIONS_PER_SERVER, CONNECTION_LEASE_TTL / 3
+    )
+    if not await connection_lease.acquire():
+        logger.warning("Too many concurrent connections to server_id %s", server_id)
+        REJECTED["concurrency"].inc()
+        await websocket.send_json({"type": "error", "message": "too many concurrent connections to this server"})
+        await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER)
+        return
+
+    host = server_entry["host"]
+    port = server_entry.get("port", 22)
+    username = server_entry["username"]
+    try:
+        conn = await connect_ssh(host, port, username, server_entry.get("auth_method", "key"), server_entry)
+    except Exception as e:
+        logger.exception("Failed to open SSH connection to server_id=%s: %s", server_id, e)
+        REJECTED["ssh_error"].inc()
+        await connection_lease.release()
+        try:
+            await websocket.send_json({"type": "error", "message": "internal server error"})
+            await websocket.close(code=status.WS_1011_INTERNAL_ERROR)
+        except Exception:
+            pass
+        return
+
+    channels: Dict[int, MuxChannel] = {}
+    # When a channel was last open, for ending a WebSocket that keeps no terminal open
+    last_channel_at = time.monotonic()
+
+    async def send_error(message: str, channel_id: Optional[int] = None):
+        error = {"type": "error", "message": message}
+        if channel_id is not None:
+            error["channel"] = channel_id
+        await websocket.send_json(error)
+
+    async def close_channel(channel: MuxChannel):
+        nonlocal last_channel_at
+        if channels.get(channel.channel_id) is not channel:
+            return
+        del channels[channel.channel_id]
+        mux_channel_registry.pop(channel, None)
+        last_channel_at = time.monotonic()
+        mux_channels_active.dec()
+        await channel.close()
+        closed = {"type": "closed", "channel": channel.channel_id}
+        if channel.end_reason is not None:
+            SESSIONS_ENDED[channel.end_reason].inc()
+            logger.info(
+                "Ending mux channel %s on server_id=%s: %s",
+                channel.channel_id, server_id, SESSION_END_REASONS[channel.end_reason],
+            )
+            closed["message"] = f"session closed: {SESSION_END_REASONS[channel.end_reason]}"
+        try:
+            await websocket.send_json(closed)
+        except Exception:
+            pass
+
+    async def end_channel(channel: MuxChannel, reason: str):
+        """Close a channel because of one of its limits; the client is told why."""
+        channel.end_reason = reason
+        await close_channel(channel)
+
+    async def open_channel(channel_id: int, cols: int, rows: int) -> MuxChannel:
+        process = await conn.create_process(term_type="xterm", term_size=(cols, rows), encoding=None)
+        channel = MuxChannel(
+            channel_id,
+            process,
+            websocket.send_bytes,
+            MUX_WINDOW_BYTES,
+            max_frame_bytes=OUTPUT_FRAME_MAX_BYTES,
+            flush_interval=OUTPUT_FLUSH_INTERVAL_MS / 1000.0,
+            on_frame=count_output_frame,
+            recorder=start_recorder(server_id, jwt_sub, host, username),
+            max_output_bytes=SESSION_MAX_OUTPUT_BYTES,
+        )
+        channels[channel_id] = channel
+        mux_channel_registry[channel] = end_channel
+        mux_channels_active.inc()
+        # A shell that exits closes its channel
+        channel.start(close_channel)
+        return channel
+
+    def terminal_size(obj: Dict[str, Any]):
+        cols, rows = obj.get("cols", 80), obj.get("rows", 24)
+        if not (isinstance(cols, int) and isinstance(rows, int) and 0 < cols <= 1000 and 0 < rows <= 1000):
+            return None
+        return cols, rows
+
+    async def end_session(reason: str):
+        """Close the WebSocket and all of its channels because of one of its limits."""
+        SESSIONS_ENDED[reason].inc()
+        logger.info("Ending mux session on server_id=%s: %s", server_id, SESSION_END_REASONS[reason])
+        try:
+            await websocket.send_json({"type": "status", "message": f"session closed: {SESSION_END_REASONS[reason]}"})
+            await websocket.close()
+        except Exception:
+            pass
+
+    connection_lease.on_lost = lambda: end_session("connection_limit")
+    await websocket.send_json({"type": "ready"})
+    ping_task = asyncio.create_task(ping_loop(websocket))
+    try:
+        while True:
+            # The WebSocket keeps its connection slot without any channel open; treat that as idle too
+            if not channels and SESSION_IDLE_TIMEOUT and time.monotonic() - last_channel_at > SESSION_IDLE_TIMEOUT:
+                await end_session("idle")
+                break
+            try:
+                text = await asyncio.wait_for(websocket.receive_text(), timeout=WEBSOCKET_PING_INTERVAL * 3)
+            except asyncio.TimeoutError:
+                continue
+            except (WebSocketDisconnect, RuntimeError):
+                logger.info("Client disconnected")
+                break
+
+            try:
+                obj = json.loads(text)
+            except json.JSONDecodeError:
+                await send_error("expected a JSON control message")
+                continue
+            if not isinstance(obj, dict):
+                continue
+            msg_type = obj.get("type")
+            if msg_type == "keepalive":
+                await websocket.send_json({"type": "status", "message": "alive"})
+                continue
+
+            channel_id = obj.get("channel")
+            if not isinstance(channel_id, int) or not 0 <= channel_id <= MAX_CHANNEL_ID:
+                await send_error("invalid channel")
+                continue
+            channel = channels.get(channel_id)
+
+            if msg_type == "open":
+                size = terminal_size(obj)
+                if channel is not None:
+                    await send_error("channel already open", channel_id)
+                elif len(channels) >= MUX_MAX_CHANNELS:
+                    await send_error("too many channels", channel_id)
+                elif size is None:
+                    await send_error("invalid terminal size", channel_id)
+                else:
+                    try:
+                        channel = await open_channel(channel_id, *size)
+                    except Exception as e:
+                        logger.exception("Failed to open mux channel %s to server_id=%s: %s", channel_id, server_id, e)
+                        await send_error("could not open terminal", channel_id)
+                        continue
+                    opened = {"type": "opened", "channel": channel_id}
+                    if channel.recorder is not None:
+                        opened["recording"] = channel.recorder.recording_id
+                    await websocket.send_json(opened)
+            elif channel is None:
+                await send_error("unknown channel", channel_id)
+            elif msg_type == "input":
+                data = obj.get("data", "")
+                if not isinstance(data, str) or len(data) > 10000:
+                    await send_error("input too long", channel_id)
+                    continue
+                if SESSION_MAX_INPUT_BYTES and channel.input_bytes + len(data.encode("utf-8")) > SESSION_MAX_INPUT_BYTES:
+                    await end_channel(channel, "input_budget")
+                    continue
+                input_bytes_total.inc(channel.write(data))
+            elif msg_type == "ack":
+                size = obj.get("bytes")
+                if isinstance(size, int) and size > 0:
+                    channel.ack(size)
+            elif msg_type == "resize":
+                size = terminal_size(obj)
+                if size is None:
+                    await send_error("invalid terminal size", channel_id)
+                else:
+                    channel.resize(*size)
+            elif msg_type == "close":
+                await close_channel(channel)
+            else:
+                logger.debug("Unknown mux msg_type from client: %s", str(msg_type)[:100])
+    except Exception as e:
+        logger.exception("Unexpected error in websocket mux handler: %s", e)
+    finally:
+        ping_task.cancel()
+        for channel in list(channels.values()):
+            mux_channel_registry.pop(channel, None)
+            await channel.close()
+        mux_channels_active.dec(len(channels))
+        channels.clear()
+        try:
+            conn.close()
+            await conn.wait_closed()
+        except Exception:
+            pass
+        await connection_lease.release()
+        logger.info("Closed websocket-mux session for server_id=%s from %s", server_id, client_ip)
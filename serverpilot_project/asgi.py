@@ -11,13 +11,16 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'serverpilot_project.settings')
 django_asgi_app = get_asgi_application()
 
 import ServerPilot_API.Servers.routing # Import the routing
+from ServerPilot_API.Servers.ssh_terminal.auth import JwtAuthMiddleware
 
 application = ProtocolTypeRouter({
     "http": django_asgi_app,
     "websocket": AllowedHostsOriginValidator(
         AuthMiddlewareStack(
-            URLRouter(
-                ServerPilot_API.Servers.routing.websocket_urlpatterns
+            JwtAuthMiddleware(
+                URLRouter(
+                    ServerPilot_API.Servers.routing.websocket_urlpatterns
+                )
             )
         )
     ),
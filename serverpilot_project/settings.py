@@ -357,6 +357,38 @@ CSRF_USE_SESSIONS = False
 CSRF_HEADER_NAME = 'HTTP_X_CSRFTOKEN'
 
 
+# Security scans
+# ------------------------------------------------------------------------------
+# Store passed checks as a per-scan bitmap instead of one "Check Passed" row per risk.
+SECURITY_SCAN_PASSED_BITMAP = os.getenv('SECURITY_SCAN_PASSED_BITMAP', 'True') == 'True'
+
+# Firewall policies
+# ------------------------------------------------------------------------------
+# Maximum number of servers a firewall policy rollout configures at the same time.
+FIREWALL_ROLLOUT_CONCURRENCY = int(os.getenv('FIREWALL_ROLLOUT_CONCURRENCY', '20'))
+# Seconds after which a server still 'running' in a rollout is marked as failed.
+FIREWALL_ROLLOUT_TARGET_TIMEOUT = int(os.getenv('FIREWALL_ROLLOUT_TARGET_TIMEOUT', '900'))
+
+# WebSocket SSH proxy
+# ------------------------------------------------------------------------------
+# Shared secret the proxy sends in X-Internal-Token to resolve SSH targets; the
+# internal endpoint is disabled while it is empty.
+WS_PROXY_INTERNAL_TOKEN = os.getenv('WS_PROXY_INTERNAL_TOKEN', '')
+# Redis pub/sub channel on which server ids are published when their SSH target changes.
+WS_PROXY_INVALIDATION_CHANNEL = os.getenv('WS_PROXY_INVALIDATION_CHANNEL', 'ws_ssh:ssh-target-invalidate')
+
+# In-process SSH terminals (ws/servers/<id>/ssh/)
+# ------------------------------------------------------------------------------
+# Seconds an SSH connection is kept open after its last terminal closed.
+SSH_TERMINAL_IDLE_TIMEOUT = int(os.getenv('SSH_TERMINAL_IDLE_TIMEOUT', '300'))
+# Terminals sharing one SSH connection; keep below the servers' sshd MaxSessions (10).
+SSH_TERMINAL_MAX_SESSIONS_PER_CONNECTION = int(os.getenv('SSH_TERMINAL_MAX_SESSIONS_PER_CONNECTION', '8'))
+# Seconds a resolved SSH target (decrypted credential included) is cached.
+SSH_TERMINAL_CREDENTIAL_TTL = int(os.getenv('SSH_TERMINAL_CREDENTIAL_TTL', '60'))
+# SSH keepalive interval of pooled connections, in seconds.
+SSH_TERMINAL_KEEPALIVE_INTERVAL = int(os.getenv('SSH_TERMINAL_KEEPALIVE_INTERVAL', '30'))
+
+
 # Celery Configuration
 # ------------------------------------------------------------------------------
 CELERY_BROKER_URL = f"redis://{REDIS_HOST}:{REDIS_PORT}/0"